@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from tigo_ingest.decoder import _BACKEND_CLASSES  # noqa: E402
+from tigo_ingest.taptap_reader import parse_power_report, parse_taptap_event  # noqa: E402
+
+
+def sample_lines(n: int, seed: int = 1) -> list[bytes]:
+    rnd = random.Random(seed)
+    out: list[bytes] = []
+    for i in range(n):
+        payload = {
+            "timestamp": f"2026-06-01T12:{(i // 60) % 60:02d}:{i % 60:02d}.{rnd.randrange(10**6):06d}+02:00",
+            "gateway": {"id": 1, "address": [4, 192, 75, 17, 0, 0, 1, 2]},
+            "node": {"id": i % 60 + 1, "address": [4, 192, 91, 0, 0, 0, i % 60, 1], "barcode": f"4-{i % 60:06X}P"},
+            "voltage_in": round(rnd.uniform(20, 45), 2),
+            "voltage_out": round(rnd.uniform(20, 45), 2),
+            "current": round(rnd.uniform(0, 10), 3),
+            "dc_dc_duty_cycle": round(rnd.random(), 3),
+            "temperature": round(rnd.uniform(10, 60), 1),
+            "rssi": rnd.randrange(-90, -30),
+        }
+        # Mix Format A (envelope) and Format B (bare).
+        obj = {"power_report": payload} if i % 2 else payload
+        out.append(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+    return out
+
+
+def legacy_decode(raw: bytes):
+    event_type, payload = parse_taptap_event(raw.decode(errors="replace").strip())
+    if event_type != "power_report":
+        return None
+    return parse_power_report(payload)
+
+
+def bench(fn, lines: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for raw in lines:
+            fn(raw)
+        best = min(best, time.perf_counter() - t0)
+    return len(lines) / best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Micro-benchmark: taptap line -> PowerReport decoding (events/s).")
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    lines = sample_lines(args.events)
+    base = bench(legacy_decode, lines, args.repeat)
+    print(f"{'legacy (parse_taptap_event + parse_power_report)':<50} {base:>12,.0f} events/s")
+    for name, cls in _BACKEND_CLASSES.items():
+        try:
+            dec = cls()
+        except ImportError:
+            print(f"{'decoder ' + name:<50} {'not installed':>12}")
+            continue
+        rate = bench(dec.decode, lines, args.repeat)
+        print(f"{'decoder ' + name:<50} {rate:>12,.0f} events/s  x{rate / base:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Synthetic taptap event stream (stand-in for TAPTAP_CMD in benchmarks).
+
+Emits power_report lines for N gateways x M nodes on stdout, Format A
+(`{"power_report": {...}}`), Format B (bare object) or a mix, plus an
+occasional non-power_report event. Timestamps are the emission wall time, so
+a receiver can measure end-to-end latency from the point timestamp.
+
+    TAPTAP_CMD="python scripts/bench_gen.py --gateways 2 --nodes 40 --rate 500 --duration 30"
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def _ts(ns: int) -> str:
+    dt = datetime.fromtimestamp(ns // 1_000_000_000, tz=timezone.utc)
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{ns % 1_000_000_000:09d}+00:00"
+
+
+def _report(rnd: random.Random, gw: int, node: int, ns: int) -> dict:
+    vin = rnd.uniform(28.0, 42.0)
+    return {
+        "timestamp": _ts(ns),
+        "gateway": {"id": gw, "address": [4, 192, 75, 17, 0, 0, 0, gw]},
+        "node": {"id": node, "address": [4, 192, 91, 0, 0, gw, node // 256, node % 256], "barcode": f"4-{gw:02X}{node:04X}P"},
+        "voltage_in": round(vin, 2),
+        "voltage_out": round(vin * rnd.uniform(0.95, 1.0), 2),
+        "current": round(rnd.uniform(0.0, 10.0), 3),
+        "dc_dc_duty_cycle": round(rnd.uniform(0.8, 1.0), 3),
+        "temperature": round(rnd.uniform(15.0, 55.0), 1),
+        "rssi": rnd.randrange(-90, -40),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Synthetic taptap power_report generator (JSON lines on stdout).")
+    ap.add_argument("--gateways", type=int, default=1)
+    ap.add_argument("--nodes", type=int, default=20, help="nodes per gateway")
+    ap.add_argument("--rate", type=float, default=0.0, help="events/s over all nodes (0 = as fast as possible)")
+    ap.add_argument("--count", type=int, default=0, help="stop after this many power reports (0 = use --duration)")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds to run when --count is 0")
+    ap.add_argument("--format", choices=("a", "b", "mix"), default="mix", help="A = envelope, B = bare object")
+    ap.add_argument("--other-every", type=int, default=50, help="emit a non-power_report event every N reports (0 = never)")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    out = sys.stdout
+    series = [(gw, node) for gw in range(1, args.gateways + 1) for node in range(1, args.nodes + 1)]
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    start = time.monotonic()
+    deadline = start + args.duration
+    i = 0
+    try:
+        while True:
+            if args.count:
+                if i >= args.count:
+                    break
+            elif time.monotonic() >= deadline:
+                break
+            if interval:
+                delay = start + i * interval - time.monotonic()
+                if delay > 0:
+                    # Flush before sleeping so paced events are not held in the stdio buffer.
+                    out.flush()
+                    time.sleep(delay)
+            gw, node = series[i % len(series)]
+            payload = _report(rnd, gw, node, time.time_ns())
+            fmt = args.format if args.format != "mix" else ("a" if i % 2 else "b")
+            obj = {"power_report": payload} if fmt == "a" else payload
+            out.write(json.dumps(obj, separators=(",", ":")) + "\n")
+            if args.other_every and i % args.other_every == 0:
+                out.write(json.dumps({"infrastructure_report": {"gateways": {str(gw): {}}}}) + "\n")
+            i += 1
+        out.flush()
+    except BrokenPipeError:
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
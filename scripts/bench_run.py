@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Throughput/latency benchmark runner.
+
+Stages (each in a fresh process, so CPU time and peak RSS are per stage):
+
+* `decode`   raw taptap line -> PowerReport (TIGO_JSON_BACKEND)
+* `encode`   PowerReport -> line protocol
+* `write`    InfluxWriter -> fake Influx (HTTP, gzip, pool); bytes per point
+             raw and on the wire, plus the fake server's indexing time;
+             failed requests (`--error-rate`) are retried and counted
+* `write`/`encode` use the configured schema and wire format, so
+  `--env TIGO_WIRE_COMPACT=1 --compare <plain.json>` shows what compact mode saves
+* `e2e`      `python -m tigo_ingest` with `bench_gen.py` as TAPTAP_CMD against
+             the fake Influx; latency = point arrival minus event timestamp
+
+Results are printed and stored as JSON (`bench_results/<utc>.json` by default)
+so runs can be compared with `--compare <old.json>`.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent
+ROOT = SCRIPTS.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(SCRIPTS))
+
+from bench_gen import _report  # noqa: E402
+from fake_influx import FakeInflux  # noqa: E402
+
+STAGES = ("decode", "encode", "write", "e2e")
+# Attempts per batch in the write stage before it counts as lost.
+_WRITE_ATTEMPTS = 5
+
+
+def _lines(args, n: int) -> list[bytes]:
+    rnd = random.Random(args.seed)
+    series = [(gw, node) for gw in range(1, args.gateways + 1) for node in range(1, args.nodes + 1)]
+    t0 = time.time_ns()
+    out = []
+    for i in range(n):
+        gw, node = series[i % len(series)]
+        p = _report(rnd, gw, node, t0 + i * 1_000_000)
+        out.append(json.dumps({"power_report": p} if i % 2 else p, separators=(",", ":")).encode())
+    return out
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+
+def _measure(fn, events: int) -> dict:
+    """Run `fn()` once; a dict it returns is merged into the result."""
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    extra = fn()
+    if not isinstance(extra, dict):
+        extra = {}
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    return {
+        "events": events,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "events_per_s": round(events / wall, 1) if wall else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        **extra,
+    }
+
+
+def _stage_child(stage: str, args) -> dict:
+    from tigo_ingest.decoder import make_decoder
+    from tigo_ingest.influx import (
+        InfluxConfig,
+        InfluxWriter,
+        PowerReportEncoder,
+        WireConfig,
+        is_permanent_error,
+        sort_lines,
+    )
+    from tigo_ingest.schema import SchemaConfig, apply_wire, load_schema
+
+    raw = _lines(args, args.events)
+    decoder = make_decoder()
+    if stage == "decode":
+        def _decode():
+            for r in raw:
+                decoder.decode(r)
+            return {"backend": decoder.name}
+
+        return _measure(_decode, len(raw))
+
+    reports = [decoder.decode(r) for r in raw]
+    wire = WireConfig.from_env()
+    schema = apply_wire(load_schema(SchemaConfig.from_env().path), wire.fields, wire.round)
+    enc = PowerReportEncoder("tigo_power_report", schema=schema, precision=wire.precision)
+    if stage == "encode":
+        def _encode():
+            n = 0
+            for pr in reports:
+                n += len(enc.encode(pr)) + 1
+            return {"bytes_per_point": round(n / len(reports), 1)}
+
+        return _measure(_encode, len(reports))
+
+    if stage == "write":
+        lines = [enc.encode(pr) for pr in reports]
+        os.environ["INFLUX_URL"] = args.influx_url
+        writer = InfluxWriter(InfluxConfig.from_env())
+        lat: list[float] = []
+
+        failed = retries = lost = 0
+
+        def _write():
+            nonlocal failed, retries, lost
+            for i in range(0, len(lines), args.batch):
+                batch = lines[i : i + args.batch]
+                if wire.sort:
+                    sort_lines(batch)
+                # Like the daemon: transient errors (--error-rate) are retried, a 4xx drops the batch.
+                for attempt in range(_WRITE_ATTEMPTS):
+                    t = time.perf_counter()
+                    try:
+                        writer.write_lines(batch)
+                    except Exception as e:
+                        failed += 1
+                        if is_permanent_error(e) or attempt + 1 == _WRITE_ATTEMPTS:
+                            lost += len(batch)
+                            break
+                        retries += 1
+                        continue
+                    lat.append(time.perf_counter() - t)
+                    break
+            return {
+                "requests": len(lat),
+                "failed_requests": failed,
+                "retries": retries,
+                "lost_points": lost,
+                "request_p50_ms": round(_percentile(lat, 0.5) * 1000, 3),
+                "request_p99_ms": round(_percentile(lat, 0.99) * 1000, 3),
+            }
+
+        try:
+            return _measure(_write, len(lines))
+        finally:
+            writer.close()
+    raise ValueError(stage)
+
+
+def _run_child(stage: str, args, influx_url: str) -> dict:
+    cmd = [
+        sys.executable,
+        __file__,
+        "--_stage",
+        stage,
+        "--events",
+        str(args.events),
+        "--gateways",
+        str(args.gateways),
+        "--nodes",
+        str(args.nodes),
+        "--batch",
+        str(args.batch),
+        "--seed",
+        str(args.seed),
+        "--influx-url",
+        influx_url,
+    ]
+    p = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True, env=_env(args))
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+
+def _server_stats(st: dict) -> dict:
+    # What arrived at the fake Influx: payload size per point and its indexing work.
+    n = st["points"]
+    return {
+        "bytes_per_point": round(st["bytes_raw"] / n, 1) if n else None,
+        "wire_bytes_per_point": round(st["bytes_wire"] / n, 1) if n else None,
+        "server_ms": round(st["server_s"] * 1000, 3),
+        "series_runs": st["series_runs"],
+        "out_of_order": st["out_of_order"],
+    }
+
+
+def _env(args, **extra: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    for kv in args.env:
+        k, _, v = kv.partition("=")
+        env[k] = v
+    env.update(extra)
+    return env
+
+
+def _e2e(args, srv: FakeInflux) -> dict:
+    gen = [
+        sys.executable,
+        str(SCRIPTS / "bench_gen.py"),
+        "--gateways",
+        str(args.gateways),
+        "--nodes",
+        str(args.nodes),
+        "--rate",
+        str(args.rate),
+        "--count",
+        str(args.events),
+        "--seed",
+        str(args.seed),
+    ]
+    srv.state.reset()
+    with tempfile.TemporaryDirectory(prefix="tigo-bench-") as tmp:
+        env = _env(
+            args,
+            TAPTAP_CMD=subprocess.list2cmdline(gen),
+            # The generator exits after --count events; the daemon must finish with it, not replay it.
+            TIGO_SOURCE_RESTART="never",
+            INFLUX_URL=srv.url,
+            TIGO_SPOOL_DIR=os.environ.get("TIGO_SPOOL_DIR", str(Path(tmp) / "spool")),
+            TIGO_SPOOL_DRAIN_TIMEOUT_S="120",
+            TIGO_STATS_INTERVAL_S="0",
+            TIGO_ROLLUPS=os.environ.get("TIGO_ROLLUPS", ""),
+        )
+        t0 = time.time_ns()
+        p = subprocess.Popen([sys.executable, "-m", "tigo_ingest"], cwd=tmp, env=env, stdout=subprocess.DEVNULL)
+        _, status, ru = os.wait4(p.pid, 0)
+        p.returncode = os.waitstatus_to_exitcode(status)
+        wall_s = (time.time_ns() - t0) / 1e9
+    st = srv.state.snapshot()
+    lat_ms = [v / 1e6 for v in st["latencies_ns"]]
+    span_s = (st["last_ns"] - t0) / 1e9 if st["last_ns"] else wall_s
+    return {
+        "exit_code": p.returncode,
+        "events": args.events,
+        "rate": args.rate,
+        "points_received": st["points"],
+        "requests": st["requests"],
+        "injected_errors": st["errors"],
+        "bytes_wire": st["bytes_wire"],
+        **_server_stats(st),
+        "wall_s": round(wall_s, 3),
+        "events_per_s": round(st["points"] / span_s, 1) if span_s else None,
+        "latency_p50_ms": round(_percentile(lat_ms, 0.5), 2) if lat_ms else None,
+        "latency_p99_ms": round(_percentile(lat_ms, 0.99), 2) if lat_ms else None,
+        "latency_mean_ms": round(statistics.fmean(lat_ms), 2) if lat_ms else None,
+        # Ingest process only (the generator runs as its child and is not included).
+        "cpu_s": round(ru.ru_utime + ru.ru_stime, 3),
+        "peak_rss_kb": ru.ru_maxrss,
+    }
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(d: dict, prefix: str = "") -> dict[str, float]:
+    out: dict[str, float] = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def _print(result: dict, baseline: dict | None) -> None:
+    cur = _flatten(result["stages"])
+    old = _flatten(baseline["stages"]) if baseline else {}
+    for k, v in cur.items():
+        line = f"{k:<40} {v:>14,.3f}" if isinstance(v, float) else f"{k:<40} {v:>14,d}"
+        if k in old and old[k]:
+            line += f"   x{v / old[k]:.2f} vs {baseline.get('git') or 'baseline'}"
+        print(line)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="tigo-ingest throughput/latency benchmarks (JSON results).")
+    ap.add_argument("--stages", default=",".join(STAGES), help=f"comma separated subset of {','.join(STAGES)}")
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--gateways", type=int, default=2)
+    ap.add_argument("--nodes", type=int, default=40, help="nodes per gateway")
+    ap.add_argument("--rate", type=float, default=0.0, help="e2e generator rate in events/s (0 = as fast as possible)")
+    ap.add_argument("--batch", type=int, default=250, help="batch size for the encode/write stages")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="fake Influx latency per write")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake Influx writes answered with 503")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra env for the measured processes")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=str(ROOT / "bench_results"), help="directory for the JSON result ('' = do not store)")
+    ap.add_argument("--label", default="", help="free text stored with the result")
+    ap.add_argument("--compare", help="previous result JSON to compare against")
+    ap.add_argument("--_stage", help=argparse.SUPPRESS)
+    ap.add_argument("--influx-url", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args._stage:
+        print(json.dumps(_stage_child(args._stage, args)))
+        return 0
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    for s in stages:
+        if s not in STAGES:
+            ap.error(f"unknown stage {s!r}")
+
+    measurement = os.environ.get("INFLUX_MEASUREMENT", "tigo_power_report")
+    result: dict = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_rev(),
+        "label": args.label,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {k: v for k, v in vars(args).items() if not k.startswith("_") and k not in ("out", "compare", "influx_url")},
+        "stages": {},
+    }
+    with FakeInflux(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        latency_prefix=f"{measurement},".encode(),
+    ) as srv:
+        for s in stages:
+            print(f"running {s} ...", file=sys.stderr, flush=True)
+            srv.state.reset()
+            result["stages"][s] = _e2e(args, srv) if s == "e2e" else _run_child(s, args, srv.url)
+            if s == "write":
+                result["stages"][s]["server"] = _server_stats(srv.state.snapshot())
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    _print(result, baseline)
+    if args.out:
+        out = Path(args.out)
+        out.mkdir(parents=True, exist_ok=True)
+        path = out / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json"
+        path.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"stored {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Local fake InfluxDB 1.x `/write` endpoint for benchmarks.
+
+Accepts (optionally gzip'ed) line protocol, injects latency and errors, and
+keeps counters plus end-to-end latency samples (receive time minus the point
+timestamp, scaled by the `precision` of the write). Each body is also indexed
+like a TSM cache would (points appended per series key); the time this takes
+is reported as `server_s`, together with how often consecutive lines switch
+series (`series_runs`) and how many points arrive older than their series'
+last one (`out_of_order`). `GET /stats` returns them as JSON, `POST /reset`
+clears them. Also usable in-process via `FakeInflux`.
+
+    python scripts/fake_influx.py --port 18086 --latency-ms 20 --error-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# /write precision -> nanoseconds per unit (1.x spells microseconds `u`).
+_PRECISION_NS = {"ns": 1, "n": 1, "us": 1_000, "u": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+
+
+class FakeInfluxState:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        latency_prefix: bytes = b"",
+        seed: int = 1,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Only lines starting with this prefix count for latency (rollup points carry window start times).
+        self.latency_prefix = latency_prefix
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.points = 0
+            self.bytes_wire = 0
+            self.bytes_raw = 0
+            self.latencies_ns: list[int] = []
+            self.first_ns = 0
+            self.last_ns = 0
+            self.server_s = 0.0
+            self.series_runs = 0
+            self.out_of_order = 0
+            self._cache: dict[bytes, int] = {}
+
+    def decide(self) -> tuple[float, bool]:
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._rnd.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            return delay, self._rnd.random() < self.error_rate
+
+    def record(self, body: bytes, wire_len: int, precision: str) -> None:
+        now = time.time_ns()
+        unit = _PRECISION_NS.get(precision, 1)
+        lines = body.split(b"\n")
+        lat: list[int] = []
+        n = 0
+        for ln in lines:
+            if not ln:
+                continue
+            n += 1
+            if ln.startswith(self.latency_prefix):
+                try:
+                    lat.append(now - int(ln.rsplit(b" ", 1)[1]) * unit)
+                except (IndexError, ValueError):
+                    pass
+        with self._lock:
+            self._index(lines)
+            self.requests += 1
+            self.points += n
+            self.bytes_wire += wire_len
+            self.bytes_raw += len(body)
+            self.latencies_ns.extend(lat)
+            if not self.first_ns:
+                self.first_ns = now
+            self.last_ns = now
+
+    def _index(self, lines: list[bytes]) -> None:
+        # Series key -> newest timestamp, one lookup per run of lines of the same series.
+        t0 = time.perf_counter()
+        cache = self._cache
+        prev = None
+        last = 0
+        for ln in lines:
+            if not ln:
+                continue
+            i = ln.find(b" ")
+            while i > 0 and ln[i - 1] == 0x5C:  # escaped space in a tag
+                i = ln.find(b" ", i + 1)
+            key = ln[:i]
+            try:
+                ts = int(ln[ln.rindex(b" ") + 1 :])
+            except ValueError:
+                continue
+            if key != prev:
+                if prev is not None:
+                    cache[prev] = last
+                self.series_runs += 1
+                prev = key
+                last = cache.get(key, 0)
+            if ts < last:
+                self.out_of_order += 1
+            else:
+                last = ts
+        if prev is not None:
+            cache[prev] = last
+        self.server_s += time.perf_counter() - t0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "points": self.points,
+                "bytes_wire": self.bytes_wire,
+                "bytes_raw": self.bytes_raw,
+                "first_ns": self.first_ns,
+                "last_ns": self.last_ns,
+                "latencies_ns": list(self.latencies_ns),
+                "server_s": self.server_s,
+                "series_runs": self.series_runs,
+                "out_of_order": self.out_of_order,
+            }
+
+
+def _handler(state: FakeInfluxState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: bytes = b"", ctype: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_POST(self) -> None:  # noqa: N802
+            url = urlsplit(self.path)
+            data = self.rfile.read(int(self.headers.get("Content-Length", "0") or 0))
+            if url.path == "/reset":
+                state.reset()
+                self._reply(204)
+                return
+            if url.path not in ("/write", "/api/v2/write"):
+                self._reply(404, b'{"error":"not found"}')
+                return
+            delay, fail = state.decide()
+            if delay:
+                time.sleep(delay)
+            if fail:
+                with state._lock:
+                    state.errors += 1
+                self._reply(state.error_status, b'{"error":"injected failure"}')
+                return
+            body = gzip.decompress(data) if self.headers.get("Content-Encoding") == "gzip" else data
+            precision = parse_qs(url.query).get("precision", ["ns"])[0]
+            state.record(body, len(data), precision)
+            self._reply(204)
+
+        def do_GET(self) -> None:  # noqa: N802
+            path = urlsplit(self.path).path
+            if path == "/stats":
+                self._reply(200, json.dumps(state.snapshot()).encode())
+            elif path == "/ping":
+                self._reply(204)
+            else:
+                self._reply(404, b'{"error":"not found"}')
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return Handler
+
+
+class FakeInflux:
+    """In-process fake Influx on a background thread (`port=0` picks a free port)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **kwargs) -> None:
+        self.state = FakeInfluxState(**kwargs)
+        self._server = ThreadingHTTPServer((host, port), _handler(self.state))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-influx", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeInflux":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Fake InfluxDB /write endpoint with injectable latency and errors.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=18086)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of writes answered with --error-status")
+    ap.add_argument("--error-status", type=int, default=503)
+    args = ap.parse_args()
+
+    srv = FakeInflux(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    print(f"fake influx listening on {srv.url}", flush=True)
+    with srv:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Local stand-in MQTT broker for testing the `mqtt` sink.
+
+Speaks just enough MQTT 3.1.1 for a QoS 0 publisher (CONNECT/CONNACK,
+PUBLISH, PINGREQ/PINGRESP, DISCONNECT), keeps the last payload per topic and
+counts messages. It can answer slowly (`--delay-ms`) or refuse connections
+(`--refuse`) to check that a bad broker never stalls the Influx path.
+
+    python scripts/fake_mqtt.py --port 11883 --print
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import struct
+
+
+class FakeBroker:
+    def __init__(self, delay_ms: float = 0.0, refuse: bool = False, verbose: bool = False) -> None:
+        self.delay_ms = delay_ms
+        self.refuse = refuse
+        self.verbose = verbose
+        self.connects = 0
+        self.messages = 0
+        self.retained: dict[str, bytes] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                hdr = (await reader.readexactly(1))[0]
+                n, shift = 0, 0
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    n |= (b & 0x7F) << shift
+                    shift += 7
+                    if not b & 0x80:
+                        break
+                body = await reader.readexactly(n) if n else b""
+                kind = hdr & 0xF0
+                if kind == 0x10:
+                    self.connects += 1
+                    writer.write(bytes((0x20, 2, 0, 5 if self.refuse else 0)))
+                    if self.refuse:
+                        await writer.drain()
+                        return
+                elif kind == 0x30:
+                    if self.delay_ms:
+                        await asyncio.sleep(self.delay_ms / 1000)
+                    (tlen,) = struct.unpack("!H", body[:2])
+                    topic = body[2 : 2 + tlen].decode()
+                    # QoS 0 only: no packet id, the rest is payload.
+                    payload = body[2 + tlen :]
+                    self.messages += 1
+                    self.retained[topic] = payload
+                    if self.verbose:
+                        print(topic, payload.decode(errors="replace"), flush=True)
+                elif kind == 0xC0:
+                    writer.write(bytes((0xD0, 0)))
+                elif kind == 0xE0:
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        return {"connects": self.connects, "messages": self.messages, "topics": len(self.retained)}
+
+
+async def _main(args) -> None:
+    broker = FakeBroker(args.delay_ms, args.refuse, args.print)
+    server = await asyncio.start_server(broker.handle, args.host, args.port)
+    print(f"fake mqtt listening on {args.host}:{args.port}", flush=True)
+    async with server:
+        while True:
+            await asyncio.sleep(args.stats_s)
+            print(json.dumps(broker.stats()), flush=True)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Minimal MQTT 3.1.1 broker stand-in (QoS 0 publishers only).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11883)
+    ap.add_argument("--delay-ms", type=float, default=0.0, help="delay per PUBLISH (slow broker)")
+    ap.add_argument("--refuse", action="store_true", help="answer CONNECT with 'not authorized'")
+    ap.add_argument("--print", action="store_true", help="print every message")
+    ap.add_argument("--stats-s", type=float, default=5.0, help="interval for the JSON stats line")
+    args = ap.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,10 +2,22 @@
 from __future__ import annotations
 
 import argparse
+import base64
+import hashlib
 import json
-import subprocess
+import os
+import re
 import sys
+import time
+import urllib.parse
 from dataclasses import dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tigo_ingest.httppool import HTTPPool  # noqa: E402
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
 
 
 @dataclass(frozen=True)
@@ -18,40 +30,181 @@ class NodeStats:
     rssi_p95: int | None
 
 
-def run_influx(db: str, query: str) -> dict:
-    p = subprocess.run(
-        ["influx", "-database", db, "-format", "json", "-execute", query],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    return json.loads(p.stdout)
+def parse_window(s: str) -> int:
+    """'1h' / '24h' / '7d' -> seconds."""
+    m = re.fullmatch(r"(\d+)([smhdw])", s.strip().lower())
+    if m is None:
+        raise argparse.ArgumentTypeError(f"invalid window {s!r} (expected e.g. 1h, 24h, 7d)")
+    return int(m.group(1)) * _UNITS[m.group(2)]
+
+
+class InfluxQuery:
+    """InfluxDB 1.x `/query` over a pooled keep-alive connection, streamed with `chunked=true`.
+
+    Each chunk is a standalone JSON document on its own line; chunks are parsed
+    as they arrive and partial series (same statement and tags) are merged, so
+    the full response body is never held as one string.
+    """
+
+    def __init__(self, url: str, db: str, username: str | None, password: str | None, token: str | None) -> None:
+        self._pool = HTTPPool(url, size=1, timeout=60.0)
+        self._db = db
+        self._headers = {"Accept": "application/json"}
+        if token:
+            self._headers["Authorization"] = f"Token {token}"
+        elif username and password:
+            cred = base64.b64encode(f"{username}:{password}".encode()).decode("ascii")
+            self._headers["Authorization"] = f"Basic {cred}"
+        self.requests = 0
+
+    def query(self, statements: list[str]) -> list[list[dict]]:
+        """Run several statements in one request; returns the series per statement."""
+        body = urllib.parse.urlencode({"db": self._db, "q": ";".join(statements), "chunked": "true", "chunk_size": "10000"})
+        headers = {**self._headers, "Content-Type": "application/x-www-form-urlencoded"}
+        out: list[dict[tuple, dict]] = [{} for _ in statements]
+        self.requests += 1
+        with self._pool.stream("POST", "/query", body=body.encode(), headers=headers) as (status, resp):
+            if status != 200:
+                raise RuntimeError(f"Influx query failed: HTTP {status}: {resp.read()[:2000].decode(errors='replace')}")
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Influx query failed: {chunk['error']}")
+                for res in chunk.get("results") or []:
+                    if res.get("error"):
+                        raise RuntimeError(f"Influx query failed: {res['error']}")
+                    sid = res.get("statement_id", 0)
+                    for series in res.get("series") or []:
+                        key = (series.get("name"), tuple(sorted((series.get("tags") or {}).items())))
+                        prev = out[sid].get(key)
+                        if prev is None:
+                            out[sid][key] = series
+                        else:
+                            prev.setdefault("values", []).extend(series.get("values") or [])
+        return [list(d.values()) for d in out]
 
+    def close(self) -> None:
+        self._pool.close()
 
-def parse_series(obj: dict) -> list[NodeStats]:
+
+class ResultCache:
+    """Short-lived on-disk cache of query results, keyed by endpoint, db and query text."""
+
+    def __init__(self, directory: str, ttl_s: float) -> None:
+        self._dir = Path(directory)
+        self._ttl_s = ttl_s
+
+    def _path(self, key: str) -> Path:
+        return self._dir / (hashlib.sha256(key.encode()).hexdigest()[:32] + ".json")
+
+    def get(self, key: str, ttl_s: float | None = None):
+        if self._ttl_s <= 0:
+            return None
+        try:
+            obj = json.loads(self._path(key).read_bytes())
+        except (OSError, ValueError):
+            return None
+        if time.time() - obj.get("t", 0) > (self._ttl_s if ttl_s is None else ttl_s):
+            return None
+        return obj.get("v")
+
+    def put(self, key: str, value) -> None:
+        if self._ttl_s <= 0:
+            return
+        try:
+            self._dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(key).with_suffix(".tmp")
+            tmp.write_text(json.dumps({"t": time.time(), "v": value}))
+            os.replace(tmp, self._path(key))
+        except OSError:
+            pass
+
+
+def parse_series(series_list: list[dict]) -> list[NodeStats]:
     out: list[NodeStats] = []
-    results = obj.get("results") or []
-    for res in results:
-        for series in res.get("series") or []:
-            tags = series.get("tags") or {}
-            node_id = str(tags.get("node_id") or "")
-            cols = series.get("columns") or []
-            vals = (series.get("values") or [[None]])[0]
-            row = dict(zip(cols, vals, strict=False))
-            out.append(
+    for series in series_list:
+        tags = series.get("tags") or {}
+        node_id = str(tags.get("node_id") or "")
+        cols = series.get("columns") or []
+        vals = (series.get("values") or [[None]])[0]
+        row = dict(zip(cols, vals, strict=False))
+        out.append(
+            NodeStats(
+                node_id=node_id,
+                n=int(row.get("n") or 0),
+                rssi_mean=(float(row["rssi_mean"]) if row.get("rssi_mean") is not None else None),
+                rssi_min=(int(row["rssi_min"]) if row.get("rssi_min") is not None else None),
+                rssi_max=(int(row["rssi_max"]) if row.get("rssi_max") is not None else None),
+                rssi_p95=(int(row["rssi_p95"]) if row.get("rssi_p95") is not None else None),
+            )
+        )
+    return out
+
+
+def from_daemon(url: str, windows: list[str]) -> dict[str, list[NodeStats]]:
+    """Per window stats from the ingest daemon's `/linkstats` endpoint (no Influx query)."""
+    u = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+    pool = HTTPPool(f"{u.scheme}://{u.netloc}", size=1, timeout=10.0)
+    try:
+        status, body = pool.request("GET", f"/linkstats?window={','.join(windows)}")
+    finally:
+        pool.close()
+    obj = json.loads(body)
+    if status != 200:
+        raise RuntimeError(f"daemon: HTTP {status}: {obj.get('error')} (configured windows: {', '.join(obj.get('windows') or [])})")
+    out: dict[str, list[NodeStats]] = {}
+    for w, rows in obj["windows"].items():
+        stats = []
+        for row in rows:
+            r = row["rssi"]
+            stats.append(
                 NodeStats(
-                    node_id=node_id,
-                    n=int(row.get("n") or 0),
-                    rssi_mean=(float(row["rssi_mean"]) if row.get("rssi_mean") is not None else None),
-                    rssi_min=(int(row["rssi_min"]) if row.get("rssi_min") is not None else None),
-                    rssi_max=(int(row["rssi_max"]) if row.get("rssi_max") is not None else None),
-                    rssi_p95=(int(row["rssi_p95"]) if row.get("rssi_p95") is not None else None),
+                    node_id=str(row["node_id"]),
+                    n=int(r.get("n") or 0),
+                    rssi_mean=r.get("mean"),
+                    rssi_min=int(r["min"]) if r.get("min") is not None else None,
+                    rssi_max=int(r["max"]) if r.get("max") is not None else None,
+                    rssi_p95=int(r["p95"]) if r.get("p95") is not None else None,
                 )
             )
+        out[w] = stats
     return out
 
 
+def raw_statement(rp: str, measurement: str, window_s: int) -> str:
+    return (
+        "SELECT count(\"rssi\") AS n, mean(\"rssi\") AS rssi_mean, "
+        "min(\"rssi\") AS rssi_min, max(\"rssi\") AS rssi_max, percentile(\"rssi\",95) AS rssi_p95 "
+        f'FROM "{rp}"."{measurement}" '
+        f"WHERE time > now() - {window_s}s GROUP BY \"node_id\""
+    )
+
+
+def rollup_statement(rp: str, measurement: str, window_s: int) -> str:
+    # Rollup rows carry per-window mean/min/max/count (tigo_ingest/rollups.py): the mean is
+    # averaged over windows and p95 is taken over the window means (approximation).
+    return (
+        "SELECT sum(\"count\") AS n, mean(\"rssi_mean\") AS rssi_mean, "
+        "min(\"rssi_min\") AS rssi_min, max(\"rssi_max\") AS rssi_max, percentile(\"rssi_mean\",95) AS rssi_p95 "
+        f'FROM "{rp}"."{measurement}" '
+        f"WHERE time > now() - {window_s}s GROUP BY \"node_id\""
+    )
+
+
+def pick_rollup(rollups: dict[str, int], window_s: int) -> str | None:
+    """Coarsest available rollup that still gives at least 60 buckets for the window."""
+    best = None
+    for name, res_s in sorted(rollups.items(), key=lambda kv: kv[1]):
+        if res_s * 60 <= window_s:
+            best = name
+    return best
+
+
 def fmt(x) -> str:
     if x is None:
         return "-"
@@ -60,65 +213,152 @@ def fmt(x) -> str:
     return str(x)
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser(description="Summarize Tigo RSSI stats per optimizer (node_id) from InfluxDB.")
-    ap.add_argument("--db", default="bms")
-    ap.add_argument("--hours", type=int, default=24)
-    ap.add_argument("--measurement", default="tigo_power_report")
-    ap.add_argument("--rp", default="autogen")
-    ap.add_argument("--top", type=int, default=15)
-    args = ap.parse_args()
-
-    q = (
-        "SELECT count(\"rssi\") AS n, mean(\"rssi\") AS rssi_mean, "
-        "min(\"rssi\") AS rssi_min, max(\"rssi\") AS rssi_max, percentile(\"rssi\",95) AS rssi_p95 "
-        f'FROM "{args.rp}"."{args.measurement}" '
-        f"WHERE time > now() - {args.hours}h GROUP BY \"node_id\""
-    )
-
-    try:
-        raw = run_influx(args.db, q)
-    except subprocess.CalledProcessError as e:
-        print(e.stderr, file=sys.stderr)
-        return 2
-
-    stats = parse_series(raw)
-    stats = [s for s in stats if s.node_id]
-    if not stats:
-        print("No data returned.")
-        return 1
-
-    print(f"Window: last {args.hours}h, measurement={args.rp}.{args.measurement}")
+def print_window(label: str, source: str, stats: list[NodeStats], top: int, p95_approx: bool = False) -> None:
+    # From rollups p95 is taken over the per-window means, not raw RSSI: marked with `~`.
+    p95 = "rssi_p95~" if p95_approx else "rssi_p95"
+    print(f"Window: last {label}, measurement={source}")
+    if p95_approx:
+        print("(rssi_p95~ = p95 of the rollup window means, an approximation; --source raw for the exact value)")
     print()
     print("Lowest report counts (often the real problem):")
-    for s in sorted(stats, key=lambda x: x.n)[: args.top]:
+    for s in sorted(stats, key=lambda x: x.n)[:top]:
         print(
             f"node_id={s.node_id:>3} n={s.n:>6} "
-            f"rssi_mean={fmt(s.rssi_mean):>6} rssi_p95={fmt(s.rssi_p95):>4} "
+            f"rssi_mean={fmt(s.rssi_mean):>6} {p95}={fmt(s.rssi_p95):>4} "
             f"min={fmt(s.rssi_min):>4} max={fmt(s.rssi_max):>4}"
         )
 
     print()
     print("Highest mean RSSI:")
-    for s in sorted(stats, key=lambda x: (x.rssi_mean is None, x.rssi_mean), reverse=True)[: args.top]:
+    for s in sorted(stats, key=lambda x: (x.rssi_mean is None, x.rssi_mean), reverse=True)[:top]:
         print(
             f"node_id={s.node_id:>3} n={s.n:>6} "
-            f"rssi_mean={fmt(s.rssi_mean):>6} rssi_p95={fmt(s.rssi_p95):>4} "
+            f"rssi_mean={fmt(s.rssi_mean):>6} {p95}={fmt(s.rssi_p95):>4} "
             f"min={fmt(s.rssi_min):>4} max={fmt(s.rssi_max):>4}"
         )
 
     print()
     print("Lowest mean RSSI:")
-    for s in sorted(stats, key=lambda x: (x.rssi_mean is None, x.rssi_mean))[: args.top]:
+    for s in sorted(stats, key=lambda x: (x.rssi_mean is None, x.rssi_mean))[:top]:
         print(
             f"node_id={s.node_id:>3} n={s.n:>6} "
-            f"rssi_mean={fmt(s.rssi_mean):>6} rssi_p95={fmt(s.rssi_p95):>4} "
+            f"rssi_mean={fmt(s.rssi_mean):>6} {p95}={fmt(s.rssi_p95):>4} "
             f"min={fmt(s.rssi_min):>4} max={fmt(s.rssi_max):>4}"
         )
 
-    return 0
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Summarize Tigo RSSI stats per optimizer (node_id) from InfluxDB.")
+    ap.add_argument("--url", default=os.getenv("INFLUX_URL", "http://127.0.0.1:8086"))
+    ap.add_argument("--db", default="bms")
+    ap.add_argument("--hours", type=int, help="single window of N hours (same as --windows Nh)")
+    ap.add_argument("--windows", default="24h", help="comma separated windows, queried in one request (e.g. 1h,24h,7d)")
+    ap.add_argument("--measurement", default="tigo_power_report")
+    ap.add_argument("--rp", default="autogen")
+    ap.add_argument(
+        "--source",
+        choices=("auto", "raw", "rollup"),
+        default="auto",
+        help="auto = use the in-process rollups (<measurement>_1m/_15m/_1h) when they exist, else raw points",
+    )
+    ap.add_argument(
+        "--from-daemon",
+        nargs="?",
+        const=os.getenv("TIGO_LINKSTATS_LISTEN") or "127.0.0.1:9110",
+        metavar="HOST:PORT",
+        help="read the daemon's live link stats (TIGO_LINKSTATS_ENABLED=1) instead of querying Influx",
+    )
+    ap.add_argument("--cache-s", type=float, default=120.0, help="reuse results younger than this (0 = no cache)")
+    ap.add_argument("--cache-dir", default=os.path.join(os.path.expanduser("~"), ".cache", "tigo-ingest"))
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    labels = [f"{args.hours}h"] if args.hours else [w.strip() for w in args.windows.split(",") if w.strip()]
+    try:
+        windows = [(label, parse_window(label)) for label in labels]
+    except argparse.ArgumentTypeError as e:
+        ap.error(str(e))
+
+    if args.from_daemon:
+        try:
+            per_window = from_daemon(args.from_daemon, labels)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"daemon at {args.from_daemon}: {e}", file=sys.stderr)
+            return 2
+        any_data = False
+        for label in labels:
+            stats = per_window.get(label) or []
+            if not stats:
+                print(f"Window: last {label}: no data returned.")
+                print()
+                continue
+            any_data = True
+            print_window(label, f"daemon {args.from_daemon}", stats, args.top)
+            print()
+        return 0 if any_data else 1
+
+    client = InfluxQuery(
+        args.url,
+        args.db,
+        os.getenv("INFLUX_USER") or None,
+        os.getenv("INFLUX_PASS") or None,
+        os.getenv("INFLUX_TOKEN") or None,
+    )
+    cache = ResultCache(args.cache_dir, args.cache_s)
+    try:
+        rollups: dict[str, int] = {}
+        if args.source != "raw":
+            # Which rollup measurements exist changes rarely; remember it for a day.
+            show = f'SHOW MEASUREMENTS WITH MEASUREMENT =~ /^{re.escape(args.measurement)}_[0-9]+[smhd]$/'
+            key = f"{args.url}|{args.db}|{show}"
+            names = cache.get(key, ttl_s=86400)
+            if names is None:
+                names = [v[0] for s in client.query([show])[0] for v in s.get("values") or []]
+                cache.put(key, names)
+            for name in names:
+                try:
+                    rollups[name] = parse_window(name[len(args.measurement) + 1 :])
+                except argparse.ArgumentTypeError:
+                    pass
+            if args.source == "rollup" and not rollups:
+                print(f"No rollup measurements for {args.measurement} found.", file=sys.stderr)
+                return 1
+
+        plan: list[tuple[str, str, str]] = []  # (window label, measurement, statement)
+        for label, window_s in windows:
+            m = pick_rollup(rollups, window_s) if rollups else None
+            if m is not None:
+                plan.append((label, m, rollup_statement(args.rp, m, window_s)))
+            else:
+                plan.append((label, args.measurement, raw_statement(args.rp, args.measurement, window_s)))
+
+        statements = [p[2] for p in plan]
+        key = f"{args.url}|{args.db}|" + ";".join(statements)
+        results = cache.get(key)
+        cached = results is not None
+        if results is None:
+            results = client.query(statements)
+            cache.put(key, results)
+    except (OSError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        client.close()
+
+    any_data = False
+    for (label, m, _), series in zip(plan, results):
+        stats = [s for s in parse_series(series) if s.node_id]
+        if not stats:
+            print(f"Window: last {label}: no data returned.")
+            print()
+            continue
+        any_data = True
+        print_window(label, f"{args.rp}.{m}", stats, args.top, p95_approx=m != args.measurement)
+        print()
+    if cached:
+        print(f"(cached result, younger than {args.cache_s:.0f}s; --cache-s 0 to refresh)")
+    return 0 if any_data else 1
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
@@ -75,6 +75,68 @@ def publish_mqtt(
         print(f"WARN mqtt_publish_failed rc={p.returncode} err={p.stderr.strip()!r}")
 
 
+def read_daemon_state(path: str, max_age_s: float, now: datetime) -> dict | None:
+    """Health state published by the running daemon (`TIGO_HEALTH_FILE`), or None if absent/stale."""
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            state = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    age_s = now.timestamp() - state.get("updated_ns", 0) / 1_000_000_000
+    if age_s > max_age_s:
+        return None
+    pid = state.get("pid")
+    if isinstance(pid, int):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+    return state
+
+
+def _ns_to_dt(ns: int) -> datetime:
+    return datetime.fromtimestamp(ns / 1_000_000_000, tz=timezone.utc)
+
+
+def check_daemon_state(state: dict, now: datetime, max_lag_min: int) -> tuple[str, str, dict]:
+    """(status, reason, details) from the daemon state; mirrors the checks done via Influx."""
+    now_ns = int(now.timestamp() * 1_000_000_000)
+    lag_ns = max_lag_min * 60 * 1_000_000_000
+    sources = state.get("sources") or {}
+    writes = state.get("writes") or {}
+    details: dict = {
+        "source_lag_min": {
+            name: round((now_ns - s["last_event_ns"]) / 60e9, 1) if s.get("last_event_ns") else None for name, s in sources.items()
+        },
+        "write_errors": writes.get("errors", 0),
+        "spool_backlog_bytes": (state.get("spool") or {}).get("backlog_bytes", 0),
+    }
+    last_event = max((s.get("last_event_ns") or 0 for s in sources.values()), default=0)
+    last_ok = writes.get("last_ok_ns") or 0
+    if last_event:
+        details["last_ts_utc"] = _ns_to_dt(last_event).isoformat()
+        details["lag_min"] = round((now_ns - last_event) / 60e9, 1)
+    if last_ok:
+        details["last_write_utc"] = _ns_to_dt(last_ok).isoformat()
+
+    uptime_ns = now_ns - state.get("started_ns", now_ns)
+    if not last_event:
+        return ("OK", "starting", details) if uptime_ns < lag_ns else ("CRIT", "no_points_found", details)
+    if now_ns - last_event > lag_ns:
+        return "CRIT", "stale_data", details
+    stale = sorted(name for name, s in sources.items() if now_ns - (s.get("last_event_ns") or 0) > lag_ns)
+    if stale:
+        details["stale_sources"] = stale
+        return "CRIT", "stale_source", details
+    if (last_ok and now_ns - last_ok > lag_ns) or (not last_ok and uptime_ns > lag_ns):
+        return "CRIT", "writes_stalled", details
+    return "OK", "healthy", details
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(
         description="Health-check for tigo-ingest + Influx writes",
@@ -85,6 +147,12 @@ def main() -> int:
     ap.add_argument("--rp", default="autogen")
     ap.add_argument("--measurement", default="tigo_power_report")
     ap.add_argument("--max-lag-min", type=int, default=240, help="Fail if latest point is older than this")
+    ap.add_argument(
+        "--state-file",
+        default=os.getenv("TIGO_HEALTH_FILE", "health.json"),
+        help="health state published by the daemon; the Influx query is only used when it is missing or stale ('' = always query)",
+    )
+    ap.add_argument("--max-state-age-s", type=float, default=60.0, help="ignore a state file older than this")
     ap.add_argument("--mqtt-enabled", action="store_true", default=_env_bool("TIGO_HEALTH_MQTT_ENABLED", False))
     ap.add_argument("--mqtt-host", default=os.getenv("TIGO_HEALTH_MQTT_HOST", "127.0.0.1"))
     ap.add_argument("--mqtt-port", type=int, default=int(os.getenv("TIGO_HEALTH_MQTT_PORT", "1883")))
@@ -96,6 +164,32 @@ def main() -> int:
 
     now = datetime.now(timezone.utc)
 
+    # Fast path: the daemon publishes its own state, no systemctl/influx processes needed.
+    state = read_daemon_state(args.state_file, args.max_state_age_s, now)
+    if state is not None:
+        status_s, reason, details = check_daemon_state(state, now, args.max_lag_min)
+        msg = f"{status_s} {reason} " + " ".join(f"{k}={v}" for k, v in details.items() if not isinstance(v, dict))
+        publish_mqtt(
+            enabled=args.mqtt_enabled,
+            host=args.mqtt_host,
+            port=args.mqtt_port,
+            topic=args.mqtt_topic,
+            username=args.mqtt_user,
+            password=args.mqtt_pass,
+            retain=args.mqtt_retain,
+            payload={
+                "status": status_s,
+                "reason": reason,
+                "service": args.service,
+                "via": "daemon_state",
+                "max_lag_min": args.max_lag_min,
+                **details,
+                "ts_utc": now.isoformat(),
+            },
+        )
+        print(msg.rstrip())
+        return 0 if status_s == "OK" else 2
+
     status = run(["systemctl", "is-active", args.service])
     if status.returncode != 0 or status.stdout.strip() != "active":
         msg = f"CRIT service_not_active service={args.service} state={status.stdout.strip()!r}"
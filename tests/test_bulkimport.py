@@ -0,0 +1,130 @@
+"""Bulk import: topology enrichment and checkpoint/resume."""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import signal
+import threading
+
+from tigo_ingest import bulkimport
+from tigo_ingest.bulkimport import BulkImporter, Shard, _import_shard, _WorkerOptions
+from tigo_ingest.decoder import make_decoder
+from tigo_ingest.influx import PowerReportEncoder, WireConfig
+from tigo_ingest.schema import DEFAULT_SCHEMA
+from tigo_ingest.statefile import atomic_write_json
+from tigo_ingest.topology import TopologyConfig, TopologyRegistry
+
+MEASUREMENT = "tigo_power_report"
+
+
+def _report(i: int, gw: int = 1, node: int = 1) -> dict:
+    return {
+        "timestamp": f"2026-10-17T10:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}+00:00",
+        "gateway": {"id": gw},
+        "node": {"id": node},
+        "voltage_in": 30.0,
+        "voltage_out": 29.5,
+        "current": 2.0 + i / 1000,
+        "dc_dc_duty_cycle": 0.9,
+        "temperature": 40.0,
+        "rssi": -60,
+    }
+
+
+def _opts(topology: TopologyConfig | None, body_points: int = 1000) -> _WorkerOptions:
+    return _WorkerOptions(
+        measurement=MEASUREMENT,
+        body_points=body_points,
+        max_line=64 * 1024,
+        since_ns=None,
+        until_ns=None,
+        source=None,
+        schema=DEFAULT_SCHEMA,
+        wire=WireConfig(),
+        topology=topology,
+    )
+
+
+def _run_shard(path, opts: _WorkerOptions, topology: TopologyRegistry | None) -> list[str]:
+    size = path.stat().st_size
+    results: queue.Queue = queue.Queue()
+    enc = PowerReportEncoder(MEASUREMENT, schema=opts.schema)
+    _import_shard(Shard(0, str(path), 0, size, 0), opts, make_decoder(), enc, topology, results)
+    lines: list[str] = []
+    while not results.empty():
+        _, _, _, body, _ = results.get()
+        lines.extend(body.decode().splitlines())
+    return lines
+
+
+def test_import_enriches_from_topology_file_and_events(tmp_path):
+    topo_file = tmp_path / "topology.json"
+    atomic_write_json(
+        str(topo_file),
+        {"version": 1, "gateways": {}, "nodes": {"": {"1": {"1": {"barcode": "4-000001A", "string": "S1"}}}}},
+    )
+    infra = {"infrastructure_report": {"gateways": {"1": {"address": [4, 192, 75, 17, 0, 0, 0, 1]}}, "nodes": {}}}
+    path = tmp_path / "in.jsonl"
+    path.write_text("\n".join(json.dumps(o) for o in (infra, _report(0), _report(1, node=2))) + "\n")
+
+    cfg = TopologyConfig(enabled=True, path=str(topo_file), save_s=60.0)
+    topology = TopologyRegistry(cfg)
+    topology.load()
+    lines = _run_shard(path, _opts(cfg), topology)
+    assert len(lines) == 2
+    assert "barcode=4-000001A" in lines[0] and "string=S1" in lines[0]
+    assert all("gateway_addr=04c04b1100000001" in ln for ln in lines)
+
+    plain = _run_shard(path, _opts(None), None)
+    assert not any("string=" in ln or "gateway_addr=" in ln for ln in plain)
+
+
+class _Writer:
+    """Collects written lines; sends the importer a Ctrl-C after `interrupt_after` bodies."""
+
+    def __init__(self, interrupt_after: int | None = None) -> None:
+        self.interrupt_after = interrupt_after
+        self.bodies = 0
+        self.lines: list[str] = []
+        self._lock = threading.Lock()
+
+    def write_body(self, body: bytes, points: int) -> None:
+        with self._lock:
+            self.lines.extend(body.decode().splitlines())
+            self.bodies += 1
+            if self.bodies == self.interrupt_after:
+                os.kill(os.getpid(), signal.SIGINT)
+
+    def close(self) -> None:
+        pass
+
+
+def test_interrupted_import_resumes_without_duplicates_or_gaps(tmp_path, monkeypatch):
+    # Small reads so every shard yields several bodies (the workers are forked and inherit this).
+    monkeypatch.setattr(bulkimport, "_READ_CHUNK", 1 << 14)
+    # Unique timestamps (one per second), several 1 MiB shards.
+    paths = []
+    for f in range(2):
+        path = tmp_path / f"day{f}.jsonl"
+        with path.open("w") as out:
+            for i in range(6000):
+                rep = _report(0, gw=f + 1, node=i % 40 + 1)
+                rep["timestamp"] = f"2026-10-{17 + f}T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}.000000001+00:00"
+                out.write(json.dumps({"power_report": rep} if i % 2 else rep) + "\n")
+        paths.append(str(path))
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    def _importer(writer: _Writer) -> BulkImporter:
+        return BulkImporter(paths, checkpoint, jobs=2, writers=1, shard_bytes=1 << 20, opts=_opts(None, body_points=400), writer=writer)
+
+    first = _Writer(interrupt_after=5)
+    assert _importer(first).run() == 130
+    assert 0 < len(first.lines) < 12000
+
+    second = _Writer()
+    assert _importer(second).run() == 0
+    lines = first.lines + second.lines
+    assert len(lines) == len(set(lines)) == 12000
+    assert _importer(_Writer()).run() == 0  # nothing left to do
@@ -0,0 +1,81 @@
+"""Deadband filter: bands, state changes and the `max_silence_s` heartbeat."""
+
+from __future__ import annotations
+
+import pytest
+
+from tigo_ingest.deadband import DEFAULT_DEADBANDS, DeadbandConfig, DeadbandFilter, parse_deadbands
+from tigo_ingest.taptap_reader import PowerReport
+
+_NS = 1_000_000_000
+_T0 = 1_792_231_200 * _NS
+
+
+def _filter(max_silence_s: float = 300.0, spec: str = DEFAULT_DEADBANDS) -> DeadbandFilter:
+    return DeadbandFilter(DeadbandConfig(enabled=True, deadbands=parse_deadbands(spec), max_silence_s=max_silence_s, max_nodes=100))
+
+
+def _pr(t_s: float, v_in: float = 40.0, current: float = 5.0, v_out: float = 39.0, node: int = 1) -> PowerReport:
+    return PowerReport(_T0 + int(t_s * _NS), 1, None, node, None, None, v_in, v_out, current, 0.9, 30.0, -60)
+
+
+def test_heartbeat_after_max_silence_of_written_reports():
+    f = _filter(max_silence_s=300.0)
+    assert f.accept(_pr(0))
+    # Steady values: everything inside the bands is dropped ...
+    assert [f.accept(_pr(t)) for t in range(30, 300, 30)] == [False] * 9
+    # ... until the last *written* report is max_silence old, then one is forced.
+    assert f.accept(_pr(300))
+    assert f.heartbeats == 1
+    # The heartbeat restarts the silence window.
+    assert not f.accept(_pr(330))
+    assert not f.accept(_pr(599))
+    assert f.accept(_pr(600))
+    assert f.heartbeats == 2
+    assert (f.passed, f.suppressed) == (3, 11)
+
+
+def test_change_outside_band_restarts_silence_window():
+    f = _filter(max_silence_s=300.0)
+    f.accept(_pr(0))
+    assert f.accept(_pr(200, v_in=41.0))  # 1 V > 0.5 V band
+    assert not f.accept(_pr(300, v_in=41.0))  # only 100 s since the last written report
+    assert f.accept(_pr(500, v_in=41.0))
+    assert f.heartbeats == 1
+
+
+def test_slow_drift_is_compared_against_last_written_value():
+    f = _filter(spec="voltage_in_v=0.5")
+    f.accept(_pr(0, v_in=40.0))
+    assert not f.accept(_pr(10, v_in=40.3))
+    assert not f.accept(_pr(20, v_in=40.5))
+    assert f.accept(_pr(30, v_in=40.6))
+
+
+def test_state_change_is_always_written():
+    f = _filter()
+    f.accept(_pr(0))
+    assert f.accept(_pr(10, current=0.0))
+    assert f.accept(_pr(20, v_out=0.0, current=0.0))
+    assert f.forced_state == 2
+
+
+def test_relative_and_absolute_band_must_both_be_exceeded():
+    f = _filter(spec="power_w=1,power_w=10%")
+    f.accept(_pr(0, current=5.0))  # 200 W
+    assert not f.accept(_pr(10, current=5.4))  # +16 W, below 10 %
+    assert f.accept(_pr(20, current=5.6))  # +24 W
+
+
+def test_nodes_are_independent():
+    f = _filter()
+    assert f.accept(_pr(0, node=1))
+    assert f.accept(_pr(0, node=2))
+    assert not f.accept(_pr(10, node=1))
+
+
+def test_invalid_spec():
+    with pytest.raises(ValueError):
+        parse_deadbands("bogus=1")
+    with pytest.raises(ValueError):
+        parse_deadbands("rssi=x")
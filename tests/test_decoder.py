@@ -0,0 +1,105 @@
+"""Decoder backends: address normalization and agreement between the fast and the generic paths."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from tigo_ingest.decoder import BACKENDS, DecodeError, make_decoder
+from tigo_ingest.influx import PowerReportEncoder
+from tigo_ingest.schema import parse_schema
+
+_AVAILABLE = []
+for _b in BACKENDS[1:]:
+    try:
+        make_decoder(_b)
+    except ImportError:
+        continue
+    _AVAILABLE.append(_b)
+
+
+def _payload(gw_addr, node_addr) -> dict:
+    return {
+        "timestamp": "2026-10-17T10:00:00.123456789+00:00",
+        "gateway": {"id": 1, "address": gw_addr},
+        "node": {"id": 7, "address": node_addr, "barcode": "4-000007A"},
+        "voltage_in": 30.0,
+        "voltage_out": 29.5,
+        "current": 2.0,
+        "dc_dc_duty_cycle": 0.9,
+        "temperature": 40.0,
+        "rssi": -60,
+    }
+
+
+@pytest.mark.parametrize("backend", _AVAILABLE)
+@pytest.mark.parametrize("envelope", [False, True])
+def test_hex_addresses_follow_the_json_type(backend, envelope):
+    # An int is a decimal address; a byte array whose hex happens to be all digits must stay as it is.
+    p = _payload(1234, [0, 0, 0, 0, 0, 0, 0x12, 0x34])
+    raw = json.dumps({"power_report": p} if envelope else p, separators=(",", ":")).encode()
+    plain = make_decoder(backend).decode(raw)
+    assert (plain.gateway_address, plain.node_address) == ("1234", "0000000000001234")
+    pr = make_decoder(backend, hex_addresses=(True, True)).decode(raw)
+    assert (pr.gateway_address, pr.node_address) == ("00000000000004d2", "0000000000001234")
+    gw_only = make_decoder(backend, hex_addresses=(True, False)).decode(raw)
+    assert gw_only.gateway_address == "00000000000004d2"
+
+
+def test_hex_schema_writes_decoded_addresses_unchanged():
+    schema = parse_schema({"attributes": {"gateway_addr": {"as": "tag", "format": "hex"}, "node_addr": {"as": "tag", "format": "hex"}}})
+    assert schema.hex_addresses == (True, True)
+    raw = json.dumps(_payload(1234, [0, 0, 0, 0, 0, 0, 0x12, 0x34])).encode()
+    pr = make_decoder("json", hex_addresses=schema.hex_addresses).decode(raw)
+    line = PowerReportEncoder("m", schema=schema).encode(pr)
+    assert "gateway_addr=00000000000004d2" in line
+    assert "node_addr=0000000000001234" in line
+
+
+def _outcome(backend: str, raw: bytes):
+    events = []
+    try:
+        pr = make_decoder(backend).decode(raw, on_event=lambda t, p: events.append(t))
+    except DecodeError as e:
+        return ("error", e.kind)
+    return (pr, events)
+
+
+def _with(d: dict, **kw) -> dict:
+    return {**d, **kw}
+
+
+_BASE = _payload(1234, "04C05B3000012345")
+_PARITY_CASES = {
+    "envelope": {"power_report": _BASE},
+    "bare": _BASE,
+    "envelope_sibling_key": {"power_report": _BASE, "seq": 1},
+    "envelope_payload_extra_key": {"power_report": _with(_BASE, firmware="1.2")},
+    "bare_extra_key": _with(_BASE, firmware="1.2"),
+    "nested_extra_keys": {"power_report": _with(_BASE, gateway={"id": 1, "x": 0}, node={"id": 7, "y": None})},
+    "duty_cycle_name": {"power_report": _with({k: v for k, v in _BASE.items() if k != "dc_dc_duty_cycle"}, duty_cycle=0.5)},
+    "missing_duty_cycle": {"power_report": {k: v for k, v in _BASE.items() if k != "dc_dc_duty_cycle"}},
+    "missing_field": {"power_report": {k: v for k, v in _BASE.items() if k != "voltage_out"}},
+    "float_rssi": {"power_report": _with(_BASE, rssi=-60.0)},
+    "string_id": {"power_report": _with(_BASE, gateway={"id": "1"})},
+    "bad_value": {"power_report": _with(_BASE, current="n/a")},
+    "bad_timestamp": {"power_report": _with(_BASE, timestamp="yesterday")},
+    "null_payload": {"power_report": None},
+    "other_event": {"infrastructure": {"gateways": {}}},
+    "empty_object": {},
+    "array": [_BASE],
+}
+
+
+@pytest.mark.parametrize("backend", [b for b in _AVAILABLE if b != "json"])
+@pytest.mark.parametrize("case", list(_PARITY_CASES))
+def test_backends_agree_with_the_generic_path(backend, case):
+    raw = json.dumps(_PARITY_CASES[case], separators=(",", ":")).encode()
+    assert _outcome(backend, raw) == _outcome("json", raw)
+
+
+@pytest.mark.parametrize("backend", _AVAILABLE)
+def test_invalid_json_and_unknown_shapes(backend):
+    assert _outcome(backend, b'{"power_report":') == ("error", "json")
+    assert _outcome(backend, b'{"power_report":{},"seq":1}') == ("error", "envelope")
@@ -0,0 +1,66 @@
+"""Encoder fast paths must produce exactly the bytes of the reference `line_protocol` path."""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from tigo_ingest.influx import PowerReportEncoder, power_report_line
+from tigo_ingest.taptap_reader import PowerReport
+
+MEASUREMENT = "tigo_power_report"
+_NS = 1_000_000_000
+
+
+def _reports(n: int, seed: int = 7) -> list[PowerReport]:
+    rnd = random.Random(seed)
+    floats = (0.0, -0.0, 1.0, -3.5, 1e-9, 123456.789, 0.1 + 0.2)
+    # Tag values that need escaping, missing ones and the empty barcode taptap sends for unknown nodes.
+    labels = (None, "", "A1-B2", "with space", "a,b=c", "x\\y")
+
+    def num() -> float:
+        return rnd.choice(floats) if rnd.random() < 0.2 else rnd.uniform(-5.0, 80.0)
+
+    out = []
+    for i in range(n):
+        out.append(
+            PowerReport(
+                timestamp_ns=1_792_200_000 * _NS + i * 1_234_567 + rnd.randrange(1000),
+                gateway_id=rnd.randrange(3),
+                gateway_address=rnd.choice((None, "04C05B3000012345")),
+                node_id=rnd.randrange(40),
+                node_address=rnd.choice((None, "0A1B", "FFFF")),
+                node_barcode=rnd.choice(labels),
+                voltage_in=num(),
+                voltage_out=num(),
+                current=num(),
+                duty_cycle=num(),
+                temperature=num(),
+                rssi=rnd.randrange(-20, 256),
+                source=rnd.choice((None, "dach", "garage 2")),
+                string=rnd.choice((None, "S1", "west,ost")),
+            )
+        )
+    return out
+
+
+def _reference(pr: PowerReport, ts_div: int = 1) -> str:
+    line = power_report_line(MEASUREMENT, pr)
+    if ts_div == 1:
+        return line
+    head, _, ts = line.rpartition(" ")
+    return f"{head} {int(ts) // ts_div}"
+
+
+def test_row_encoder_matches_line_protocol():
+    enc = PowerReportEncoder(MEASUREMENT, cache_size=16)  # small cache: evictions are exercised too
+    for pr in _reports(5000):
+        assert enc.encode(pr) == _reference(pr)
+
+
+@pytest.mark.parametrize("precision,div", [("ms", 1_000_000), ("s", _NS)])
+def test_precision_paths_match_line_protocol(precision, div):
+    reports = _reports(2000, seed=3)
+    enc = PowerReportEncoder(MEASUREMENT, precision=precision)
+    assert [enc.encode(pr) for pr in reports] == [_reference(pr, div) for pr in reports]
@@ -0,0 +1,141 @@
+"""Energy integration: trapezoids, gaps, duplicates, day boundaries and persistence."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from tigo_ingest.energy import EnergyConfig, EnergyIntegrator
+from tigo_ingest.taptap_reader import PowerReport
+
+_NS = 1_000_000_000
+# 2026-10-17T10:00:00Z
+_T0 = 1_792_231_200 * _NS
+
+
+def _cfg(path: str = "", max_gap_s: float = 300.0) -> EnergyConfig:
+    return EnergyConfig(
+        enabled=True,
+        path=path,
+        max_gap_s=max_gap_s,
+        interval_s=60.0,
+        tz="UTC",
+        node_measurement="e",
+        gateway_measurement="e_gw",
+        max_nodes=100,
+    )
+
+
+def _pr(ts: int, watts: float, node: int = 1, gw: int = 1) -> PowerReport:
+    # voltage_in * current = watts
+    return PowerReport(ts, gw, None, node, None, None, 40.0, 39.0, watts / 40.0, 0.9, 30.0, -60)
+
+
+def _fields(lines: list[str], measurement: str = "e") -> list[dict]:
+    out = []
+    for ln in lines:
+        head, fields, _ = ln.split(" ")
+        if head.split(",")[0] != measurement:
+            continue
+        f = {}
+        for kv in fields.split(","):
+            k, v = kv.split("=")
+            f[k] = int(v[:-1]) if v.endswith("i") else float(v)
+        out.append(f)
+    return out
+
+
+def _kwh(w1: float, w2: float, seconds: float) -> float:
+    return (w1 + w2) / 2 * seconds / 3600 / 1000
+
+
+def test_trapezoid_between_reports():
+    e = EnergyIntegrator(_cfg())
+    e.observe(_pr(_T0, 100.0))
+    e.observe(_pr(_T0 + 60 * _NS, 200.0))
+    e.observe(_pr(_T0 + 90 * _NS, 200.0))
+    (node,) = _fields(e.collect())
+    assert node["energy_kwh"] == pytest.approx(_kwh(100, 200, 60) + _kwh(200, 200, 30))
+    assert node["today_kwh"] == pytest.approx(node["energy_kwh"])
+    assert node["gaps"] == 0
+    assert e.intervals == 2
+
+
+def test_gap_longer_than_max_gap_is_skipped_and_counted():
+    e = EnergyIntegrator(_cfg(max_gap_s=300.0))
+    e.observe(_pr(_T0, 100.0))
+    e.observe(_pr(_T0 + 300 * _NS, 100.0))  # exactly max_gap: still integrated
+    e.observe(_pr(_T0 + 901 * _NS, 100.0))  # 601s offline: not bridged
+    e.observe(_pr(_T0 + 961 * _NS, 100.0))
+    (node,) = _fields(e.collect())
+    assert node["energy_kwh"] == pytest.approx(_kwh(100, 100, 300) + _kwh(100, 100, 60))
+    assert node["gaps"] == 1
+    assert e.gaps == 1
+
+
+def test_duplicate_and_older_reports_are_ignored():
+    e = EnergyIntegrator(_cfg())
+    e.observe(_pr(_T0, 100.0))
+    e.observe(_pr(_T0 + 60 * _NS, 100.0))
+    e.observe(_pr(_T0 + 60 * _NS, 5000.0))
+    e.observe(_pr(_T0 + 30 * _NS, 5000.0))
+    (node,) = _fields(e.collect())
+    assert node["energy_kwh"] == pytest.approx(_kwh(100, 100, 60))
+    # Nothing changed since the last collect: no points.
+    e.observe(_pr(_T0 + 30 * _NS, 5000.0))
+    assert e.collect() == []
+
+
+def test_today_restarts_after_a_night_long_gap():
+    e = EnergyIntegrator(_cfg())
+    evening = _T0 + 8 * 3600 * _NS  # 18:00 UTC
+    e.observe(_pr(evening, 100.0))
+    e.observe(_pr(evening + 60 * _NS, 100.0))
+    first = _fields(e.collect())[0]
+    morning = _T0 + 22 * 3600 * _NS  # 08:00 UTC the next day
+    e.observe(_pr(morning, 100.0))
+    (node,) = _fields(e.collect())
+    assert node["today_kwh"] == 0.0
+    assert node["energy_kwh"] == pytest.approx(first["energy_kwh"])
+    assert node["gaps"] == 1
+
+
+def test_interval_across_midnight_is_booked_on_the_new_day():
+    e = EnergyIntegrator(_cfg())
+    midnight = _T0 + 14 * 3600 * _NS
+    e.observe(_pr(midnight - 30 * _NS, 100.0))
+    e.observe(_pr(midnight + 30 * _NS, 100.0))
+    (node,) = _fields(e.collect())
+    assert node["today_kwh"] == pytest.approx(_kwh(100, 100, 60))
+
+
+def test_gateway_sums_its_nodes():
+    e = EnergyIntegrator(_cfg())
+    for node, w in ((1, 100.0), (2, 300.0)):
+        e.observe(_pr(_T0, w, node=node))
+        e.observe(_pr(_T0 + 60 * _NS, w, node=node))
+    (gw,) = _fields(e.collect(), "e_gw")
+    assert gw["energy_kwh"] == pytest.approx(_kwh(100, 100, 60) + _kwh(300, 300, 60))
+
+
+def test_counters_continue_after_restart(tmp_path):
+    path = str(tmp_path / "energy.json")
+    e = EnergyIntegrator(_cfg(path))
+    e.observe(_pr(_T0, 100.0))
+    e.observe(_pr(_T0 + 60 * _NS, 100.0))
+    queued: list[str] = []
+
+    async def _put(line: str) -> None:
+        queued.append(line)
+
+    asyncio.run(e.flush(_put))
+    before = _fields(queued)[0]["energy_kwh"]
+
+    again = EnergyIntegrator(_cfg(path))
+    again.load()
+    # A short restart is still integrated from the saved last report.
+    again.observe(_pr(_T0 + 120 * _NS, 100.0))
+    (node,) = _fields(again.collect())
+    assert node["energy_kwh"] == pytest.approx(before + _kwh(100, 100, 60))
+    assert node["energy_kwh"] > before
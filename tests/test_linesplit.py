@@ -0,0 +1,99 @@
+"""LineSplitter: arbitrary chunk boundaries, CRLF, overlong and non-UTF-8 lines."""
+
+from __future__ import annotations
+
+import random
+
+from tigo_ingest.linesplit import LineSplitter
+
+
+def _split_all(splitter: LineSplitter, chunks: list[bytes]) -> list[bytes]:
+    out: list[bytes] = []
+    for c in chunks:
+        out.extend(splitter.feed(c))
+    out.extend(splitter.finish())
+    return out
+
+
+def _random_chunks(rnd: random.Random, data: bytes) -> list[bytes]:
+    chunks, i = [], 0
+    while i < len(data):
+        n = rnd.choice((1, 2, 3, 7, 64, 1000, 5000))
+        chunks.append(data[i : i + n])
+        i += n
+    return chunks
+
+
+def test_random_chunking_matches_split():
+    rnd = random.Random(1)
+    lines = [b'{"n":%d,"pad":"%s"}' % (i, b"x" * rnd.randrange(0, 300)) for i in range(2000)]
+    seps = [rnd.choice((b"\n", b"\r\n", b"\n\n", b" \n")) for _ in lines]
+    data = b"".join(ln + sep for ln, sep in zip(lines, seps))
+    for seed in range(5):
+        splitter = LineSplitter(max_line=1024)
+        assert _split_all(splitter, _random_chunks(random.Random(seed), data)) == lines
+        assert splitter.lines == len(lines)
+        assert splitter.overlong == splitter.invalid_utf8 == 0
+
+
+def test_partial_line_is_held_back_until_its_newline():
+    s = LineSplitter()
+    assert s.feed(b'{"a":1}\n{"b"') == [b'{"a":1}']
+    assert s.pending == 4
+    assert s.feed(b":2}") == []
+    assert s.feed(b"\n") == [b'{"b":2}']
+    assert s.pending == 0
+
+
+def test_crlf_split_across_reads():
+    s = LineSplitter()
+    assert s.feed(b'{"a":1}\r') == []
+    assert s.feed(b'\n{"b":2}\r\n\r') == [b'{"a":1}', b'{"b":2}']
+    assert s.feed(b"\n") == []  # a bare CR line is empty after stripping
+    assert s.finish() == []
+
+
+def test_unterminated_last_line_at_eof():
+    s = LineSplitter()
+    assert s.feed(b'{"a":1}\n{"b":2}') == [b'{"a":1}']
+    assert s.finish() == [b'{"b":2}']
+    assert s.pending == 0
+
+
+def test_overlong_line_in_one_chunk_is_dropped():
+    s = LineSplitter(max_line=16)
+    ok = b"x" * 16
+    assert s.feed(ok + b"\n" + b"y" * 17 + b"\n" + b"z\n") == [ok, b"z"]
+    assert s.overlong == 1
+
+
+def test_overlong_line_across_reads_keeps_the_buffer_bounded():
+    s = LineSplitter(max_line=100)
+    assert s.feed(b'{"a":1}\n' + b"y" * 60) == [b'{"a":1}']
+    for _ in range(50):
+        assert s.feed(b"y" * 60) == []
+        assert s.pending <= 100
+    # The rest of the overlong line up to its newline is skipped, the next line is kept.
+    assert s.feed(b"yyy\n" + b'{"b":2}\n') == [b'{"b":2}']
+    assert s.overlong == 1
+    # An overlong line cut off at EOF is not returned by finish() either.
+    assert s.feed(b"y" * 500) == []
+    assert s.finish() == []
+    assert s.overlong == 2
+
+
+def test_invalid_utf8_is_skipped_and_counted():
+    s = LineSplitter()
+    assert s.feed(b'{"a":"\xff"}\n{"b":"\xc3\xa4"}\n') == [b'{"b":"\xc3\xa4"}']
+    assert s.invalid_utf8 == 1
+    assert s.lines == 1
+
+
+def test_reset_forgets_a_partial_line():
+    s = LineSplitter(max_line=10)
+    s.feed(b"y" * 20)
+    s.reset()
+    assert s.feed(b'{"a":1}\n') == [b'{"a":1}']
+    s.feed(b'{"b"')
+    s.reset()
+    assert s.feed(b"2}\n") == [b"2}"]
@@ -0,0 +1,139 @@
+"""Rollup windows: bucket boundaries, coarser levels, lateness, future reports, save/load."""
+
+from __future__ import annotations
+
+import time
+
+from tigo_ingest.rollups import RollupConfig, RollupEngine
+from tigo_ingest.taptap_reader import PowerReport
+
+_NS = 1_000_000_000
+_MIN = 60 * _NS
+
+
+def _cfg(tmp_path=None, resolutions=("1m", "15m"), lateness_s=120.0) -> RollupConfig:
+    return RollupConfig(
+        resolutions=resolutions,
+        lateness_s=lateness_s,
+        node_measurement="m_{res}",
+        gateway_measurement="m_gw_{res}",
+        max_nodes=100,
+        max_future_s=300.0,
+        path=str(tmp_path / "rollups.json") if tmp_path is not None else "",
+    )
+
+
+def _t0() -> int:
+    # A recent whole hour, so reports are neither in the future nor tied to wall time.
+    now = time.time_ns()
+    return now - now % (3600 * _NS) - 2 * 3600 * _NS
+
+
+def _pr(ts: int, node: int = 1, vin: float = 30.0, cur: float = 2.0) -> PowerReport:
+    return PowerReport(
+        timestamp_ns=ts,
+        gateway_id=1,
+        gateway_address=None,
+        node_id=node,
+        node_address=None,
+        node_barcode=None,
+        voltage_in=vin,
+        voltage_out=29.0,
+        current=cur,
+        duty_cycle=0.9,
+        temperature=40.0,
+        rssi=-60,
+    )
+
+
+def _points(lines: list[str]) -> list[tuple[str, dict, int]]:
+    """(measurement, fields, timestamp) per line; values parsed as int/float."""
+    out = []
+    for ln in lines:
+        head, fields, ts = ln.split(" ")
+        f = {}
+        for kv in fields.split(","):
+            k, v = kv.split("=")
+            f[k] = int(v[:-1]) if v.endswith("i") else float(v)
+        out.append((head.split(",")[0], f, int(ts)))
+    return out
+
+
+def _idle_hour() -> float:
+    # Wall clock an hour after the last report: the idle watermark has passed every window in these tests.
+    return time.time() + 3600.0
+
+
+def test_reports_land_in_the_window_containing_their_timestamp():
+    t0 = _t0()
+    eng = RollupEngine(_cfg(resolutions=("1m",)))
+    for ts in (t0 - 1, t0, t0 + 30 * _NS, t0 + _MIN - 1, t0 + _MIN):
+        eng.observe(_pr(ts))
+    pts = [p for p in _points(eng.collect(wall_now=_idle_hour())) if p[0] == "m_1m"]
+    assert [(ts, f["count"]) for _, f, ts in pts] == [(t0 - _MIN, 1), (t0, 3), (t0 + _MIN, 1)]
+
+
+def test_window_closes_only_after_its_end_plus_lateness():
+    t0 = _t0()
+    eng = RollupEngine(_cfg(resolutions=("1m",), lateness_s=30.0))
+    eng.observe(_pr(t0 + 10 * _NS))
+    # Newest event 20s past the window end: still within the 30s lateness.
+    eng.observe(_pr(t0 + _MIN + 20 * _NS))
+    wall = time.time()
+    assert eng.collect(wall_now=wall) == []
+    eng.observe(_pr(t0 + 50 * _NS))  # late, but the window is still open
+    eng.observe(_pr(t0 + _MIN + 31 * _NS))
+    (pt,) = [p for p in _points(eng.collect(wall_now=wall)) if p[0] == "m_1m"]
+    assert pt[2] == t0 and pt[1]["count"] == 2
+    eng.observe(_pr(t0 + 55 * _NS))
+    assert eng.late_dropped == 1
+
+
+def test_coarser_level_merges_closed_fine_windows():
+    t0 = _t0()
+    eng = RollupEngine(_cfg())
+    # 15 minutes with 2 reports each, then one report in the next quarter hour.
+    for minute in range(15):
+        eng.observe(_pr(t0 + minute * _MIN, vin=10.0 + minute))
+        eng.observe(_pr(t0 + minute * _MIN + 30 * _NS, vin=10.0 + minute))
+    eng.observe(_pr(t0 + 15 * _MIN))
+    pts = _points(eng.collect(wall_now=_idle_hour()))
+    (q,) = [p for p in pts if p[0] == "m_15m" and p[2] == t0]
+    assert q[1]["count"] == 30
+    assert q[1]["voltage_in_v_min"] == 10.0 and q[1]["voltage_in_v_max"] == 24.0
+    assert q[1]["voltage_in_v_mean"] == sum(10.0 + m for m in range(15)) / 15
+    (gw,) = [p for p in pts if p[0] == "m_gw_15m" and p[2] == t0]
+    assert gw[1]["reports"] == 30 and gw[1]["nodes"] == 1
+    assert len([p for p in pts if p[0] == "m_1m"]) == 16
+
+
+def test_report_far_in_the_future_does_not_move_the_watermark():
+    t0 = _t0()
+    eng = RollupEngine(_cfg(resolutions=("1m",)))
+    eng.observe(_pr(t0))
+    eng.observe(_pr(time.time_ns() + 3600 * _NS))
+    assert eng.future_dropped == 1
+    eng.observe(_pr(t0 + 10 * _NS))
+    assert eng.late_dropped == 0
+
+
+def test_open_windows_survive_save_and_load(tmp_path):
+    t0 = _t0()
+    cfg = _cfg(tmp_path)
+    eng = RollupEngine(cfg)
+    for minute in range(5):
+        eng.observe(_pr(t0 + minute * _MIN))
+    # Minutes 0 and 1 close (and move on into the open 15m window), the rest stays open.
+    closed = _points(eng.collect(wall_now=time.time()))
+    assert [ts for m, _, ts in closed if m == "m_1m"] == [t0, t0 + _MIN]
+    eng.save()
+
+    again = RollupEngine(cfg)
+    again.load()
+    assert not (tmp_path / "rollups.json").exists()
+    for minute in range(5, 15):
+        again.observe(_pr(t0 + minute * _MIN))
+    again.observe(_pr(t0 + 15 * _MIN))
+    pts = _points(again.collect(wall_now=_idle_hour()))
+    (q,) = [p for p in pts if p[0] == "m_15m" and p[2] == t0]
+    assert q[1]["count"] == 15
@@ -0,0 +1,169 @@
+"""Spool write-ahead log and drainer."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from tigo_ingest.influx import InfluxWriteError
+from tigo_ingest.spool import Spool, SpoolConfig, SpoolDrainer
+
+
+def _cfg(path, **kw) -> SpoolConfig:
+    base = dict(
+        dir=str(path),
+        fsync="never",
+        fsync_interval_s=1.0,
+        segment_bytes=1024 * 1024,
+        max_bytes=64 * 1024 * 1024,
+        max_age_s=3600.0,
+        bulk_max_lines=100,
+    )
+    base.update(kw)
+    return SpoolConfig(**base)
+
+
+class _Writer:
+    """Fails the first `fail` requests with `status`, then accepts everything."""
+
+    def __init__(self, fail: int = 0, status: int = 503) -> None:
+        self.fail = fail
+        self.status = status
+        self.calls = 0
+        self.lines: list[str] = []
+
+    def write_body(self, body: bytes, k: int) -> None:
+        self.calls += 1
+        if self.calls <= self.fail:
+            raise InfluxWriteError(f"HTTP {self.status}", status=self.status)
+        self.lines.extend(body.decode().splitlines())
+
+
+def _batches(n: int, size: int = 10) -> list[list[str]]:
+    return [[f"m,b={b} v={i}i {b * size + i}" for i in range(size)] for b in range(n)]
+
+
+def _read_all(spool: Spool, max_lines: int = 7) -> list[str]:
+    """Read and commit everything pending, in small reads."""
+    out: list[str] = []
+    while True:
+        records, n, pos = spool.read(max_lines)
+        spool.commit(pos)
+        if not records:
+            return out
+        for payload, k in records:
+            lines = payload.decode().splitlines()
+            assert len(lines) == k
+            out.extend(lines)
+
+
+def _segments(path) -> list[str]:
+    return sorted(p.name for p in path.iterdir() if p.suffix == ".seg")
+
+
+def test_append_rolls_segments_and_reads_in_order(tmp_path):
+    spool = Spool(_cfg(tmp_path, segment_bytes=300))
+    batches = _batches(20)
+    for batch in batches:
+        spool.append(batch)
+    assert len(_segments(tmp_path)) > 3
+    assert _read_all(spool) == [ln for batch in batches for ln in batch]
+    # Consumed segments are removed, only the active one is left.
+    assert len(_segments(tmp_path)) == 1
+    assert spool.backlog() == (0, 1)
+    spool.close()
+
+
+def test_reopen_resumes_at_committed_position(tmp_path):
+    batches = _batches(10)
+    spool = Spool(_cfg(tmp_path, segment_bytes=300))
+    for batch in batches:
+        spool.append(batch)
+    records, n, pos = spool.read(35)
+    assert n == 30  # whole records only
+    spool.commit(pos)
+    spool.close()
+
+    spool = Spool(_cfg(tmp_path, segment_bytes=300))
+    spool.append(["m,b=new v=1i 999"])
+    assert _read_all(spool) == [ln for batch in batches[3:] for ln in batch] + ["m,b=new v=1i 999"]
+    spool.close()
+
+
+def test_crash_without_close_keeps_synced_records(tmp_path):
+    spool = Spool(_cfg(tmp_path, fsync="always"))
+    for batch in _batches(3):
+        spool.append(batch)
+    # No close(): the next process opens the same directory while this one is gone.
+    again = Spool(_cfg(tmp_path))
+    assert _read_all(again) == [ln for batch in _batches(3) for ln in batch]
+    again.close()
+    spool.close()
+
+
+def test_torn_record_at_segment_tail_is_skipped(tmp_path):
+    spool = Spool(_cfg(tmp_path))
+    for batch in _batches(3):
+        spool.append(batch)
+    spool.close()
+    seg = tmp_path / _segments(tmp_path)[-1]
+    data = seg.read_bytes()
+    seg.write_bytes(data[:-15])  # the last append was cut short by a crash
+
+    spool = Spool(_cfg(tmp_path))
+    assert _read_all(spool) == [ln for batch in _batches(2) for ln in batch]
+    assert spool.corrupt_records == 1
+    spool.close()
+
+
+def test_size_cap_drops_oldest_segments(tmp_path):
+    spool = Spool(_cfg(tmp_path, segment_bytes=300, max_bytes=1000))
+    for batch in _batches(20):
+        spool.append(batch)
+    lines = _read_all(spool)
+    assert spool.dropped_lines > 0
+    assert len(lines) + spool.dropped_lines == 200
+    # What is left is the newest data, still in order.
+    assert lines == [ln for batch in _batches(20) for ln in batch][-len(lines):]
+    spool.close()
+
+
+def test_backlog_with_other_precision_is_refused(tmp_path):
+    spool = Spool(_cfg(tmp_path), precision="ns")
+    spool.append(["m v=1i 1000000000"])
+    spool.close()
+    with pytest.raises(ValueError, match="precision ns"):
+        Spool(_cfg(tmp_path), precision="ms")
+
+
+def test_drain_retries_transient_errors_until_empty(tmp_path):
+    spool = Spool(_cfg(tmp_path))
+    for batch in _batches(5):
+        spool.append(batch)
+    writer = _Writer(fail=2)
+    drainer = SpoolDrainer(spool, writer, bulk_max_lines=20)
+    assert asyncio.run(drainer.drain(timeout=10.0)) is True
+    assert writer.lines == [ln for batch in _batches(5) for ln in batch]
+    assert drainer.failed_attempts == 2
+    assert spool.backlog()[0] == 0
+    spool.close()
+
+
+def test_drain_keeps_backlog_when_influx_stays_down(tmp_path):
+    spool = Spool(_cfg(tmp_path))
+    spool.append(["m v=1i 1"])
+    drainer = SpoolDrainer(spool, _Writer(fail=10**9), bulk_max_lines=20)
+    assert asyncio.run(drainer.drain(timeout=0.8)) is False
+    assert drainer.failed_attempts >= 2
+    assert spool.backlog()[0] > 0
+    spool.close()
+
+
+def test_drain_drops_permanently_rejected_lines(tmp_path):
+    spool = Spool(_cfg(tmp_path))
+    spool.append(["m v=1i 1"])
+    drainer = SpoolDrainer(spool, _Writer(fail=1, status=400), bulk_max_lines=20)
+    assert asyncio.run(drainer.drain(timeout=10.0)) is True
+    assert spool.dropped_lines == 1
+    spool.close()
@@ -0,0 +1,105 @@
+"""RFC3339 parsing against datetime, including the second/hour caches."""
+
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tigo_ingest import timestamps
+from tigo_ingest.timestamps import parse_rfc3339_ns
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _expected(dt: datetime, frac: str) -> int:
+    # Integer arithmetic only: datetime's own timestamp() goes through a float.
+    d = dt - _EPOCH
+    ns = (d.days * 86400 + d.seconds) * 1_000_000_000
+    if frac:
+        ns += int(frac[:9].ljust(9, "0"))
+    return ns
+
+
+def _format(dt: datetime, frac: str, offset_min: int | None, style: str) -> str:
+    s = dt.strftime("%Y-%m-%dT%H:%M:%S") + (f".{frac}" if frac else "")
+    if offset_min is None:
+        return s
+    if offset_min == 0 and style in ("Z", "z"):
+        return s + style
+    sign = "+" if offset_min >= 0 else "-"
+    hh, mm = divmod(abs(offset_min), 60)
+    return s + (f"{sign}{hh:02d}:{mm:02d}" if style == ":" else f"{sign}{hh:02d}{mm:02d}")
+
+
+def _sample(rnd: random.Random) -> tuple[str, int]:
+    offset_min = rnd.choice((None, 0, 0, 60, 120, -300, 330, 345, -690, 14 * 60, -(12 * 60)))
+    style = rnd.choice(("Z", "z", ":", ":", "hhmm"))
+    if offset_min not in (None, 0) and style in ("Z", "z"):
+        style = ":"
+    tz = timezone.utc if offset_min is None else timezone(timedelta(minutes=offset_min))
+    local = datetime(2000, 1, 1) + timedelta(seconds=rnd.randrange(0, 100 * 365 * 86400))
+    frac = "".join(rnd.choice("0123456789") for _ in range(rnd.choice((0, 1, 3, 6, 9, 9, 9, 12))))
+    dt = local.replace(tzinfo=tz)
+    return _format(dt, frac, offset_min, style), _expected(dt, frac)
+
+
+@pytest.fixture(autouse=True)
+def _cold_caches():
+    timestamps._hour_cache.clear()
+    timestamps._second_cache.clear()
+    yield
+
+
+def test_random_timestamps_match_datetime():
+    rnd = random.Random(5)
+    samples = [_sample(rnd) for _ in range(20000)]
+    for s, ns in samples:
+        assert parse_rfc3339_ns(s) == ns, s
+    # Second pass hits the caches (and the evictions of the first pass).
+    for s, ns in samples:
+        assert parse_rfc3339_ns(s) == ns, s
+
+
+def test_bursts_across_second_hour_midnight_and_year_rollover():
+    rnd = random.Random(9)
+    for start in ("2026-10-17T09:59:58", "2026-10-17T23:59:58", "2024-02-28T23:59:58", "2026-12-31T23:59:58"):
+        t0 = datetime.fromisoformat(start).replace(tzinfo=timezone.utc)
+        ns = _expected(t0, "")
+        for offset_min in (None, 0, 120, -330):
+            tz = timezone.utc if offset_min is None else timezone(timedelta(minutes=offset_min))
+            step = 0
+            while step < 5 * 1_000_000_000:
+                dt = datetime.fromtimestamp((ns + step) // 1_000_000_000, tz)
+                frac = f"{(ns + step) % 1_000_000_000:09d}"
+                s = _format(dt, frac, offset_min, "Z" if offset_min == 0 else ":")
+                assert parse_rfc3339_ns(s) == ns + step, s
+                step += rnd.randrange(1, 200_000_000)
+
+
+def test_same_second_with_different_offsets_does_not_share_a_cache_entry():
+    assert parse_rfc3339_ns("2026-10-17T10:00:00Z") == parse_rfc3339_ns("2026-10-17T12:00:00+02:00")
+    assert parse_rfc3339_ns("2026-10-17T10:00:00+02:00") == parse_rfc3339_ns("2026-10-17T08:00:00Z")
+    assert parse_rfc3339_ns("2026-10-17T10:00:00") == parse_rfc3339_ns("2026-10-17T10:00:00Z")
+    assert parse_rfc3339_ns("2026-10-17T10:00:00.5+0200") == parse_rfc3339_ns("2026-10-17T08:00:00.5Z")
+
+
+@pytest.mark.parametrize(
+    "s",
+    [
+        "2026-02-29T00:00:00Z",
+        "2026-10-17T24:00:00Z",
+        "2026-10-17T10:60:00Z",
+        "2026-10-17T10:00:60Z",
+        "2026-10-17T10:00:00.Z",
+        "2026-10-17T10:00:00,5Z",
+        "2026-10-17T10:00:00+24:00",
+        "2026-10-17T10:00:00+02:60",
+        "2026/10/17T10:00:00Z",
+        "2026-10-17",
+    ],
+)
+def test_invalid_timestamps_raise(s):
+    with pytest.raises(ValueError):
+        parse_rfc3339_ns(s)
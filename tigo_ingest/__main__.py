@@ -1,17 +1,44 @@
 from __future__ import annotations
 
+import argparse
 import asyncio
-import json
+import functools
 import logging
 import os
 import shlex
+import signal
 import sys
 import time
+from dataclasses import replace
 
 from dotenv import load_dotenv
 
-from .influx import InfluxConfig, InfluxWriter, line_protocol
-from .taptap_reader import parse_power_report, parse_taptap_event
+from .bulkimport import main as bulk_import
+from .capture import CaptureConfig, CaptureWriter
+from .deadband import DeadbandConfig, DeadbandFilter
+from .decoder import DecodeError, make_decoder
+from .energy import EnergyConfig, EnergyIntegrator
+from .health import HealthConfig, HealthState
+from .influx import InfluxConfig, InfluxWriter, PowerReportEncoder, WireConfig, sort_lines
+from .linkstats import LinkStats, LinkStatsConfig
+from .metrics import IngestMetrics, Metric, MetricsConfig, MetricsServer, Value
+from .pipeline import FlushController, IngestPipeline, PipelineConfig
+from .rollups import RollupConfig, RollupEngine
+from .schema import SchemaConfig, SeriesGuard, apply_wire, load_schema
+from .schema import main as schema_report
+from .sinks import make_sinks, parse_sinks
+from .sources import (
+    Backoff,
+    ReplaySource,
+    RestartPolicy,
+    SourceInput,
+    TaptapProcessSource,
+    open_source,
+    parse_sources,
+)
+from .spool import Spool, SpoolConfig, SpoolDrainer
+from .timestamps import parse_rfc3339_ns
+from .topology import TopologyConfig, TopologyRegistry
 
 
 def _setup_logging(level: str) -> None:
@@ -21,145 +48,558 @@ def _setup_logging(level: str) -> None:
     )
 
 
-async def _run(taptap_cmd: list[str]) -> int:
+async def _run(inputs: list[SourceInput]) -> int:
     log = logging.getLogger("tigo_ingest")
 
-    proc = await asyncio.create_subprocess_exec(
-        *taptap_cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    assert proc.stdout is not None
-    assert proc.stderr is not None
-
-    async def _stderr_logger():
-        while True:
-            b = await proc.stderr.readline()
-            if not b:
-                return
-            log.warning("taptap stderr: %s", b.decode(errors="replace").rstrip())
-
-    stderr_task = asyncio.create_task(_stderr_logger())
+    # Optional Prometheus /metrics endpoint; counters are bound up front so the read loop stays cheap.
+    metrics_cfg = MetricsConfig.from_env()
+    metrics = IngestMetrics() if metrics_cfg.listen else None
+
+    # Outputs: the primary Influx writer (spooled) plus optional queued sinks fed next to it.
+    sink_names = parse_sinks(os.getenv("TIGO_SINKS", "influx"))
+    if not sink_names:
+        raise ValueError("TIGO_SINKS is empty, nothing would be written")
+    sinks = make_sinks(sink_names)
+    line_sinks = [s for s in sinks if s.kind == "lines"]
+    report_sinks = [s for s in sinks if s.kind == "reports"]
+    for s in sinks:
+        s.start()
+    if sinks:
+        log.info("Sinks: %s", ", ".join(sink_names))
+
+    # Health state file for scripts/tigo_healthcheck.py (no Influx query needed while the daemon runs).
+    health_cfg = HealthConfig.from_env()
+    health = HealthState(health_cfg) if health_cfg.path else None
+
+    # Timestamp precision, field whitelist/rounding and sorted batches (TIGO_WIRE_*).
+    wire = WireConfig.from_env()
+    if wire.compact:
+        log.info("Wire format: %s", wire.describe())
 
     influx_cfg = InfluxConfig.from_env()
-    influx = InfluxWriter(influx_cfg)
-
-    batch: list[str] = []
-    batch_max = int(os.getenv("INFLUX_BATCH_MAX", "250"))
-    batch_flush_s = float(os.getenv("INFLUX_BATCH_FLUSH_S", "2.0"))
-    last_flush = time.monotonic()
-
-    async def _flush_if_needed(force: bool = False) -> None:
-        nonlocal last_flush, batch
-        now = time.monotonic()
-        if not force and len(batch) < batch_max and (now - last_flush) < batch_flush_s:
-            return
-        if not batch:
-            last_flush = now
-            return
-        lines = batch
-        batch = []
-        last_flush = now
-        await asyncio.to_thread(influx.write_lines, lines)
-
-    try:
+    influx = InfluxWriter(influx_cfg) if "influx" in sink_names else None
+    if influx is not None:
+        hooks = [h.on_write for h in (metrics, health) if h is not None]
+        if len(hooks) == 1:
+            influx.on_result = hooks[0]
+        elif hooks:
+
+            def _on_result(status: int, latency_s: float, points: int) -> None:
+                for h in hooks:
+                    h(status, latency_s, points)
+
+            influx.on_result = _on_result
+    pipe_cfg = PipelineConfig.from_env()
+
+    # Every batch goes through the on-disk spool first; the drainer replays it to Influx,
+    # so an Influx outage shows up as catch-up lag instead of lost points.
+    spool_cfg = SpoolConfig.from_env()
+    spool: Spool | None = None
+    drainer: SpoolDrainer | None = None
+    drainer_task: asyncio.Task | None = None
+    if spool_cfg.dir and influx is not None:
+        spool = Spool(spool_cfg, precision=wire.precision)
+        drainer = SpoolDrainer(
+            spool,
+            influx,
+            spool_cfg.bulk_max_lines,
+            concurrency=pipe_cfg.write_concurrency,
+            controller=FlushController.for_spool(pipe_cfg, spool_cfg.bulk_max_lines),
+        )
+        backlog_bytes, backlog_segments = spool.backlog()
+        if backlog_bytes:
+            log.info("Spool: replaying backlog of %d bytes in %d segment(s) from %s", backlog_bytes, backlog_segments, spool.dir)
+        drainer_task = asyncio.create_task(drainer.run())
+
+    async def _write_batch(lines: list[str]) -> None:
+        if wire.sort:
+            sort_lines(lines)
+        # Queued sinks only take a reference to the batch; they never block the primary path.
+        for s in line_sinks:
+            s.offer_many(lines)
+        if spool is not None and drainer is not None:
+            await asyncio.to_thread(spool.append, lines)
+            drainer.notify()
+        elif influx is not None:
+            await asyncio.to_thread(influx.write_lines, lines)
+
+    # Which attributes become tags/fields (TIGO_SCHEMA_FILE); new series are counted against TIGO_SERIES_MAX.
+    schema_cfg = SchemaConfig.from_env()
+    schema = apply_wire(load_schema(schema_cfg.path), wire.fields, wire.round)
+    if not schema.is_default:
+        log.info("Point schema %s:\n%s", schema.path, schema.describe())
+
+    decoder = make_decoder(hex_addresses=schema.hex_addresses)
+    log.info("Using %s JSON decoder", decoder.name)
+    guard = SeriesGuard(schema_cfg.series_max, schema_cfg.series_action)
+    encoder = PowerReportEncoder(
+        influx_cfg.measurement,
+        cache_size=int(os.getenv("TIGO_SERIES_CACHE_MAX", "4096")),
+        schema=schema,
+        guard=guard,
+        precision=wire.precision,
+    )
+    pipeline = IngestPipeline(
+        # Batches only go to local disk with the spool; the drainer's controller adapts to Influx instead.
+        replace(pipe_cfg, adaptive=False) if drainer is not None else pipe_cfg,
+        encode=encoder.encode,
+        write_batch=_write_batch,
+        spill=_write_batch if spool is not None else None,
+        on_flush=metrics.on_flush if metrics is not None else None,
+    )
+    pipeline_task = asyncio.create_task(pipeline.run())
+    # Sizes the requests that actually reach Influx.
+    write_ctl = drainer.controller if drainer is not None else pipeline.controller
+
+    # Streaming 1m/15m/1h rollups, written as their own measurements when a window closes.
+    rollup_cfg = RollupConfig.from_env(influx_cfg.measurement)
+    rollups = RollupEngine(rollup_cfg, precision=wire.precision) if rollup_cfg.resolutions else None
+    rollup_task: asyncio.Task | None = None
+    if rollups is not None and rollup_cfg.path:
+        rollups.load()
+
+    async def _rollup_collector():
+        assert rollups is not None
         while True:
-            b = await proc.stdout.readline()
-            if not b:
-                break
-
-            line = b.decode(errors="replace").strip()
-            if not line:
-                continue
-
-            try:
-                event_type, payload = parse_taptap_event(line)
-            except Exception:
-                log.exception("Failed to parse event line: %r", line[:4000])
-                continue
-
-            if event_type != "power_report":
-                continue
+            await asyncio.sleep(5.0)
+            for ln in rollups.collect():
+                await pipeline.put(ln)
+
+    if rollups is not None:
+        rollup_task = asyncio.create_task(_rollup_collector())
+
+    # Per node/gateway kWh counters integrated from the stream, persisted across restarts.
+    energy_cfg = EnergyConfig.from_env(influx_cfg.measurement)
+    energy = EnergyIntegrator(energy_cfg, precision=wire.precision) if energy_cfg.enabled else None
+    energy_task: asyncio.Task | None = None
+    if energy is not None:
+        if energy_cfg.path:
+            energy.load()
+        energy_task = asyncio.create_task(energy.run(pipeline.put))
+
+    # Per node link quality sketches (RSSI, temperature, report spacing), served as JSON.
+    linkstats_cfg = LinkStatsConfig.from_env()
+    linkstats = LinkStats(linkstats_cfg) if linkstats_cfg.enabled else None
+    linkstats_task: asyncio.Task | None = None
+    if linkstats is not None and linkstats_cfg.path:
+        linkstats.load()
+        linkstats_task = asyncio.create_task(linkstats.run_snapshots())
+
+    # Gateway/node addresses, barcodes and string names from infrastructure events, persisted across restarts.
+    topology_cfg = TopologyConfig.from_env()
+    topology = TopologyRegistry(topology_cfg, schema.hex_addresses) if topology_cfg.enabled else None
+    topology_task: asyncio.Task | None = None
+    if topology is not None and topology_cfg.path:
+        topology.load()
+        topology_task = asyncio.create_task(topology.run())
+
+    # Drops near-identical reports (deadband + heartbeat) before they are encoded.
+    deadband_cfg = DeadbandConfig.from_env()
+    deadband = DeadbandFilter(deadband_cfg) if deadband_cfg.enabled else None
+
+    # Overlong / non-UTF-8 lines are dropped by each source's line splitter.
+    splitters = [inp.source.splitter for inp in inputs]
+
+    stats_interval_s = float(os.getenv("TIGO_STATS_INTERVAL_S", "60"))
+
+    async def _stats_logger():
+        while True:
+            await asyncio.sleep(stats_interval_s)
+            spool_bytes = spool.backlog()[0] if spool is not None else 0
+            log.info(
+                "Stats: queue=%d/%d inflight=%d batches=%d batch_target=%d write_ms=%.0f dropped=%d spilled=%d write_errors=%d spool_backlog=%dB",
+                pipeline.depth,
+                pipe_cfg.queue_max,
+                pipeline.inflight,
+                pipeline.batches,
+                write_ctl.target,
+                write_ctl.latency_ewma_s * 1000,
+                pipeline.dropped,
+                pipeline.spilled,
+                pipeline.write_errors,
+                spool_bytes,
+            )
+            if rollups is not None:
+                log.info(
+                    "Stats: rollups emitted=%d late_dropped=%d future_dropped=%d",
+                    rollups.emitted,
+                    rollups.late_dropped,
+                    rollups.future_dropped,
+                )
+            if energy is not None:
+                log.info("Stats: energy nodes=%d intervals=%d gaps=%d emitted=%d", len(energy), energy.intervals, energy.gaps, energy.emitted)
+            for s in sinks:
+                log.info(
+                    "Stats: sink %s queued=%d sent=%d dropped=%d failed=%d retries=%d",
+                    s.name,
+                    s.depth,
+                    s.sent,
+                    s.dropped,
+                    s.failed,
+                    s.retries,
+                )
+            overlong = sum(sp.overlong for sp in splitters)
+            invalid_utf8 = sum(sp.invalid_utf8 for sp in splitters)
+            if overlong or invalid_utf8:
+                log.info("Stats: lines skipped overlong=%d invalid_utf8=%d", overlong, invalid_utf8)
+            if encoder.refused:
+                log.info("Stats: series refused=%d points_refused=%d", guard.refused_series, encoder.refused)
+            if topology is not None:
+                log.info("Stats: topology nodes=%d events=%d enriched=%d", len(topology), topology.events, topology.enriched)
+            if deadband is not None:
+                log.info(
+                    "Stats: deadband passed=%d suppressed=%d forced_state=%d heartbeats=%d",
+                    deadband.passed,
+                    deadband.suppressed,
+                    deadband.forced_state,
+                    deadband.heartbeats,
+                )
 
+    stats_task = asyncio.create_task(_stats_logger()) if stats_interval_s > 0 else None
+
+    metrics_server: MetricsServer | None = None
+    lag_task: asyncio.Task | None = None
+    node_reports: Metric | None = None
+    if metrics is not None:
+        r = metrics.registry
+        node_reports = r.counter("tigo_reports_total", "Decoded power reports", ("source", "gateway_id", "node_id"))
+        r.gauge_fn("tigo_queue_depth", "Items waiting in the ingest queue", lambda: pipeline.depth)
+        r.gauge_fn("tigo_queue_capacity", "Ingest queue capacity (TIGO_QUEUE_MAX)", lambda: pipe_cfg.queue_max)
+        r.gauge_fn("tigo_writes_inflight", "Batch writes in flight", lambda: pipeline.inflight)
+        r.counter_fn("tigo_queue_dropped_total", "Items dropped by the overflow policy", lambda: pipeline.dropped)
+        r.counter_fn("tigo_queue_spilled_total", "Items spilled past the queue", lambda: pipeline.spilled)
+        r.counter_fn("tigo_batch_write_errors_total", "Batches that failed to write", lambda: pipeline.write_errors)
+        r.counter_fn(
+            "tigo_lines_skipped_total",
+            "Input lines skipped before decoding",
+            lambda: [
+                (("overlong",), sum(sp.overlong for sp in splitters)),
+                (("invalid_utf8",), sum(sp.invalid_utf8 for sp in splitters)),
+            ],
+            ("reason",),
+        )
+        r.gauge_fn("tigo_batch_target", "Adaptive Influx request size (batch, or spool bulk with the spool)", lambda: write_ctl.target)
+        r.gauge_fn("tigo_batch_write_seconds_ewma", "Smoothed Influx write latency", lambda: write_ctl.latency_ewma_s)
+        if spool is not None:
+            r.gauge_fn("tigo_spool_backlog_bytes", "Undelivered bytes in the spool", lambda: spool.backlog()[0])
+            r.gauge_fn("tigo_spool_backlog_segments", "Spool segments with undelivered data", lambda: spool.backlog()[1])
+            r.counter_fn("tigo_spool_dropped_lines_total", "Lines dropped by spool caps", lambda: spool.dropped_lines)
+        if rollups is not None:
+            r.counter_fn("tigo_rollup_points_total", "Rollup points emitted", lambda: rollups.emitted)
+            r.counter_fn("tigo_rollup_late_total", "Reports too late for their rollup window", lambda: rollups.late_dropped)
+            r.counter_fn("tigo_rollup_future_total", "Reports dropped by rollups for a timestamp too far ahead", lambda: rollups.future_dropped)
+        r.gauge_fn("tigo_series", "Distinct series written per measurement", lambda: [((m,), n) for m, n in guard.series().items()], ("measurement",))
+        r.counter_fn("tigo_series_refused_points_total", "Points dropped because their series exceeded TIGO_SERIES_MAX", lambda: encoder.refused)
+        if energy is not None:
+            r.counter_fn("tigo_energy_gaps_total", "Report intervals skipped as gaps by the energy integration", lambda: energy.gaps)
+        if topology is not None:
+            r.gauge_fn("tigo_topology_nodes", "Nodes known to the topology registry", lambda: len(topology))
+            r.counter_fn("tigo_topology_enriched_total", "Report fields filled from the topology registry", lambda: topology.enriched)
+        if deadband is not None:
+            r.counter_fn("tigo_deadband_suppressed_total", "Reports suppressed by the deadband filter", lambda: deadband.suppressed)
+        if sinks:
+            r.gauge_fn("tigo_sink_queue_depth", "Items queued per sink", lambda: [((s.name,), s.depth) for s in sinks], ("sink",))
+            r.counter_fn("tigo_sink_sent_total", "Items sent per sink", lambda: [((s.name,), s.sent) for s in sinks], ("sink",))
+            r.counter_fn(
+                "tigo_sink_dropped_total",
+                "Items dropped per sink (queue full or rejected)",
+                lambda: [((s.name,), s.dropped + s.failed) for s in sinks],
+                ("sink",),
+            )
+            r.counter_fn("tigo_sink_retries_total", "Failed send attempts per sink", lambda: [((s.name,), s.retries) for s in sinks], ("sink",))
+        metrics_server = MetricsServer(r, metrics_cfg.listen)
+        if linkstats is not None and linkstats_cfg.listen in ("", metrics_cfg.listen):
+            metrics_server.add_route("/linkstats", linkstats.render)
+        await metrics_server.start()
+        lag_task = asyncio.create_task(metrics.monitor_loop_lag(metrics_cfg.loop_lag_interval_s))
+
+    async def _consume(inp: SourceInput) -> int:
+        # One reader per source; all of them feed the shared decoder, rollups and pipeline.
+        # Restarts happen in here, so writer, caches and pending batches stay warm.
+        tag = inp.tag
+        capture = inp.capture
+        src_health = health.source(inp.label) if health is not None else None
+        policy = inp.restart
+        backoff = Backoff(policy) if policy is not None else None
+        precheck = getattr(inp.source, "precheck", None)
+        on_event = functools.partial(topology.observe_event, tag) if topology is not None else None
+        # tigo_reports_total cells of this source per (gateway_id, node_id), bound on a node's first report.
+        report_cells: dict[tuple[int, int], Value] = {}
+        while True:
+            if policy is not None and backoff is not None and precheck is not None:
+                err = await precheck(policy.precheck_timeout_s)
+                if err is not None:
+                    delay = backoff.next_delay()
+                    log.error("Source %s: %s, retrying in %.1fs", inp.label, err, delay)
+                    await asyncio.sleep(delay)
+                    continue
+            started = time.monotonic()
+            failed = False
             try:
-                pr = parse_power_report(payload)
+                async for batch in inp.source.batches():
+                    if metrics is not None:
+                        metrics.lines_read.inc(len(batch))
+                    for raw in batch:
+                        if capture is not None:
+                            capture.write(raw)
+
+                        try:
+                            pr = decoder.decode(raw, on_event)
+                        except DecodeError as e:
+                            if metrics is not None:
+                                metrics.parse_failures[e.kind].inc()
+                            if e.kind == "payload":
+                                log.exception("Failed to parse power_report payload: %r", raw[:4000])
+                            else:
+                                log.exception("Failed to parse event line: %r", raw[:4000])
+                            continue
+
+                        if pr is None:
+                            continue
+                        if tag is not None:
+                            pr.source = tag
+                        if topology is not None:
+                            topology.enrich(pr)
+                        if node_reports is not None:
+                            cell = report_cells.get((pr.gateway_id, pr.node_id))
+                            if cell is None:
+                                cell = report_cells[(pr.gateway_id, pr.node_id)] = node_reports.labels(
+                                    tag or "", pr.gateway_id, pr.node_id
+                                )
+                            cell.value += 1
+                        if src_health is not None:
+                            src_health.reports += 1
+                            src_health.last_event_ns = pr.timestamp_ns
+
+                        if capture is not None:
+                            capture.note_event(pr.timestamp_ns)
+                        if rollups is not None:
+                            rollups.observe(pr)
+                        if energy is not None:
+                            energy.observe(pr)
+                        if linkstats is not None:
+                            linkstats.observe(pr)
+                        for s in report_sinks:
+                            s.offer(pr)
+                        # Rollups see every report; the deadband only thins out the raw measurement.
+                        if deadband is not None and not deadband.accept(pr):
+                            continue
+                        await pipeline.put(pr)
             except Exception:
-                log.exception("Failed to parse power_report payload: %s", json.dumps(payload)[:4000])
-                continue
-
-            power_w = pr.voltage_in * pr.current
-            current_out = None
-            if pr.voltage_out not in (0.0, -0.0):
-                current_out = power_w / pr.voltage_out
-
-            tags = {
-                "src": "tigo",
-                "gateway_id": str(pr.gateway_id),
-                "node_id": str(pr.node_id),
-            }
-            if pr.gateway_address is not None:
-                tags["gateway_addr"] = str(pr.gateway_address)
-            if pr.node_address is not None:
-                tags["node_addr"] = str(pr.node_address)
-            if pr.node_barcode:
-                tags["barcode"] = pr.node_barcode
-
-            fields = {
-                "voltage_in_v": pr.voltage_in,
-                "voltage_out_v": pr.voltage_out,
-                "current_in_a": pr.current,
-                "power_w": power_w,
-                "current_out_a": current_out,
-                "duty_cycle": pr.duty_cycle,
-                "temperature_c": pr.temperature,
-                "rssi": pr.rssi,
-            }
-
-            batch.append(
-                line_protocol(
-                    measurement=influx_cfg.measurement,
-                    tags=tags,
-                    fields=fields,
-                    timestamp=pr.timestamp,  # use measurement time from payload
-                )
+                if backoff is None:
+                    raise
+                log.exception("Source %s failed", inp.label)
+                failed = True
+            finally:
+                rc = await inp.source.close()
+            if backoff is None:
+                return rc
+            if policy.mode == "on-failure" and not failed and rc == 0:
+                log.info("Source %s finished (rc=0)", inp.label)
+                return rc
+            if time.monotonic() - started >= policy.reset_after_s:
+                backoff.reset()
+            delay = backoff.next_delay()
+            log.warning("Source %s exited (rc=%s), restarting in %.1fs", inp.label, rc, delay)
+            await asyncio.sleep(delay)
+
+    linkstats_server: MetricsServer | None = None
+    if linkstats is not None and linkstats_cfg.listen and (metrics_server is None or linkstats_cfg.listen != metrics_cfg.listen):
+        linkstats_server = MetricsServer(None, linkstats_cfg.listen)
+        linkstats_server.add_route("/linkstats", linkstats.render)
+        await linkstats_server.start()
+
+    health_task: asyncio.Task | None = None
+    if health is not None:
+        health.add_section(
+            "pipeline",
+            lambda: {
+                "queue": pipeline.depth,
+                "inflight": pipeline.inflight,
+                "dropped": pipeline.dropped,
+                "write_errors": pipeline.write_errors,
+                "batch_target": write_ctl.target,
+            },
+        )
+        if spool is not None:
+            health.add_section(
+                "spool",
+                lambda: {
+                    "backlog_bytes": spool.backlog()[0],
+                    "backlog_segments": spool.backlog()[1],
+                    "dropped_lines": spool.dropped_lines,
+                    "failed_attempts": drainer.failed_attempts if drainer is not None else 0,
+                },
+            )
+        if sinks:
+            health.add_section(
+                "sinks",
+                lambda: {s.name: {"queued": s.depth, "sent": s.sent, "dropped": s.dropped + s.failed, "retries": s.retries} for s in sinks},
             )
-            await _flush_if_needed()
+        health_task = asyncio.create_task(health.run())
 
-        await _flush_if_needed(force=True)
+    consumers = [asyncio.create_task(_consume(inp)) for inp in inputs]
+    try:
+        rcs = await asyncio.gather(*consumers)
     finally:
-        stderr_task.cancel()
-        try:
-            await stderr_task
-        except Exception:
-            pass
-        if proc.returncode is None:
-            proc.terminate()
+        for t in consumers:
+            t.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        if rollup_task is not None and rollups is not None:
+            rollup_task.cancel()
+            for ln in rollups.collect():
+                await pipeline.put(ln)
+            # Still open windows are saved for the next start; written now as partial
+            # points, the rest of the window would overwrite them after the restart.
+            saved = False
+            if rollup_cfg.path:
+                try:
+                    rollups.save()
+                    saved = True
+                except OSError as e:
+                    log.warning("Rollups: cannot write %s: %s", rollup_cfg.path, e)
+            if not saved:
+                for ln in rollups.collect(final=True):
+                    await pipeline.put(ln)
+        if energy_task is not None and energy is not None:
+            energy_task.cancel()
+            await energy.flush(pipeline.put)
+        await pipeline.close(pipeline_task)
+        if stats_task is not None:
+            stats_task.cancel()
+        if lag_task is not None:
+            lag_task.cancel()
+        if health_task is not None and health is not None:
+            health_task.cancel()
+            health.remove()
+        if metrics_server is not None:
+            await metrics_server.close()
+        if linkstats_server is not None:
+            await linkstats_server.close()
+        if linkstats is not None and linkstats_cfg.path:
+            if linkstats_task is not None:
+                linkstats_task.cancel()
+            try:
+                linkstats.snapshot()
+            except OSError as e:
+                log.warning("LinkStats: cannot write snapshot %s: %s", linkstats_cfg.path, e)
+        if topology is not None and topology_cfg.path:
+            if topology_task is not None:
+                topology_task.cancel()
+            if topology.dirty:
+                try:
+                    topology.save()
+                except OSError as e:
+                    log.warning("Topology: cannot write %s: %s", topology_cfg.path, e)
+        if drainer_task is not None and drainer is not None and spool is not None:
+            drainer_task.cancel()
             try:
-                await asyncio.wait_for(proc.wait(), timeout=10)
-            except asyncio.TimeoutError:
-                proc.kill()
-                await proc.wait()
+                await drainer_task
+            except asyncio.CancelledError:
+                pass
+            # Best effort: push what is left; anything undelivered stays on disk for the next start.
+            await drainer.drain(timeout=float(os.getenv("TIGO_SPOOL_DRAIN_TIMEOUT_S", "10")))
+            spool.close()
+        if influx is not None:
+            influx.close()
+        sink_timeout = float(os.getenv("TIGO_SINK_CLOSE_TIMEOUT_S", "5"))
+        await asyncio.gather(*(s.close(sink_timeout) for s in sinks))
+        for inp in inputs:
+            if inp.capture is not None:
+                inp.capture.close()
+
+    return next((rc for rc in rcs if rc), 0)
+
+
+async def _serve(inputs: list[SourceInput]) -> int:
+    # SIGTERM (systemd stop) / SIGINT cancel _run, whose cleanup flushes batches, rollups and the spool.
+    task = asyncio.current_task()
+    assert task is not None
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        return await _run(inputs)
+    except asyncio.CancelledError:
+        logging.getLogger("tigo_ingest").info("Shutdown complete")
+        return 0
+
+
+def _parse_speed(s: str) -> float:
+    if s.strip().lower() in ("max", "0"):
+        return 0.0
+    v = float(s.rstrip("xX"))
+    if v <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return v
 
-    return proc.returncode or 0
 
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
 
-def main() -> int:
     # Avoid python-dotenv's find_dotenv() heuristics (can assert in some contexts).
     load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"))
 
     _setup_logging(os.getenv("LOG_LEVEL", "INFO"))
 
+    if argv[:1] == ["import"]:
+        return bulk_import(argv[1:])
+    if argv[:1] == ["schema"]:
+        return schema_report(argv[1:])
+
+    ap = argparse.ArgumentParser(
+        prog="tigo_ingest",
+        description="taptap -> InfluxDB ingest",
+        epilog="Bulk import of archived JSONL/captures: python -m tigo_ingest import --help; "
+        "series a point schema would create: python -m tigo_ingest schema --help",
+    )
+    ap.add_argument(
+        "--replay",
+        nargs="+",
+        metavar="PATH",
+        help="read events from capture dirs/segments, JSONL files or '-' (stdin) instead of TAPTAP_CMD",
+    )
+    ap.add_argument("--speed", type=_parse_speed, default=0.0, help="replay speed: 1 = real time, 10 = 10x, max (default)")
+    ap.add_argument("--since", type=parse_rfc3339_ns, help="replay only events at/after this RFC3339 time")
+    ap.add_argument("--until", type=parse_rfc3339_ns, help="replay only events before this RFC3339 time")
+    args = ap.parse_args(argv)
+
+    if args.replay:
+        source = ReplaySource(args.replay, speed=args.speed, since_ns=args.since, until_ns=args.until)
+        # Never re-capture a replay.
+        return asyncio.run(_serve([SourceInput(source)]))
+
+    capture_cfg = CaptureConfig.from_env()
+    restart: RestartPolicy | None = RestartPolicy.from_env()
+    if restart.mode == "never":
+        restart = None
+
+    sources_s = os.getenv("TAPTAP_SOURCES", "").strip()
+    if sources_s:
+        # Several buses/bridges in one process; each is tagged `source=<name>` and restarted on its own.
+        inputs = []
+        for spec in parse_sources(sources_s):
+            capture = None
+            if capture_cfg.dir and not spec.is_replay:
+                capture = CaptureWriter(replace(capture_cfg, dir=os.path.join(capture_cfg.dir, spec.name)))
+            inputs.append(
+                SourceInput(open_source(spec), tag=spec.name, capture=capture, restart=None if spec.is_replay else restart)
+            )
+        return asyncio.run(_serve(inputs))
+
     taptap_cmd_s = os.getenv("TAPTAP_CMD", "").strip()
     if not taptap_cmd_s:
         print(
-            "Missing TAPTAP_CMD. Example: TAPTAP_CMD='taptap observe --tcp 192.168.2.30 --port 7160'",
+            "Missing TAPTAP_CMD (or TAPTAP_SOURCES). Example: TAPTAP_CMD='taptap observe --tcp 192.168.2.30 --port 7160'",
             file=sys.stderr,
         )
         return 2
 
     taptap_cmd = shlex.split(taptap_cmd_s)
 
-    return asyncio.run(_run(taptap_cmd))
+    capture = CaptureWriter(capture_cfg) if capture_cfg.dir else None
+
+    return asyncio.run(_serve([SourceInput(TaptapProcessSource(taptap_cmd), capture=capture, restart=restart)]))
 
 
 if __name__ == "__main__":
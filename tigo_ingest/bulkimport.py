@@ -0,0 +1,497 @@
+from __future__ import annotations
+
+import argparse
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from .capture import capture_segments, open_capture
+from .decoder import DecodeError, make_decoder
+from .influx import InfluxConfig, InfluxWriter, PowerReportEncoder, WireConfig, is_permanent_error, sort_lines
+from .linesplit import LineSplitter, max_line_from_env
+from .schema import PointSchema, SchemaConfig, apply_wire, load_schema
+from .statefile import atomic_write_json, load_json
+from .timestamps import parse_rfc3339_ns
+from .topology import TopologyConfig, TopologyRegistry
+
+
+log = logging.getLogger(__name__)
+
+_CHECKPOINT_VERSION = 1
+_READ_CHUNK = 1 << 20
+_COMPRESSED = (".gz", ".zst")
+
+
+@dataclass(frozen=True)
+class Shard:
+    """A byte range `[start, end)` of one input file; lines belong to the shard their first byte is in.
+
+    Compressed files cannot be split and form a single shard with `end = -1`
+    (offsets then count decompressed bytes). `resume` is where a previous run
+    stopped (always a line start).
+    """
+
+    id: int
+    path: str
+    start: int
+    end: int
+    resume: int
+
+    @property
+    def compressed(self) -> bool:
+        return self.end < 0
+
+
+@dataclass(frozen=True)
+class _WorkerOptions:
+    measurement: str
+    body_points: int
+    max_line: int
+    since_ns: int | None
+    until_ns: int | None
+    source: str | None
+    schema: PointSchema
+    wire: WireConfig
+    topology: TopologyConfig | None
+
+
+def _input_files(paths: list[str]) -> list[str]:
+    out: list[str] = []
+    for p in paths:
+        if Path(p).is_dir():
+            out.extend(str(s) for s in capture_segments(p))
+        else:
+            out.append(p)
+    return [os.path.abspath(p) for p in out]
+
+
+def plan_shards(paths: list[str], shard_bytes: int, checkpoint: dict) -> list[Shard]:
+    """Shards still to import; `checkpoint["files"]` is updated with the layout of new or changed files."""
+    files = checkpoint.setdefault("files", {})
+    shards: list[Shard] = []
+    for path in _input_files(paths):
+        st = os.stat(path)
+        entry = files.get(path)
+        if entry is not None and (entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns):
+            log.warning("Import: %s changed since the checkpoint, importing it again from the start", path)
+            entry = None
+        if entry is None:
+            if path.endswith(_COMPRESSED):
+                ranges = [(0, -1)]
+            else:
+                ranges = [(s, min(s + shard_bytes, st.st_size)) for s in range(0, st.st_size, shard_bytes)]
+            entry = files[path] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "shards": {str(s): {"end": e, "offset": s, "done": False} for s, e in ranges},
+            }
+        for start, sh in entry["shards"].items():
+            if not sh["done"]:
+                shards.append(Shard(len(shards), path, int(start), sh["end"], sh["offset"]))
+    return shards
+
+
+def _open_shard(shard: Shard):
+    """(file positioned at the shard's first line, stream position, end position or None)."""
+    if shard.compressed:
+        f = open_capture(shard.path)
+        pos = 0
+        while pos < shard.resume:
+            skipped = f.read(min(_READ_CHUNK, shard.resume - pos))
+            if not skipped:
+                break
+            pos += len(skipped)
+        return f, pos, None
+    f = open(shard.path, "rb")
+    pos = shard.resume
+    if pos > 0:
+        f.seek(pos - 1)
+        if f.read(1) != b"\n":
+            # The line crossing our start belongs to the previous shard.
+            pos += len(f.readline())
+    return f, pos, shard.end
+
+
+def _import_shard(
+    shard: Shard, opts: _WorkerOptions, decoder, encoder: PowerReportEncoder, topology: TopologyRegistry | None, results
+) -> dict:
+    decode = decoder.decode
+    encode = encoder.encode
+    on_event = functools.partial(topology.observe_event, opts.source) if topology is not None else None
+    since, until = opts.since_ns, opts.until_ns
+    stats = {"lines": 0, "points": 0, "decode_errors": 0, "other_events": 0, "outside_range": 0, "overlong": 0, "invalid_utf8": 0}
+    splitter = LineSplitter(opts.max_line, label=f"import {os.path.basename(shard.path)}")
+    out: list[str] = []
+
+    def _handle(lines: list[bytes]) -> None:
+        stats["lines"] += len(lines)
+        for raw in lines:
+            try:
+                pr = decode(raw, on_event)
+            except DecodeError:
+                stats["decode_errors"] += 1
+                continue
+            if pr is None:
+                stats["other_events"] += 1
+                continue
+            ts = pr.timestamp_ns
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                stats["outside_range"] += 1
+                continue
+            if opts.source:
+                pr.source = opts.source
+            if topology is not None:
+                topology.enrich(pr)
+            line = encode(pr)
+            if line is not None:
+                out.append(line)
+
+    def _emit(offset: int) -> None:
+        # One request body per message; `offset` is where the line after it starts.
+        if opts.wire.sort:
+            sort_lines(out)
+        stats["points"] += len(out)
+        results.put(("body", shard.id, offset, ("\n".join(out) + "\n").encode("utf-8"), len(out)))
+        out.clear()
+
+    f, pos, end = _open_shard(shard)
+    with f:
+        while end is None or pos < end:
+            try:
+                chunk = f.read(_READ_CHUNK if end is None else min(_READ_CHUNK, end - pos))
+            except (EOFError, OSError) as e:
+                log.warning("Import: truncated stream %s (%s), skipping the rest", shard.path, e)
+                break
+            if not chunk:
+                break
+            pos += len(chunk)
+            if end is not None and pos >= end and not chunk.endswith(b"\n"):
+                rest = f.readline()
+                chunk += rest
+                pos += len(rest)
+            _handle(splitter.feed(chunk))
+            if len(out) >= opts.body_points:
+                _emit(pos - splitter.pending)
+    _handle(splitter.finish())
+    if out:
+        _emit(pos)
+    stats["overlong"] = splitter.overlong
+    stats["invalid_utf8"] = splitter.invalid_utf8
+    return stats
+
+
+def _worker(tasks, results, opts: _WorkerOptions) -> None:
+    # The parent handles Ctrl-C/SIGTERM; terminate() must kill a worker outright,
+    # not unwind it into a join on its (full) result queue.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    decoder = make_decoder(hex_addresses=opts.schema.hex_addresses)
+    encoder = PowerReportEncoder(
+        opts.measurement,
+        cache_size=int(os.getenv("TIGO_SERIES_CACHE_MAX", "4096")),
+        schema=opts.schema,
+        precision=opts.wire.precision,
+    )
+    # Enrich like the daemon; the topology file is only read, each worker learns
+    # from the infrastructure events in its own shards on top of it.
+    topology = None
+    if opts.topology is not None:
+        topology = TopologyRegistry(opts.topology, opts.schema.hex_addresses)
+        if opts.topology.path:
+            topology.load()
+    while True:
+        shard = tasks.get()
+        if shard is None:
+            return
+        try:
+            stats = _import_shard(shard, opts, decoder, encoder, topology, results)
+        except Exception as e:
+            results.put(("error", shard.id, f"{type(e).__name__}: {e}"))
+            continue
+        results.put(("done", shard.id, stats))
+
+
+class _ShardProgress:
+    """Bodies of one shard in send order; the checkpoint only advances over a contiguous prefix of written ones."""
+
+    __slots__ = ("entry", "bodies", "finished", "failed")
+
+    def __init__(self, entry: dict) -> None:
+        self.entry = entry
+        # [offset, written, points] per body, oldest first.
+        self.bodies: list[list] = []
+        self.finished = False
+        self.failed = False
+
+    def advance(self) -> None:
+        i = 0
+        while i < len(self.bodies) and self.bodies[i][1]:
+            self.entry["offset"] = self.bodies[i][0]
+            i += 1
+        del self.bodies[:i]
+        if self.finished and not self.bodies and not self.failed:
+            self.entry["done"] = True
+
+
+class BulkImporter:
+    """Parallel import of taptap JSONL files and capture segments into Influx.
+
+    Input files are cut into byte-range shards (`shard_bytes`); `jobs` worker
+    processes decode and encode whole shards into line protocol bodies of about
+    `body_points` points, `writers` threads push the bodies to Influx (bounded
+    in-flight, transient errors retried with backoff). Per shard the offset up
+    to which everything has been written is kept in `checkpoint_path`, so an
+    interrupted import continues where it stopped; points are idempotent in
+    Influx, so lines written twice around a crash do no harm.
+    """
+
+    def __init__(
+        self,
+        paths: list[str],
+        checkpoint_path: str,
+        jobs: int,
+        writers: int,
+        shard_bytes: int,
+        opts: _WorkerOptions,
+        writer: InfluxWriter,
+        checkpoint_s: float = 5.0,
+    ) -> None:
+        self._paths = paths
+        self._checkpoint_path = checkpoint_path
+        self._jobs = max(1, jobs)
+        self._writers = max(1, writers)
+        self._shard_bytes = max(1 << 20, shard_bytes)
+        self._opts = opts
+        self._writer = writer
+        self._checkpoint_s = checkpoint_s
+        self._stopping = False
+
+        self.points_written = 0
+        self.points_rejected = 0
+        self.bytes_done = 0
+        self.retries = 0
+        self.stats: dict[str, int] = {}
+
+    def _save(self, checkpoint: dict) -> None:
+        atomic_write_json(self._checkpoint_path, checkpoint)
+
+    def _write(self, body: bytes, points: int) -> int:
+        # Runs in a writer thread; returns the number of accepted points.
+        delay = 1.0
+        while True:
+            try:
+                self._writer.write_body(body, points)
+                return points
+            except Exception as e:
+                if is_permanent_error(e):
+                    log.error("Import: Influx rejected %d points permanently, skipping them: %s", points, e)
+                    return 0
+                if self._stopping:
+                    raise
+                self.retries += 1
+                log.warning("Import: write failed (%s), retrying in %.0fs", e, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    def run(self) -> int:
+        checkpoint = load_json(self._checkpoint_path, default=None) or {}
+        if checkpoint.get("version") != _CHECKPOINT_VERSION:
+            checkpoint = {"version": _CHECKPOINT_VERSION}
+        shards = plan_shards(self._paths, self._shard_bytes, checkpoint)
+        self._save(checkpoint)
+        if not shards:
+            log.info("Import: nothing to do (all inputs done according to %s)", self._checkpoint_path)
+            return 0
+        total_bytes = sum((s.end - s.resume) for s in shards if not s.compressed)
+        log.info(
+            "Import: %d shard(s) from %d file(s), %.1f MB, %d worker(s), %d writer(s)",
+            len(shards),
+            len({s.path for s in shards}),
+            total_bytes / 1e6,
+            self._jobs,
+            self._writers,
+        )
+        progress = {s.id: _ShardProgress(checkpoint["files"][s.path]["shards"][str(s.start)]) for s in shards}
+
+        ctx = multiprocessing.get_context()
+        tasks = ctx.Queue()
+        # Bounded: workers block when the writers fall behind instead of buffering whole files.
+        results = ctx.Queue(maxsize=self._writers * 2)
+        for s in shards:
+            tasks.put(s)
+        jobs = min(self._jobs, len(shards))
+        for _ in range(jobs):
+            tasks.put(None)
+        procs = [ctx.Process(target=_worker, args=(tasks, results, self._opts), daemon=True) for _ in range(jobs)]
+        for p in procs:
+            p.start()
+
+        pool = ThreadPoolExecutor(max_workers=self._writers, thread_name_prefix="import-writer")
+        inflight: dict[Future, tuple[int, list, int]] = {}
+        remaining = len(shards)
+        failed = 0
+        t0 = last_save = last_log = time.monotonic()
+        interrupted = False
+        try:
+            while remaining or inflight:
+                for fut in [f for f in inflight if f.done()]:
+                    self._written(fut.result(), *inflight.pop(fut), progress)
+                if len(inflight) >= self._writers * 2:
+                    wait(list(inflight), timeout=1.0, return_when=FIRST_COMPLETED)
+                    continue
+                now = time.monotonic()
+                if now - last_save >= self._checkpoint_s:
+                    self._save(checkpoint)
+                    last_save = now
+                if now - last_log >= 10.0:
+                    self._log_progress(now - t0, len(shards) - remaining, len(shards))
+                    last_log = now
+                if not remaining:
+                    wait(list(inflight), timeout=1.0, return_when=FIRST_COMPLETED)
+                    continue
+                try:
+                    msg = results.get(timeout=0.2)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs) and results.empty():
+                        log.error("Import: all workers exited with %d shard(s) unfinished", remaining)
+                        failed += remaining
+                        remaining = 0
+                    continue
+                kind, shard_id = msg[0], msg[1]
+                sp = progress[shard_id]
+                if kind == "body":
+                    _, _, offset, data, points = msg
+                    body = [offset, False, points]
+                    sp.bodies.append(body)
+                    inflight[pool.submit(self._write, data, points)] = (shard_id, body, len(data))
+                elif kind == "done":
+                    for k, v in msg[2].items():
+                        self.stats[k] = self.stats.get(k, 0) + v
+                    sp.finished = True
+                    sp.advance()
+                    remaining -= 1
+                else:
+                    log.error("Import: shard %d failed: %s", shard_id, msg[2])
+                    sp.failed = True
+                    failed += 1
+                    remaining -= 1
+        except KeyboardInterrupt:
+            interrupted = True
+            self._stopping = True
+            for p in procs:
+                p.terminate()
+            for fut in inflight:
+                fut.cancel()
+            log.warning("Import: interrupted, waiting for %d write(s) in flight", sum(not f.cancelled() for f in inflight))
+            for fut, info in inflight.items():
+                if fut.cancelled():
+                    continue
+                try:
+                    accepted = fut.result()
+                except Exception:
+                    continue
+                self._written(accepted, *info, progress)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            # Unread shard descriptions must not keep the process alive at exit.
+            tasks.cancel_join_thread()
+            for p in procs:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.kill()
+            self._save(checkpoint)
+            self._writer.close()
+
+        self._log_progress(time.monotonic() - t0, len(shards) - remaining, len(shards))
+        s = self.stats
+        log.info(
+            "Import: %d line(s), %d decode error(s), %d other event(s), %d outside the time range, %d overlong, %d not UTF-8, %d point(s) rejected",
+            s.get("lines", 0),
+            s.get("decode_errors", 0),
+            s.get("other_events", 0),
+            s.get("outside_range", 0),
+            s.get("overlong", 0),
+            s.get("invalid_utf8", 0),
+            self.points_rejected,
+        )
+        if interrupted:
+            log.warning("Import: progress saved to %s, run the same command again to continue", self._checkpoint_path)
+            return 130
+        return 1 if failed else 0
+
+    def _written(self, accepted: int, shard_id: int, body: list, nbytes: int, progress: dict[int, _ShardProgress]) -> None:
+        self.points_written += accepted
+        self.points_rejected += body[2] - accepted
+        self.bytes_done += nbytes
+        body[1] = True
+        progress[shard_id].advance()
+
+    def _log_progress(self, elapsed_s: float, shards_done: int, shards_total: int) -> None:
+        log.info(
+            "Import: %d/%d shard(s) done, %d points written (%.0f/s), %.1f MB of line protocol, %d retries",
+            shards_done,
+            shards_total,
+            self.points_written,
+            self.points_written / elapsed_s if elapsed_s > 0 else 0.0,
+            self.bytes_done / 1e6,
+            self.retries,
+        )
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="tigo_ingest import",
+        description="Bulk import of taptap JSONL files, capture segments or capture dirs into Influx (INFLUX_*), resumable",
+    )
+    ap.add_argument("paths", nargs="+", metavar="PATH", help="JSONL files (also .gz/.zst) or capture directories")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="parser processes (default: CPU count)")
+    ap.add_argument("--writers", type=int, default=4, help="concurrent Influx requests (default 4)")
+    ap.add_argument("--shard-mb", type=float, default=64.0, help="byte range per shard of uncompressed files (default 64)")
+    ap.add_argument("--body-points", type=int, default=5000, help="points per Influx request (default 5000)")
+    ap.add_argument("--checkpoint", default="import-checkpoint.json", help="progress file for resuming (default import-checkpoint.json)")
+    ap.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint and start over")
+    ap.add_argument("--since", type=parse_rfc3339_ns, help="import only events at/after this RFC3339 time")
+    ap.add_argument("--until", type=parse_rfc3339_ns, help="import only events before this RFC3339 time")
+    ap.add_argument("--source", help="set the source tag on all imported points (as with TAPTAP_SOURCES)")
+    args = ap.parse_args(argv)
+
+    if args.fresh:
+        try:
+            os.unlink(args.checkpoint)
+        except FileNotFoundError:
+            pass
+
+    influx_cfg = InfluxConfig.from_env()
+    wire = WireConfig.from_env()
+    topo_cfg = TopologyConfig.from_env()
+    opts = _WorkerOptions(
+        measurement=influx_cfg.measurement,
+        body_points=max(1, args.body_points),
+        max_line=max_line_from_env(),
+        since_ns=args.since,
+        until_ns=args.until,
+        source=args.source,
+        # Same tags/fields, topology enrichment and wire format as the daemon writes; the series guard is daemon-only.
+        schema=apply_wire(load_schema(SchemaConfig.from_env().path), wire.fields, wire.round),
+        wire=wire,
+        topology=topo_cfg if topo_cfg.enabled else None,
+    )
+    importer = BulkImporter(
+        args.paths,
+        checkpoint_path=args.checkpoint,
+        jobs=args.jobs,
+        writers=args.writers,
+        shard_bytes=int(args.shard_mb * 1024 * 1024),
+        opts=opts,
+        writer=InfluxWriter(influx_cfg),
+    )
+    # systemd/kill: stop like Ctrl-C, saving the checkpoint.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    return importer.run()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from ._env import env_float, env_int, env_str
+from .linesplit import LineSplitter
+
+try:  # optional: zstd segments
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+COMPRESSIONS = ("auto", "zstd", "gzip")
+INDEX_NAME = "index.jsonl"
+_SUFFIX = {"zstd": ".jsonl.zst", "gzip": ".jsonl.gz"}
+
+
+@dataclass(frozen=True)
+class CaptureConfig:
+    dir: str
+    compression: str
+    segment_s: float
+    segment_mb: int
+
+    @staticmethod
+    def from_env() -> "CaptureConfig":
+        compression = env_str("TIGO_CAPTURE_COMPRESSION", "auto").lower() or "auto"
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"TIGO_CAPTURE_COMPRESSION must be one of {COMPRESSIONS}, got {compression!r}")
+        return CaptureConfig(
+            dir=env_str("TIGO_CAPTURE_DIR", ""),
+            compression=compression,
+            segment_s=env_float("TIGO_CAPTURE_SEGMENT_S", 3600.0),
+            segment_mb=env_int("TIGO_CAPTURE_SEGMENT_MB", 64),
+        )
+
+
+class CaptureWriter:
+    """Tees raw taptap lines into rotating compressed JSONL segments.
+
+    Segments are plain taptap output (one event per line), so they can be read
+    with `zcat`/`zstdcat` as well as replayed. A segment is rotated after
+    `segment_s` seconds or `segment_mb` of raw input; on rotation one line with
+    its receive-time range, event-time range (fed via `note_event()`) and line
+    count is appended to `index.jsonl`, which the replay source uses to pick
+    segments for a time range.
+    """
+
+    def __init__(self, cfg: CaptureConfig) -> None:
+        compression = cfg.compression
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise RuntimeError("TIGO_CAPTURE_COMPRESSION=zstd needs the 'zstandard' package")
+        self._cfg = cfg
+        self.compression = compression
+        self.dir = Path(cfg.dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._segment_ns = int(cfg.segment_s * _NS)
+        self._segment_bytes = cfg.segment_mb * 1024 * 1024
+        self._raw: BinaryIO | None = None
+        self._out: BinaryIO | None = None
+        self._name = ""
+        self._first_ns = 0
+        self._last_ns = 0
+        self._event_min = 0
+        self._event_max = 0
+        self._lines = 0
+        self._bytes = 0
+
+        self.segments = 0
+        self.lines = 0
+
+    def _open(self, now_ns: int) -> None:
+        self._name = f"capture-{now_ns:d}{_SUFFIX[self.compression]}"
+        self._raw = open(self.dir / self._name, "ab")
+        if self.compression == "zstd":
+            self._out = zstandard.ZstdCompressor(level=3).stream_writer(self._raw, closefd=False)
+        else:
+            self._out = gzip.GzipFile(fileobj=self._raw, mode="ab", compresslevel=6)
+        self._first_ns = now_ns
+        self._event_min = self._event_max = 0
+        self._lines = 0
+        self._bytes = 0
+        self.segments += 1
+
+    def _close_segment(self) -> None:
+        if self._out is None or self._raw is None:
+            return
+        self._out.close()
+        self._raw.close()
+        self._out = self._raw = None
+        entry = {"segment": self._name, "first_ns": self._first_ns, "last_ns": self._last_ns, "lines": self._lines}
+        if self._event_min:
+            entry["event_min_ns"] = self._event_min
+            entry["event_max_ns"] = self._event_max
+        with open(self.dir / INDEX_NAME, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def write(self, raw: bytes, now_ns: int | None = None) -> None:
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        if self._out is not None and (now_ns - self._first_ns >= self._segment_ns or self._bytes >= self._segment_bytes):
+            self._close_segment()
+        if self._out is None:
+            self._open(now_ns)
+        assert self._out is not None
+        self._out.write(raw)
+        self._out.write(b"\n")
+        self._last_ns = now_ns
+        self._lines += 1
+        self._bytes += len(raw) + 1
+        self.lines += 1
+
+    def note_event(self, ts_ns: int) -> None:
+        """Record the event time of the line written last (for the segment index)."""
+        if not self._event_min or ts_ns < self._event_min:
+            self._event_min = ts_ns
+        if ts_ns > self._event_max:
+            self._event_max = ts_ns
+
+    def close(self) -> None:
+        self._close_segment()
+
+
+def open_capture(path: str | os.PathLike) -> BinaryIO:
+    """Open a capture segment or plain JSONL file for reading (by file suffix)."""
+    p = str(path)
+    if p.endswith(".gz"):
+        return gzip.open(p, "rb")  # type: ignore[return-value]
+    if p.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {p} needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(p, "rb"), closefd=True, read_across_frames=True)  # type: ignore[return-value]
+    return open(p, "rb")
+
+
+def capture_segments(dir: str | os.PathLike, since_ns: int | None = None, until_ns: int | None = None, margin_s: float = 300.0) -> list[Path]:
+    """Segments of a capture directory in time order, limited to a time range via the index.
+
+    Segments that are missing from the index (still open, or the process died)
+    are always included. Segments are matched on their event-time range; if the
+    index has none, on the receive-time range widened by `margin_s`. Replay
+    filters exact event times afterwards.
+    """
+    d = Path(dir)
+    margin = int(margin_s * _NS)
+    ranges: dict[str, tuple[int, int]] = {}
+    try:
+        with open(d / INDEX_NAME, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    e = json.loads(line)
+                    if "event_min_ns" in e:
+                        ranges[e["segment"]] = (int(e["event_min_ns"]), int(e["event_max_ns"]))
+                    else:
+                        ranges[e["segment"]] = (int(e["first_ns"]) - margin, int(e["last_ns"]) + margin)
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    out: list[Path] = []
+    for p in sorted(d.glob("capture-*.jsonl*"), key=lambda p: (int(p.name.split("-", 1)[1].split(".", 1)[0]), p.name)):
+        r = ranges.get(p.name)
+        if r is not None:
+            if since_ns is not None and r[1] < since_ns:
+                continue
+            if until_ns is not None and r[0] >= until_ns:
+                continue
+        out.append(p)
+    return out
+
+
+def iter_line_batches(f: BinaryIO, splitter: LineSplitter, chunk_size: int = 1 << 20) -> Iterator[list[bytes]]:
+    """Non-empty lists of lines per read chunk of a (decompressed) stream; a truncated tail is tolerated."""
+    while True:
+        try:
+            chunk = f.read(chunk_size)
+        except (EOFError, OSError) as e:
+            # gzip/zstd segment cut off by a crash: keep what was readable.
+            log.warning("Capture: truncated stream (%s), skipping the rest", e)
+            chunk = b""
+        if not chunk:
+            break
+        lines = splitter.feed(chunk)
+        if lines:
+            yield lines
+    tail = splitter.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ._env import env_bool, env_float, env_int, env_str
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+
+# Influx field name -> value getter on a PowerReport.
+_GETTERS = {
+    "voltage_in_v": lambda pr: pr.voltage_in,
+    "voltage_out_v": lambda pr: pr.voltage_out,
+    "current_in_a": lambda pr: pr.current,
+    "power_w": lambda pr: pr.voltage_in * pr.current,
+    "duty_cycle": lambda pr: pr.duty_cycle,
+    "temperature_c": lambda pr: pr.temperature,
+    "rssi": lambda pr: pr.rssi,
+}
+
+DEFAULT_DEADBANDS = "voltage_in_v=0.5,voltage_out_v=0.5,current_in_a=0.05,power_w=2%,duty_cycle=0.02,temperature_c=1,rssi=5"
+
+
+def parse_deadbands(spec: str) -> dict[str, tuple[float, float]]:
+    """'power_w=2%,rssi=5' -> {field: (absolute, relative)}.
+
+    `N` is an absolute deadband in the field's unit, `N%` a relative one; both
+    may be given for one field (`power_w=1,power_w=2%`), a change has to exceed
+    every band set for that field.
+    """
+    out: dict[str, tuple[float, float]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, val = item.partition("=")
+        name = name.strip()
+        val = val.strip()
+        if not sep or name not in _GETTERS:
+            raise ValueError(f"Invalid deadband {item!r} (expected <field>=<abs> or <field>=<pct>%, fields: {', '.join(_GETTERS)})")
+        absolute, relative = out.get(name, (0.0, 0.0))
+        try:
+            if val.endswith("%"):
+                relative = float(val[:-1]) / 100.0
+            else:
+                absolute = float(val)
+        except ValueError:
+            raise ValueError(f"Invalid deadband value in {item!r}") from None
+        out[name] = (absolute, relative)
+    return out
+
+
+@dataclass(frozen=True)
+class DeadbandConfig:
+    enabled: bool
+    deadbands: dict[str, tuple[float, float]]
+    max_silence_s: float
+    max_nodes: int
+
+    @staticmethod
+    def from_env() -> "DeadbandConfig":
+        return DeadbandConfig(
+            enabled=env_bool("TIGO_DEADBAND_ENABLED", False),
+            deadbands=parse_deadbands(env_str("TIGO_DEADBAND", DEFAULT_DEADBANDS)),
+            max_silence_s=env_float("TIGO_DEADBAND_MAX_SILENCE_S", 300.0),
+            max_nodes=env_int("TIGO_DEADBAND_MAX_NODES", 10000),
+        )
+
+
+def _state(pr: "PowerReport") -> tuple[bool, bool]:
+    # Discrete node state; any change here is always written (e.g. output switching off at dusk).
+    return (pr.voltage_out != 0.0, pr.current != 0.0)
+
+
+class DeadbandFilter:
+    """Per node change suppression in front of the batch.
+
+    A report is written when it is the first one of its node, when the node's
+    state changed (output/current dropping to or rising from zero), when the last
+    written report of the node is older than `max_silence_s` (heartbeat), or when
+    any field moved further than its deadband away from the last *written* value.
+    Everything else is counted in `suppressed` and dropped before encoding.
+    Comparing against the last written value (not the last seen one) keeps slow
+    drifts from hiding below the band forever.
+    """
+
+    def __init__(self, cfg: DeadbandConfig) -> None:
+        self._cfg = cfg
+        self._bands = tuple((name, _GETTERS[name], a, r) for name, (a, r) in cfg.deadbands.items())
+        self._silence_ns = int(cfg.max_silence_s * _NS)
+        # (source, gateway_id, node_id) -> (timestamp_ns, state, values of the last written report)
+        self._last: dict[tuple[str | None, int, int], tuple[int, tuple[bool, bool], tuple[float, ...]]] = {}
+
+        self.passed = 0
+        self.suppressed = 0
+        self.forced_state = 0
+        self.heartbeats = 0
+
+    def _remember(self, key: tuple[str | None, int, int], pr: "PowerReport", state: tuple[bool, bool], vals: tuple[float, ...]) -> bool:
+        if key not in self._last and len(self._last) >= self._cfg.max_nodes:
+            # Should not happen with real installations; start over rather than grow unbounded.
+            log.warning("Deadband: more than %d nodes tracked, resetting state", self._cfg.max_nodes)
+            self._last.clear()
+        self._last[key] = (pr.timestamp_ns, state, vals)
+        self.passed += 1
+        return True
+
+    def accept(self, pr: "PowerReport") -> bool:
+        """True if the report should be written, False if it is suppressed."""
+        key = (pr.source, pr.gateway_id, pr.node_id)
+        state = _state(pr)
+        vals = tuple(get(pr) for _, get, _, _ in self._bands)
+        last = self._last.get(key)
+        if last is None:
+            return self._remember(key, pr, state, vals)
+        last_ts, last_state, last_vals = last
+        if state != last_state:
+            self.forced_state += 1
+            return self._remember(key, pr, state, vals)
+        if pr.timestamp_ns - last_ts >= self._silence_ns:
+            self.heartbeats += 1
+            return self._remember(key, pr, state, vals)
+        for (_, _, absolute, relative), v, prev in zip(self._bands, vals, last_vals):
+            d = abs(v - prev)
+            if d > absolute and d > relative * abs(prev):
+                return self._remember(key, pr, state, vals)
+        self.suppressed += 1
+        return False
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Callable
+
+from .taptap_reader import PowerReport, _normalize_address
+from .timestamps import parse_rfc3339_ns
+
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("auto", "msgspec", "orjson", "json")
+
+
+class DecodeError(ValueError):
+    """A taptap line that could not be decoded.
+
+    `kind` is one of `json` (not valid JSON), `envelope` (unknown event shape)
+    or `payload` (power_report with missing/invalid fields).
+    """
+
+    def __init__(self, kind: str, message: str) -> None:
+        super().__init__(message)
+        self.kind = kind
+
+
+# Raw address (as tuple) -> hex string. Every report of a node carries the same
+# address bytes, so the conversion runs once per gateway/node, not once per report.
+_ADDRESS_MEMO: dict[tuple, str] = {}
+_ADDRESS_MEMO_MAX = 65536
+
+
+def normalize_address(v, hex_int: bool = False) -> str:
+    """Same result as `_normalize_address`, memoized for taptap's byte-array addresses.
+
+    With `hex_int` an integer address (older taptap builds) is written as 16 hex
+    digits like the byte array newer builds send for the same device. This is
+    decided on the JSON type here; the string form alone cannot tell a decimal
+    address from an all-digit hex one.
+    """
+    t = type(v)
+    if t is int:
+        return f"{v:016x}" if hex_int and v >= 0 else str(v)
+    if t is list or t is tuple:
+        try:
+            key = v if t is tuple else tuple(v)
+            s = _ADDRESS_MEMO.get(key)
+        except TypeError:  # nested arrays are not hashable
+            return _normalize_address(list(v))
+        if s is None:
+            try:
+                s = bytes(key).hex()
+            except (ValueError, TypeError):
+                s = _normalize_address(list(v))
+            if len(_ADDRESS_MEMO) >= _ADDRESS_MEMO_MAX:
+                _ADDRESS_MEMO.clear()
+            _ADDRESS_MEMO[key] = s
+        return s
+    return _normalize_address(v)
+
+
+def _from_payload(p: dict, hex_addresses: tuple[bool, bool] = (False, False)) -> PowerReport:
+    # One pass over a power_report payload; mirrors parse_power_report.
+    gw = p["gateway"]
+    node = p["node"]
+    duty = p.get("duty_cycle")
+    if duty is None:
+        duty = p.get("dc_dc_duty_cycle")
+        if duty is None:
+            raise KeyError("missing duty_cycle/dc_dc_duty_cycle")
+    ga = gw.get("address")
+    na = node.get("address")
+    return PowerReport(
+        parse_rfc3339_ns(p["timestamp"]),
+        int(gw["id"]),
+        None if ga is None else normalize_address(ga, hex_addresses[0]),
+        int(node["id"]),
+        None if na is None else normalize_address(na, hex_addresses[1]),
+        node.get("barcode"),
+        float(p["voltage_in"]),
+        float(p["voltage_out"]),
+        float(p["current"]),
+        float(duty),
+        float(p["temperature"]),
+        int(p["rssi"]),
+    )
+
+
+def _from_obj(
+    obj, on_event: Callable[[str, dict], None] | None = None, hex_addresses: tuple[bool, bool] = (False, False)
+) -> PowerReport | None:
+    if not isinstance(obj, dict):
+        raise DecodeError("envelope", "Unexpected event (expected object)")
+    if len(obj) == 1:
+        # Format A (envelope): {"power_report": {...}} or any other single-key event.
+        ((event_type, payload),) = obj.items()
+        if not isinstance(payload, dict):
+            raise DecodeError("envelope", "Unexpected event envelope (expected single-key object or bare power_report)")
+        if event_type != "power_report":
+            if on_event is not None:
+                on_event(event_type, payload)
+            return None
+        obj = payload
+    elif not ("gateway" in obj and "node" in obj and "timestamp" in obj and "voltage_in" in obj and "current" in obj):
+        raise DecodeError("envelope", "Unexpected event envelope (expected single-key object or bare power_report)")
+    try:
+        return _from_payload(obj, hex_addresses)
+    except DecodeError:
+        raise
+    except Exception as e:
+        raise DecodeError("payload", f"Invalid power_report payload: {e!r}") from e
+
+
+class _StdlibDecoder:
+    name = "json"
+
+    def __init__(self, hex_addresses: tuple[bool, bool] = (False, False)) -> None:
+        self._hex = hex_addresses
+        # json.loads(bytes) sniffs the encoding first; decoding explicitly is cheaper.
+        self._loads = lambda raw: json.loads(raw.decode() if type(raw) is bytes else raw)
+
+    def decode(self, raw: bytes | str, on_event: Callable[[str, dict], None] | None = None) -> PowerReport | None:
+        try:
+            obj = self._loads(raw)
+        except UnicodeDecodeError as e:
+            raise DecodeError("json", f"Invalid UTF-8: {e}") from e
+        except ValueError as e:
+            raise DecodeError("json", f"Invalid JSON: {e}") from e
+        return _from_obj(obj, on_event, self._hex)
+
+
+class _OrjsonDecoder(_StdlibDecoder):
+    name = "orjson"
+
+    def __init__(self, hex_addresses: tuple[bool, bool] = (False, False)) -> None:
+        import orjson
+
+        self._hex = hex_addresses
+
+        self._loads = orjson.loads
+
+
+class _MsgspecDecoder:
+    """Typed decoding straight into structs; anything unusual falls back to the generic path."""
+
+    name = "msgspec"
+
+    def __init__(self, hex_addresses: tuple[bool, bool] = (False, False)) -> None:
+        import msgspec
+
+        self._hex = hex_addresses
+
+        # Built with defstruct so the field types are real objects, not postponed annotations.
+        # Arrays decode to tuples, which key the address memo directly.
+        address = int | tuple[int, ...] | str | None
+        gateway = msgspec.defstruct("Gateway", [("id", int), ("address", address, None)])
+        node = msgspec.defstruct("Node", [("id", int), ("address", address, None), ("barcode", str | None, None)])
+        report = msgspec.defstruct(
+            "Report",
+            [
+                ("timestamp", str),
+                ("gateway", gateway),
+                ("node", node),
+                ("voltage_in", float),
+                ("voltage_out", float),
+                ("current", float),
+                ("temperature", float),
+                ("rssi", int),
+                ("duty_cycle", float | None, None),
+                ("dc_dc_duty_cycle", float | None, None),
+            ],
+        )
+        # The generic path only takes single-key envelopes; any sibling key has to fall back to it as well.
+        envelope = msgspec.defstruct("Envelope", [("power_report", report)], forbid_unknown_fields=True)
+
+        self._envelope = msgspec.json.Decoder(envelope)
+        self._bare = msgspec.json.Decoder(report)
+        self._generic = msgspec.json.Decoder()
+        self._errors = (msgspec.ValidationError, msgspec.DecodeError)
+
+    def decode(self, raw: bytes | str, on_event: Callable[[str, dict], None] | None = None) -> PowerReport | None:
+        try:
+            if raw[:16] in (b'{"power_report":', '{"power_report":'):
+                r = self._envelope.decode(raw).power_report
+            else:
+                r = self._bare.decode(raw)
+        except self._errors:
+            # Other event types, odd field types (e.g. float rssi) or broken JSON.
+            try:
+                obj = self._generic.decode(raw)
+            except self._errors as e:
+                raise DecodeError("json", f"Invalid JSON: {e}") from e
+            return _from_obj(obj, on_event, self._hex)
+
+        duty = r.duty_cycle
+        if duty is None:
+            duty = r.dc_dc_duty_cycle
+            if duty is None:
+                raise DecodeError("payload", "Invalid power_report payload: missing duty_cycle/dc_dc_duty_cycle")
+        gw = r.gateway
+        node = r.node
+        try:
+            ts = parse_rfc3339_ns(r.timestamp)
+        except ValueError as e:
+            raise DecodeError("payload", f"Invalid power_report payload: {e!r}") from e
+        return PowerReport(
+            ts,
+            gw.id,
+            None if gw.address is None else normalize_address(gw.address, self._hex[0]),
+            node.id,
+            None if node.address is None else normalize_address(node.address, self._hex[1]),
+            node.barcode,
+            r.voltage_in,
+            r.voltage_out,
+            r.current,
+            duty,
+            r.temperature,
+            r.rssi,
+        )
+
+
+_BACKEND_CLASSES = {"msgspec": _MsgspecDecoder, "orjson": _OrjsonDecoder, "json": _StdlibDecoder}
+
+
+def make_decoder(backend: str | None = None, hex_addresses: tuple[bool, bool] = (False, False)):
+    """Return a decoder with `.decode(raw, on_event=None) -> PowerReport | None` and `.name`.
+
+    `decode()` returns None for non-power_report events (after passing their
+    type and payload to `on_event`, if given) and raises DecodeError for lines
+    that cannot be decoded. `auto` picks msgspec, then orjson, then
+    the stdlib json module, depending on what is installed. `hex_addresses`
+    (gateway, node) writes integer addresses as hex, see `PointSchema.hex_addresses`.
+    """
+    backend = (backend or os.getenv("TIGO_JSON_BACKEND", "auto")).strip().lower() or "auto"
+    if backend not in BACKENDS:
+        raise ValueError(f"TIGO_JSON_BACKEND must be one of {BACKENDS}, got {backend!r}")
+    if backend != "auto":
+        return _BACKEND_CLASSES[backend](hex_addresses)
+    for name in ("msgspec", "orjson"):
+        try:
+            return _BACKEND_CLASSES[name](hex_addresses)
+        except ImportError:
+            continue
+    return _StdlibDecoder(hex_addresses)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, tzinfo
+from typing import TYPE_CHECKING, Awaitable, Callable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from ._env import env_bool, env_float, env_int, env_str
+from .influx import line_protocol
+from .statefile import atomic_write_json, load_json
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+# W * ns -> kWh
+_KWH = 3600 * 1000 * _NS
+_SNAPSHOT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class EnergyConfig:
+    enabled: bool
+    path: str
+    max_gap_s: float
+    interval_s: float
+    tz: str
+    node_measurement: str
+    gateway_measurement: str
+    max_nodes: int
+
+    @staticmethod
+    def from_env(measurement: str) -> "EnergyConfig":
+        # Empty TIGO_ENERGY_FILE keeps the counters in memory only; empty TIGO_ENERGY_TZ = system time zone.
+        return EnergyConfig(
+            enabled=env_bool("TIGO_ENERGY_ENABLED", False),
+            path=env_str("TIGO_ENERGY_FILE", "energy.json"),
+            max_gap_s=env_float("TIGO_ENERGY_MAX_GAP_S", 300.0),
+            interval_s=max(1.0, env_float("TIGO_ENERGY_INTERVAL_S", 60.0)),
+            tz=env_str("TIGO_ENERGY_TZ", ""),
+            node_measurement=env_str("TIGO_ENERGY_NODE_MEASUREMENT", f"{measurement}_energy"),
+            gateway_measurement=env_str("TIGO_ENERGY_GATEWAY_MEASUREMENT", f"{measurement}_energy_gw"),
+            max_nodes=env_int("TIGO_ENERGY_MAX_NODES", 5000),
+        )
+
+
+class _Days:
+    """Epoch ns -> local calendar day ('YYYY-MM-DD'); the bounds of the last day are cached."""
+
+    def __init__(self, tz: tzinfo | None) -> None:
+        self._tz = tz
+        self._start = 0
+        self._end = 0
+        self._day = ""
+
+    def day(self, ts_ns: int) -> str:
+        if self._start <= ts_ns < self._end:
+            return self._day
+        d = datetime.fromtimestamp(ts_ns / _NS, self._tz).date()
+        # Wall clock midnight to midnight, so DST days are 23/25 hours long.
+        start = datetime(d.year, d.month, d.day, tzinfo=self._tz)
+        end = start + timedelta(days=1)
+        self._start = int(start.timestamp()) * _NS
+        self._end = int(end.timestamp()) * _NS
+        self._day = d.isoformat()
+        return self._day
+
+
+class _Counter:
+    __slots__ = ("last_ns", "last_w", "total_kwh", "day", "day_kwh", "gaps")
+
+    def __init__(self) -> None:
+        self.last_ns = 0
+        self.last_w = 0.0
+        self.total_kwh = 0.0
+        self.day = ""
+        self.day_kwh = 0.0
+        self.gaps = 0
+
+    def add(self, day: str, kwh: float) -> None:
+        # ISO dates compare in order; a late interval from yesterday only counts towards the total.
+        if day > self.day:
+            self.day = day
+            self.day_kwh = 0.0
+        self.total_kwh += kwh
+        if day == self.day:
+            self.day_kwh += kwh
+
+    def to_json(self) -> list:
+        return [self.last_ns, self.last_w, self.total_kwh, self.day, self.day_kwh, self.gaps]
+
+    @classmethod
+    def from_json(cls, v: list) -> "_Counter":
+        c = cls()
+        c.last_ns, c.last_w, c.total_kwh, c.day, c.day_kwh, c.gaps = int(v[0]), float(v[1]), float(v[2]), str(v[3]), float(v[4]), int(v[5])
+        return c
+
+
+class EnergyIntegrator:
+    """Streaming energy counters per node and per gateway, from `voltage_in * current`.
+
+    Each report closes one interval since the node's previous report, which is
+    integrated with the trapezoidal rule and booked on the local day of its end.
+    Intervals longer than `max_gap_s` (node offline, taptap or the daemon down)
+    are skipped and counted rather than bridged with a straight line. Reports at
+    or before a node's last timestamp are ignored, so replayed or duplicated
+    input is not counted twice. `collect()` returns the counters that changed as
+    line protocol; the state is persisted so the counters stay monotonic across
+    restarts and a short restart is still integrated.
+    """
+
+    def __init__(self, cfg: EnergyConfig, precision: str = "ns") -> None:
+        try:
+            tz = ZoneInfo(cfg.tz) if cfg.tz else None
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            raise ValueError(f"Unknown TIGO_ENERGY_TZ {cfg.tz!r}") from e
+        self._cfg = cfg
+        self._precision = precision
+        self._days = _Days(tz)
+        self._max_gap_ns = int(cfg.max_gap_s * _NS)
+        self._nodes: dict[tuple[str, int, int], _Counter] = {}
+        self._gateways: dict[tuple[str, int], _Counter] = {}
+        # Keys whose counters moved since the last collect().
+        self._changed_nodes: set[tuple[str, int, int]] = set()
+        self._changed_gateways: set[tuple[str, int]] = set()
+
+        self.intervals = 0
+        self.gaps = 0
+        self.emitted = 0
+        self.saves = 0
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def observe(self, pr: "PowerReport") -> None:
+        key = (pr.source or "", pr.gateway_id, pr.node_id)
+        c = self._nodes.get(key)
+        if c is None:
+            if len(self._nodes) >= self._cfg.max_nodes:
+                return
+            c = self._nodes[key] = _Counter()
+        ts = pr.timestamp_ns
+        if ts <= c.last_ns:
+            return
+        w = pr.voltage_in * pr.current
+        if not w > 0.0:  # also NaN
+            w = 0.0
+        # Every report rolls the day, so the first point after a night-long gap reads 0 today.
+        day = self._days.day(ts)
+        kwh = 0.0
+        if c.last_ns:
+            dt = ts - c.last_ns
+            if dt > self._max_gap_ns:
+                c.gaps += 1
+                self.gaps += 1
+            else:
+                kwh = (c.last_w + w) * dt / (2 * _KWH)
+                gkey = (key[0], key[1])
+                g = self._gateways.get(gkey)
+                if g is None:
+                    g = self._gateways[gkey] = _Counter()
+                g.add(day, kwh)
+                if ts > g.last_ns:
+                    g.last_ns = ts
+                self._changed_gateways.add(gkey)
+                self.intervals += 1
+        c.add(day, kwh)
+        c.last_ns = ts
+        c.last_w = w
+        self._changed_nodes.add(key)
+
+    def collect(self) -> list[str]:
+        """Current counters of the nodes/gateways that changed, one point each at their newest report."""
+        out: list[str] = []
+        for source, gw, node in sorted(self._changed_nodes):
+            c = self._nodes[(source, gw, node)]
+            tags = {"src": "tigo", "gateway_id": str(gw), "node_id": str(node), "source": source}
+            fields = {"energy_kwh": c.total_kwh, "today_kwh": c.day_kwh, "gaps": c.gaps}
+            out.append(line_protocol(self._cfg.node_measurement, tags, fields, c.last_ns, self._precision))
+        for source, gw in sorted(self._changed_gateways):
+            g = self._gateways[(source, gw)]
+            tags = {"src": "tigo", "gateway_id": str(gw), "source": source}
+            fields = {"energy_kwh": g.total_kwh, "today_kwh": g.day_kwh}
+            out.append(line_protocol(self._cfg.gateway_measurement, tags, fields, g.last_ns, self._precision))
+        self._changed_nodes.clear()
+        self._changed_gateways.clear()
+        self.emitted += len(out)
+        return out
+
+    def snapshot_obj(self) -> dict:
+        return {
+            "version": _SNAPSHOT_VERSION,
+            "nodes": [[src, gw, node, *c.to_json()] for (src, gw, node), c in self._nodes.items()],
+            "gateways": [[src, gw, *c.to_json()] for (src, gw), c in self._gateways.items()],
+        }
+
+    def load(self) -> None:
+        try:
+            obj = load_json(self._cfg.path, default=None)
+        except ValueError:
+            log.warning("Energy: ignoring unreadable %s", self._cfg.path)
+            return
+        if not obj or obj.get("version") != _SNAPSHOT_VERSION:
+            return
+        try:
+            nodes = {(str(v[0]), int(v[1]), int(v[2])): _Counter.from_json(v[3:]) for v in obj.get("nodes") or []}
+            gateways = {(str(v[0]), int(v[1])): _Counter.from_json(v[2:]) for v in obj.get("gateways") or []}
+        except (TypeError, ValueError, IndexError):
+            log.warning("Energy: ignoring malformed %s", self._cfg.path)
+            return
+        self._nodes.update(nodes)
+        self._gateways.update(gateways)
+        log.info("Energy: restored %d node and %d gateway counter(s) from %s", len(nodes), len(gateways), self._cfg.path)
+
+    async def run(self, put: Callable[[str], Awaitable[None]]) -> None:
+        while True:
+            await asyncio.sleep(self._cfg.interval_s)
+            await self.flush(put)
+
+    async def flush(self, put: Callable[[str], Awaitable[None]]) -> None:
+        # The state is saved before its points are queued: after a crash the
+        # counters resume from a value that was never exceeded in Influx.
+        lines = self.collect()
+        if self._cfg.path:
+            obj = self.snapshot_obj()
+            try:
+                await asyncio.to_thread(atomic_write_json, self._cfg.path, obj)
+                self.saves += 1
+            except OSError as e:
+                log.warning("Energy: cannot write %s: %s", self._cfg.path, e)
+        for ln in lines:
+            await put(ln)
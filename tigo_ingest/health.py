@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from ._env import env_float, env_str
+from .statefile import atomic_write_json
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HealthConfig:
+    path: str
+    interval_s: float
+
+    @staticmethod
+    def from_env() -> "HealthConfig":
+        # Empty TIGO_HEALTH_FILE disables the state file.
+        return HealthConfig(
+            path=env_str("TIGO_HEALTH_FILE", "health.json"),
+            interval_s=env_float("TIGO_HEALTH_INTERVAL_S", 5.0),
+        )
+
+
+class SourceHealth:
+    """Per source counters, bound once per reader; the hot path only assigns two attributes."""
+
+    __slots__ = ("reports", "last_event_ns", "last_report_wall_ns", "_seen")
+
+    def __init__(self) -> None:
+        self.reports = 0
+        self.last_event_ns = 0
+        self.last_report_wall_ns = 0
+        self._seen = 0
+
+
+class HealthState:
+    """The daemon's own health, published as an atomically replaced JSON file.
+
+    `scripts/tigo_healthcheck.py` reads it instead of querying Influx. Wall-clock
+    arrival of reports is sampled by the publisher (a source whose report count
+    moved since the last tick was seen "now"), so the read loop pays nothing for it.
+    `on_write` is called from writer threads with the same arguments as
+    `InfluxWriter.on_result`.
+    """
+
+    def __init__(self, cfg: HealthConfig) -> None:
+        self._cfg = cfg
+        self._started_ns = time.time_ns()
+        self._sources: dict[str, SourceHealth] = {}
+        # Extra sections (spool, pipeline, sinks), each a callable returning a dict.
+        self._sections: dict[str, Callable[[], dict]] = {}
+
+        self.last_write_ok_ns = 0
+        self.last_write_error_ns = 0
+        self.last_write_status = 0
+        self.write_errors = 0
+        self.points_written = 0
+        self.publishes = 0
+
+    def source(self, name: str) -> SourceHealth:
+        s = self._sources.get(name)
+        if s is None:
+            s = self._sources[name] = SourceHealth()
+        return s
+
+    def add_section(self, name: str, fn: Callable[[], dict]) -> None:
+        self._sections[name] = fn
+
+    def on_write(self, status: int, latency_s: float, points: int) -> None:
+        now = time.time_ns()
+        self.last_write_status = status
+        if status in (200, 204):
+            self.last_write_ok_ns = now
+            self.points_written += points
+        else:
+            self.last_write_error_ns = now
+            self.write_errors += 1
+
+    def snapshot(self) -> dict:
+        now = time.time_ns()
+        sources = {}
+        for name, s in self._sources.items():
+            if s.reports != s._seen:
+                s._seen = s.reports
+                s.last_report_wall_ns = now
+            sources[name] = {
+                "reports": s.reports,
+                "last_event_ns": s.last_event_ns,
+                "last_report_ns": s.last_report_wall_ns,
+            }
+        out = {
+            "pid": os.getpid(),
+            "updated_ns": now,
+            "started_ns": self._started_ns,
+            "interval_s": self._cfg.interval_s,
+            "sources": sources,
+            "writes": {
+                "last_ok_ns": self.last_write_ok_ns,
+                "last_error_ns": self.last_write_error_ns,
+                "last_status": self.last_write_status,
+                "errors": self.write_errors,
+                "points": self.points_written,
+            },
+        }
+        for name, fn in self._sections.items():
+            try:
+                out[name] = fn()
+            except Exception:
+                log.debug("Health: section %s failed", name, exc_info=True)
+        return out
+
+    def publish(self) -> None:
+        # No fsync: the file is rewritten every few seconds and best kept on tmpfs (/run).
+        atomic_write_json(self._cfg.path, self.snapshot(), fsync=False)
+        self.publishes += 1
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.publish)
+            except OSError as e:
+                log.warning("Health: cannot write %s: %s", self._cfg.path, e)
+            await asyncio.sleep(self._cfg.interval_s)
+
+    def remove(self) -> None:
+        """Drop the state file on a clean shutdown so the healthcheck falls back instead of reading stale data."""
+        try:
+            os.unlink(self._cfg.path)
+        except OSError:
+            pass
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import contextlib
+import http.client
+import logging
+import queue
+import socket
+import ssl
+import time
+import urllib.parse
+
+
+log = logging.getLogger(__name__)
+
+# Errors that mean a pooled keep-alive socket went stale (server closed it while idle).
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class HTTPPool:
+    """Small thread-safe pool of persistent HTTP/1.1 connections to one host.
+
+    Connections are reused LIFO; a request that fails on a reused socket with a
+    stale-connection error is retried once on a fresh connection.
+    """
+
+    def __init__(self, base_url: str, size: int = 4, timeout: float = 10.0, idle_timeout: float = 60.0) -> None:
+        u = urllib.parse.urlsplit(base_url)
+        if u.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {base_url!r}")
+        self._https = u.scheme == "https"
+        self._host = u.hostname or "127.0.0.1"
+        self._port = u.port or (443 if self._https else 80)
+        self.base_path = u.path.rstrip("/")
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._ssl_ctx = ssl.create_default_context() if self._https else None
+        self._idle: queue.LifoQueue[tuple[http.client.HTTPConnection, float]] = queue.LifoQueue(maxsize=max(1, size))
+        self.connects = 0
+        self.reconnects = 0
+
+    def _new_conn(self) -> http.client.HTTPConnection:
+        self.connects += 1
+        if self._https:
+            return http.client.HTTPSConnection(self._host, self._port, timeout=self._timeout, context=self._ssl_ctx)
+        return http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+    def _get(self) -> tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_conn(), False
+            if now - last_used > self._idle_timeout:
+                conn.close()
+                continue
+            return conn, True
+
+    def _put(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait((conn, time.monotonic()))
+        except queue.Full:
+            conn.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> tuple[int, bytes]:
+        """Send a request and read the full response. Returns (status, body)."""
+        conn, reused = self._get()
+        try:
+            return self._do(conn, method, path, body, headers)
+        except _STALE_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            self.reconnects += 1
+            log.debug("HTTP: stale pooled connection to %s:%d, reconnecting", self._host, self._port)
+            conn = self._new_conn()
+            return self._do(conn, method, path, body, headers)
+        except BaseException:
+            conn.close()
+            raise
+
+    def _do(self, conn, method, path, body, headers) -> tuple[int, bytes]:
+        try:
+            conn.request(method, self.base_path + path, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            data = resp.read()
+        except (socket.timeout, OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put(conn)
+        return resp.status, data
+
+    @contextlib.contextmanager
+    def stream(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+    ):
+        """Like `request()`, but yields (status, response) to read the body incrementally.
+
+        The connection goes back to the pool only if the body was read to the end.
+        """
+        conn, reused = self._get()
+        try:
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                self.reconnects += 1
+                conn = self._new_conn()
+                conn.request(method, self.base_path + path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+            yield resp.status, resp
+        except BaseException:
+            conn.close()
+            raise
+        if resp.isclosed() and not resp.will_close:
+            self._put(conn)
+        else:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
@@ -1,23 +1,31 @@
 from __future__ import annotations
 
 import base64
+import functools
+import gzip
 import logging
 import os
-import urllib.error
+import time
 import urllib.parse
-import urllib.request
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable
+
+from ._env import env_bool, env_float, env_int, env_str
+from .httppool import HTTPPool
+from .schema import DEFAULT_SCHEMA, ROW, PointSchema, SeriesGuard
+from .timestamps import dt_to_ns
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
 
 
 log = logging.getLogger(__name__)
 
 
 def _dt_to_ns(dt: datetime) -> int:
-    if dt.tzinfo is None:
-        # Assume UTC if naive.
-        dt = dt.replace(tzinfo=timezone.utc)
-    return int(dt.timestamp() * 1_000_000_000)
+    # Exact integer conversion; naive datetimes are taken as UTC.
+    return dt_to_ns(dt)
 
 
 def _escape_tag(s: str) -> str:
@@ -50,8 +58,10 @@ def line_protocol(
     measurement: str,
     tags: dict[str, str] | None,
     fields: dict[str, object],
-    timestamp: datetime,
+    timestamp: datetime | int,
+    precision: str = "ns",
 ) -> str:
+    # `timestamp` is a datetime or integer epoch nanoseconds; it is written in `precision`.
     if not fields:
         raise ValueError("Need at least one field")
     m = _escape_measurement(measurement)
@@ -63,8 +73,295 @@ def line_protocol(
             tag_part = "," + ",".join(f"{_escape_tag(str(k))}={_escape_tag(str(v))}" for k, v in items)
     field_items = sorted(fields.items())
     field_part = ",".join(f"{k}={_format_field_value(v)}" for k, v in field_items if v is not None)
-    ts_ns = _dt_to_ns(timestamp)
-    return f"{m}{tag_part} {field_part} {ts_ns}"
+    ts_ns = timestamp if isinstance(timestamp, int) else _dt_to_ns(timestamp)
+    return f"{m}{tag_part} {field_part} {ts_ns // PRECISIONS[precision]}"
+
+
+def power_report_line(measurement: str, pr: "PowerReport") -> str:
+    power_w = pr.voltage_in * pr.current
+    current_out = None
+    if pr.voltage_out not in (0.0, -0.0):
+        current_out = power_w / pr.voltage_out
+
+    tags = {
+        "src": "tigo",
+        "gateway_id": str(pr.gateway_id),
+        "node_id": str(pr.node_id),
+    }
+    if pr.gateway_address is not None:
+        tags["gateway_addr"] = str(pr.gateway_address)
+    if pr.node_address is not None:
+        tags["node_addr"] = str(pr.node_address)
+    if pr.node_barcode:
+        tags["barcode"] = pr.node_barcode
+    if pr.source:
+        tags["source"] = pr.source
+    if pr.string:
+        tags["string"] = pr.string
+
+    fields = {
+        "voltage_in_v": pr.voltage_in,
+        "voltage_out_v": pr.voltage_out,
+        "current_in_a": pr.current,
+        "power_w": power_w,
+        "current_out_a": current_out,
+        "duty_cycle": pr.duty_cycle,
+        "temperature_c": pr.temperature,
+        "rssi": pr.rssi,
+    }
+
+    return line_protocol(
+        measurement=measurement,
+        tags=tags,
+        fields=fields,
+        timestamp=pr.timestamp_ns,  # use measurement time from payload
+    )
+
+
+# Write precision -> divisor of the nanosecond timestamps.
+PRECISIONS = {"ns": 1, "us": 1_000, "ms": 1_000_000, "s": 1_000_000_000}
+# InfluxDB 1.x spells microseconds `u` in the /write query string.
+_V1_PRECISION = {"ns": "ns", "us": "u", "ms": "ms", "s": "s"}
+# TIGO_WIRE_COMPACT rounding: taptap reports carry 1-3 decimals, derived values are cut to match.
+COMPACT_ROUND = (
+    ("current_in_a", 3),
+    ("current_out_a", 3),
+    ("duty_cycle", 3),
+    ("power_w", 2),
+    ("temperature_c", 1),
+    ("voltage_in_v", 2),
+    ("voltage_out_v", 2),
+)
+
+
+def _parse_round(s: str) -> tuple[tuple[str, int], ...]:
+    out = []
+    for item in s.split(","):
+        if not item.strip():
+            continue
+        name, sep, digits = item.partition("=")
+        if not sep or not digits.strip().isdigit():
+            raise ValueError(f"TIGO_WIRE_ROUND: expected field=decimals, got {item.strip()!r}")
+        out.append((name.strip(), int(digits)))
+    return tuple(out)
+
+
+@dataclass(frozen=True)
+class WireConfig:
+    """How points go over the wire: timestamp precision, field whitelist, rounding, sorted batches."""
+
+    precision: str = "ns"
+    fields: tuple[str, ...] = ()
+    round: tuple[tuple[str, int], ...] = ()
+    sort: bool = False
+
+    @property
+    def compact(self) -> bool:
+        return self != WireConfig()
+
+    @staticmethod
+    def from_env() -> "WireConfig":
+        # TIGO_WIRE_COMPACT only changes the defaults; each TIGO_WIRE_* setting still wins.
+        compact = env_bool("TIGO_WIRE_COMPACT", False)
+        precision = env_str("TIGO_WIRE_PRECISION", "ms" if compact else "ns").lower()
+        if precision not in PRECISIONS:
+            raise ValueError(f"TIGO_WIRE_PRECISION must be one of {tuple(PRECISIONS)}, got {precision!r}")
+        round_s = os.getenv("TIGO_WIRE_ROUND")
+        return WireConfig(
+            precision=precision,
+            fields=tuple(f.strip() for f in env_str("TIGO_WIRE_FIELDS").split(",") if f.strip()),
+            round=_parse_round(round_s) if round_s is not None else (COMPACT_ROUND if compact else ()),
+            sort=env_bool("TIGO_WIRE_SORT", compact),
+        )
+
+    def describe(self) -> str:
+        parts = [f"precision={self.precision}"]
+        if self.fields:
+            parts.append("fields=" + ",".join(self.fields))
+        if self.round:
+            parts.append("round=" + ",".join(f"{n}={d}" for n, d in self.round))
+        if self.sort:
+            parts.append("sorted")
+        return " ".join(parts)
+
+
+def _line_sort_key(ln: str) -> tuple[str, int]:
+    # (series key, timestamp): the series key ends at the first unescaped space,
+    # the timestamp is the last token.
+    i = ln.find(" ")
+    while i > 0 and ln[i - 1] == "\\":
+        i = ln.find(" ", i + 1)
+    return ln[:i], int(ln[ln.rindex(" ") + 1 :])
+
+
+def sort_lines(lines: list[str]) -> None:
+    """Sort a batch in place by series, then time (TSM appends one run per series instead of interleaving)."""
+    lines.sort(key=_line_sort_key)
+
+
+def _field_formatter(typ: str, digits: int | None = None) -> Callable[[object], str]:
+    if typ == "int":
+        return lambda v: f"{round(v)}i"
+    if typ == "float":
+        if digits is None:
+            return lambda v: repr(float(v))
+        spec = f".{digits}f"
+
+        def _rounded(v) -> str:
+            # `power_w=123.46` rather than `123.46000000000001` / `123.460`; a float field either way.
+            s = format(v, spec)
+            if digits:
+                s = s.rstrip("0").rstrip(".")
+            return "0" if s == "-0" else s
+
+        return _rounded
+    return lambda v: _escape_field_string(str(v))
+
+
+class PowerReportEncoder:
+    """Fast PowerReport -> line protocol encoder.
+
+    The escaped `measurement,tags ` prefix is cached per series key
+    (gateway_id, node_id, gateway_addr, node_addr, barcode, source, string) in a bounded LRU, and
+    the static field layout is a single f-string, so encoding a point is string
+    concatenation only. Output is byte-identical to `power_report_line`.
+
+    With a custom `schema` (see schema.py) or a `precision` other than ns the
+    prefix holds the configured tags and fields are formatted per the schema's
+    names, types and rounding instead, with timestamps in `precision`. A
+    `guard` sees every new series once; points of a refused series encode to None.
+    """
+
+    def __init__(
+        self,
+        measurement: str,
+        cache_size: int = 4096,
+        schema: PointSchema | None = None,
+        guard: SeriesGuard | None = None,
+        precision: str = "ns",
+    ) -> None:
+        self._measurement = measurement
+        self._m = _escape_measurement(measurement)
+        self._guard = guard
+        self._ts_div = PRECISIONS[precision]
+        schema = schema or DEFAULT_SCHEMA
+        self.custom = not schema.is_default or precision != "ns"
+        build = self._build_prefix
+        if self.custom:
+            self._tags = tuple((ROW.index(a.attr), _escape_tag(a.name)) for a in schema.tags)
+            self._fields = tuple(
+                (ROW.index(a.attr), _escape_tag(a.name) + "=", _field_formatter(a.type, a.round))
+                for a in schema.fields
+            )
+            build = self._build_custom_prefix
+            self.encode = self._encode_custom
+        if guard is not None:
+            build = self._admitted(build)
+        self.series_prefix = functools.lru_cache(maxsize=cache_size)(build)
+        self.refused = 0
+
+    def _admitted(self, build: Callable[..., str]) -> Callable[..., str | None]:
+        def _build(*key) -> str | None:
+            prefix = build(*key)
+            return prefix if self._guard.admit(self._measurement, prefix) else None
+
+        return _build
+
+    def _build_prefix(
+        self,
+        gateway_id: int,
+        node_id: int,
+        gateway_addr: str | None,
+        node_addr: str | None,
+        barcode: str | None,
+        source: str | None = None,
+        string: str | None = None,
+    ) -> str:
+        # Same tag set and (sorted) order as power_report_line / line_protocol.
+        tags = [("gateway_id", str(gateway_id)), ("node_id", str(node_id)), ("src", "tigo")]
+        if gateway_addr is not None and str(gateway_addr) != "":
+            tags.append(("gateway_addr", str(gateway_addr)))
+        if node_addr is not None and str(node_addr) != "":
+            tags.append(("node_addr", str(node_addr)))
+        if barcode:
+            tags.append(("barcode", barcode))
+        if source:
+            tags.append(("source", source))
+        if string:
+            tags.append(("string", string))
+        tags.sort()
+        return self._m + "," + ",".join(f"{_escape_tag(k)}={_escape_tag(v)}" for k, v in tags) + " "
+
+    def _build_custom_prefix(self, *key) -> str:
+        row = ("tigo", *key)
+        tags = []
+        for i, name in self._tags:
+            v = row[i]
+            if v is None or v == "":
+                continue
+            tags.append((name, str(v)))
+        tags.sort()
+        return self._m + "".join(f",{k}={_escape_tag(v)}" for k, v in tags) + " "
+
+    def encode(self, pr: "PowerReport") -> str | None:
+        prefix = self.series_prefix(pr.gateway_id, pr.node_id, pr.gateway_address, pr.node_address, pr.node_barcode, pr.source, pr.string)
+        if prefix is None:
+            self.refused += 1
+            return None
+        vout = pr.voltage_out
+        power_w = pr.voltage_in * pr.current
+        if vout != 0.0:
+            return (
+                f"{prefix}current_in_a={pr.current!r},current_out_a={power_w / vout!r},"
+                f"duty_cycle={pr.duty_cycle!r},power_w={power_w!r},rssi={pr.rssi}i,"
+                f"temperature_c={pr.temperature!r},voltage_in_v={pr.voltage_in!r},"
+                f"voltage_out_v={vout!r} {pr.timestamp_ns}"
+            )
+        return (
+            f"{prefix}current_in_a={pr.current!r},"
+            f"duty_cycle={pr.duty_cycle!r},power_w={power_w!r},rssi={pr.rssi}i,"
+            f"temperature_c={pr.temperature!r},voltage_in_v={pr.voltage_in!r},"
+            f"voltage_out_v={vout!r} {pr.timestamp_ns}"
+        )
+
+    def _encode_custom(self, pr: "PowerReport") -> str | None:
+        key = (pr.gateway_id, pr.node_id, pr.gateway_address, pr.node_address, pr.node_barcode, pr.source, pr.string)
+        prefix = self.series_prefix(*key)
+        if prefix is None:
+            self.refused += 1
+            return None
+        vout = pr.voltage_out
+        power_w = pr.voltage_in * pr.current
+        return self.format_row(
+            prefix,
+            key,
+            pr.timestamp_ns,
+            (pr.voltage_in, vout, pr.current, pr.duty_cycle, pr.temperature, pr.rssi, power_w, power_w / vout if vout != 0.0 else None),
+        )
+
+    def format_row(self, prefix: str, key: tuple, ts_ns: int, values: tuple) -> str | None:
+        """Custom schema: fields from the series `key` and `values` (schema.ROW order after the key)."""
+        row = ("tigo", *key, *values)
+        fields = ",".join([f"{name}{fmt(row[i])}" for i, name, fmt in self._fields if row[i] is not None])
+        if not fields:
+            return None
+        return f"{prefix}{fields} {ts_ns // self._ts_div}"
+
+
+class InfluxWriteError(RuntimeError):
+    def __init__(self, message: str, status: int | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def is_permanent_error(e: Exception) -> bool:
+    # 4xx means the payload itself is bad (e.g. partial write, field type conflict):
+    # retrying the same bytes would block the spool or a sink forever. 408/429 are transient.
+    status = getattr(e, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+INFLUX_APIS = ("v1", "v2")
 
 
 @dataclass(frozen=True)
@@ -76,17 +373,33 @@ class InfluxConfig:
     username: str | None
     password: str | None
     dry_run: bool
+    gzip: bool = True
+    gzip_level: int = 1
+    gzip_min_bytes: int = 1024
+    timeout_s: float = 10.0
+    pool_size: int = 4
+    # v1 = `/write?db=&rp=` (InfluxDB 1.x), v2 = `/api/v2/write?org=&bucket=` (InfluxDB 2.x / 3).
+    api: str = "v1"
+    org: str | None = None
+    bucket: str | None = None
+    token: str | None = None
+    # Timestamp precision of the written lines (TIGO_WIRE_PRECISION, the same for every target).
+    precision: str = "ns"
 
     @staticmethod
-    def from_env() -> "InfluxConfig":
-        url = os.getenv("INFLUX_URL", "http://127.0.0.1:8086").rstrip("/")
-        db = os.getenv("INFLUX_DB", "bms")
+    def from_env(prefix: str = "INFLUX", api_default: str = "v1") -> "InfluxConfig":
+        # `prefix` allows a second target (e.g. `INFLUX2_URL`, ...) next to the primary one.
+        url = os.getenv(f"{prefix}_URL", "http://127.0.0.1:8086").rstrip("/")
+        db = os.getenv(f"{prefix}_DB", "bms")
         # Default to the DB default retention policy (in InfluxDB 1.x typically `autogen` = infinite).
-        rp = os.getenv("INFLUX_RP", "") or None
+        rp = os.getenv(f"{prefix}_RP", "") or None
         measurement = os.getenv("INFLUX_MEASUREMENT", "tigo_power_report")
-        username = os.getenv("INFLUX_USER") or None
-        password = os.getenv("INFLUX_PASS") or None
-        dry_run = os.getenv("INFLUX_DRY_RUN", "0").strip() in ("1", "true", "yes", "on")
+        username = os.getenv(f"{prefix}_USER") or None
+        password = os.getenv(f"{prefix}_PASS") or None
+        dry_run = os.getenv(f"{prefix}_DRY_RUN", "0").strip() in ("1", "true", "yes", "on")
+        api = env_str(f"{prefix}_API", api_default).lower()
+        if api not in INFLUX_APIS:
+            raise ValueError(f"{prefix}_API must be one of {INFLUX_APIS}, got {api!r}")
         return InfluxConfig(
             url=url,
             db=db,
@@ -95,45 +408,97 @@ class InfluxConfig:
             username=username,
             password=password,
             dry_run=dry_run,
+            gzip=env_bool(f"{prefix}_GZIP", True),
+            gzip_level=env_int(f"{prefix}_GZIP_LEVEL", 1),
+            gzip_min_bytes=env_int(f"{prefix}_GZIP_MIN_BYTES", 1024),
+            timeout_s=env_float(f"{prefix}_TIMEOUT_S", 10.0),
+            pool_size=env_int(f"{prefix}_POOL_SIZE", 4),
+            api=api,
+            org=env_str(f"{prefix}_ORG") or None,
+            # InfluxDB 3 maps `db/rp` style names onto buckets, so default to that.
+            bucket=env_str(f"{prefix}_BUCKET") or (f"{db}/{rp}" if rp else db),
+            token=env_str(f"{prefix}_TOKEN") or None,
+            precision=WireConfig.from_env().precision,
         )
 
 
 class InfluxWriter:
     def __init__(self, cfg: InfluxConfig) -> None:
         self._cfg = cfg
+        self._pool = HTTPPool(cfg.url, size=cfg.pool_size, timeout=cfg.timeout_s)
+
+        if cfg.api == "v2":
+            qs = {"bucket": cfg.bucket or cfg.db, "precision": cfg.precision}
+            if cfg.org:
+                qs["org"] = cfg.org
+            self._path = f"/api/v2/write?{urllib.parse.urlencode(qs)}"
+        else:
+            qs = {"db": cfg.db, "precision": _V1_PRECISION[cfg.precision]}
+            if cfg.rp:
+                qs["rp"] = cfg.rp
+            self._path = f"/write?{urllib.parse.urlencode(qs)}"
+        self._headers = {"Content-Type": "text/plain; charset=utf-8"}
+        if cfg.token:
+            # InfluxDB 2.x/3 API token; InfluxDB 3 also accepts it on the v1 /write endpoint.
+            self._headers["Authorization"] = f"Token {cfg.token}"
+        elif cfg.username and cfg.password:
+            token = base64.b64encode(f"{cfg.username}:{cfg.password}".encode("utf-8")).decode("ascii")
+            self._headers["Authorization"] = f"Basic {token}"
+
+        self.requests = 0
+        self.last_latency_s = 0.0
+        self.total_latency_s = 0.0
+        self.bytes_sent = 0
+        # Optional hook, called with (HTTP status or 0 on connection errors, latency_s, points).
+        self.on_result: Callable[[int, float, int], None] | None = None
 
     def write_lines(self, lines: list[str]) -> None:
         if not lines:
             return
+        self.write_body(("\n".join(lines) + "\n").encode("utf-8"), len(lines))
+
+    def write_body(self, data: bytes, points: int) -> None:
+        # `data` is a newline-terminated line protocol body with `points` lines.
+        if not data:
+            return
         if self._cfg.dry_run:
+            lines = data.decode("utf-8", errors="replace").splitlines()
             for ln in lines[:5]:
                 log.info("INFLUX_DRY_RUN: %s", ln)
-            if len(lines) > 5:
-                log.info("INFLUX_DRY_RUN: ... (%d more)", len(lines) - 5)
+            if points > 5:
+                log.info("INFLUX_DRY_RUN: ... (%d more)", points - 5)
+            # Counts as delivered, so health and metrics do not report a stalled writer.
+            if self.on_result is not None:
+                self.on_result(204, 0.0, points)
             return
 
-        qs = {"db": self._cfg.db, "precision": "ns"}
-        if self._cfg.rp:
-            qs["rp"] = self._cfg.rp
-        endpoint = f"{self._cfg.url}/write?{urllib.parse.urlencode(qs)}"
-        data = ("\n".join(lines) + "\n").encode("utf-8")
-
-        req = urllib.request.Request(endpoint, data=data, method="POST")
-        req.add_header("Content-Type", "text/plain; charset=utf-8")
-
-        if self._cfg.username and self._cfg.password:
-            token = base64.b64encode(f"{self._cfg.username}:{self._cfg.password}".encode("utf-8")).decode("ascii")
-            req.add_header("Authorization", f"Basic {token}")
+        headers = self._headers
+        raw_len = len(data)
+        if self._cfg.gzip and raw_len >= self._cfg.gzip_min_bytes:
+            data = gzip.compress(data, compresslevel=self._cfg.gzip_level, mtime=0)
+            headers = {**headers, "Content-Encoding": "gzip"}
 
+        t0 = time.perf_counter()
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
-                # InfluxDB 1.x returns 204 No Content on success.
-                if resp.status not in (204, 200):
-                    body = resp.read(4000).decode("utf-8", errors="replace")
-                    raise RuntimeError(f"Influx write failed: HTTP {resp.status}: {body}")
-        except urllib.error.HTTPError as e:
-            body = e.read(4000).decode("utf-8", errors="replace") if hasattr(e, "read") else ""
-            raise RuntimeError(f"Influx write failed: HTTP {getattr(e, 'code', '?')}: {body}") from e
+            status, body = self._pool.request("POST", self._path, body=data, headers=headers)
         except Exception:
-            log.exception("Influx write error (endpoint=%s, points=%d)", endpoint, len(lines))
+            log.exception("Influx write error (endpoint=%s%s, points=%d)", self._cfg.url, self._path, points)
+            if self.on_result is not None:
+                self.on_result(0, time.perf_counter() - t0, points)
             raise
+        latency = time.perf_counter() - t0
+        self.requests += 1
+        self.last_latency_s = latency
+        self.total_latency_s += latency
+        self.bytes_sent += len(data)
+        log.debug("Influx write: %d points, %d bytes (%d raw), HTTP %d in %.1f ms", points, len(data), raw_len, status, latency * 1000)
+        if self.on_result is not None:
+            self.on_result(status, latency, points)
+
+        # InfluxDB returns 204 No Content on success.
+        if status not in (204, 200):
+            msg = body[:4000].decode("utf-8", errors="replace")
+            raise InfluxWriteError(f"Influx write failed: HTTP {status}: {msg}", status)
+
+    def close(self) -> None:
+        self._pool.close()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import logging
+
+from ._env import env_int
+
+
+log = logging.getLogger(__name__)
+
+# taptap events are a few hundred bytes; anything this long is a garbled bus frame.
+DEFAULT_MAX_LINE = 64 * 1024
+
+
+def max_line_from_env() -> int:
+    return max(1024, env_int("TIGO_MAX_LINE_BYTES", DEFAULT_MAX_LINE))
+
+
+class LineSplitter:
+    """Splits a byte stream fed in arbitrary chunks into stripped, non-empty lines.
+
+    Chunks are appended to one reusable `bytearray`; lines are located with
+    `find()` and copied out of a `memoryview` once, as `bytes` for the decoder.
+    `feed()` returns all complete lines of a chunk, so the caller handles a
+    whole sub-batch per wakeup. Lines longer than `max_line` (also while still
+    incomplete, so a stream without newlines cannot grow the buffer) and lines
+    that are not valid UTF-8 are dropped and counted instead of raising.
+    """
+
+    def __init__(self, max_line: int = DEFAULT_MAX_LINE, label: str = "input") -> None:
+        self._buf = bytearray()
+        self._max = max_line
+        self._label = label
+        # Inside an overlong line: drop everything up to the next newline.
+        self._discard = False
+
+        self.lines = 0
+        self.overlong = 0
+        self.invalid_utf8 = 0
+
+    @property
+    def pending(self) -> int:
+        """Bytes of the incomplete line held back; `stream position - pending` is the next line's offset."""
+        return len(self._buf)
+
+    def reset(self) -> None:
+        """Forget a partial line (the stream was restarted); counters are kept."""
+        self._buf.clear()
+        self._discard = False
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        buf = self._buf
+        buf += chunk
+        out: list[bytes] = []
+        find = buf.find
+        max_line = self._max
+        start = 0
+        with memoryview(buf) as mv:
+            while True:
+                nl = find(b"\n", start)
+                if nl < 0:
+                    break
+                if self._discard:
+                    self._discard = False
+                elif nl - start > max_line:
+                    self._skip_overlong()
+                else:
+                    raw = bytes(mv[start:nl]).strip()
+                    if raw:
+                        self._accept(raw, out)
+                start = nl + 1
+        if start:
+            del buf[:start]
+        if len(buf) > max_line:
+            if not self._discard:
+                self._skip_overlong()
+                self._discard = True
+            buf.clear()
+        return out
+
+    def finish(self) -> list[bytes]:
+        """The unterminated last line at EOF (tolerated, e.g. a capture cut off by a crash)."""
+        out: list[bytes] = []
+        raw = bytes(self._buf).strip()
+        if raw and not self._discard:
+            self._accept(raw, out)
+        self.reset()
+        return out
+
+    def _accept(self, raw: bytes, out: list[bytes]) -> None:
+        # taptap emits ASCII JSON; only non-ASCII lines pay for the UTF-8 check.
+        if not raw.isascii():
+            try:
+                raw.decode()
+            except UnicodeDecodeError:
+                self.invalid_utf8 += 1
+                if self.invalid_utf8 == 1 or self.invalid_utf8 % 1000 == 0:
+                    log.warning("%s: skipping line that is not valid UTF-8 (%d so far): %r", self._label, self.invalid_utf8, raw[:200])
+                return
+        self.lines += 1
+        out.append(raw)
+
+    def _skip_overlong(self) -> None:
+        self.overlong += 1
+        if self.overlong == 1 or self.overlong % 1000 == 0:
+            log.warning("%s: skipping line longer than %d bytes (%d so far)", self._label, self._max, self.overlong)
@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ._env import env_bool, env_float, env_int, env_str
+from .rollups import parse_duration
+from .statefile import atomic_write_json, load_json
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+# Each window is covered by this many slots (+ the current, partial one), so a
+# window's edge is accurate to 1/_SLOTS of its length.
+_SLOTS = 12
+_ZERO_KEY = -(10**9)
+_SNAPSHOT_VERSION = 1
+
+
+class LinearMapping:
+    """Value -> bucket by fixed width (RSSI: width 1 is exact, temperature: 0.5 degC)."""
+
+    def __init__(self, width: float) -> None:
+        self.width = width
+
+    def key(self, v: float) -> int:
+        return math.floor(v / self.width)
+
+    def value(self, k: int) -> float:
+        return (k + 0.5) * self.width if self.width != 1 else float(k)
+
+
+class LogMapping:
+    """Value -> bucket on a log scale with relative accuracy `rel_acc` (DDSketch style, v >= 0)."""
+
+    def __init__(self, rel_acc: float) -> None:
+        self.gamma = (1 + rel_acc) / (1 - rel_acc)
+        self._log_gamma = math.log(self.gamma)
+
+    def key(self, v: float) -> int:
+        if v <= 1e-9:
+            return _ZERO_KEY
+        return math.ceil(math.log(v) / self._log_gamma)
+
+    def value(self, k: int) -> float:
+        if k == _ZERO_KEY:
+            return 0.0
+        return 2 * self.gamma**k / (self.gamma + 1)
+
+
+class Sketch:
+    """Mergeable quantile sketch: bucket counts plus exact count/sum/min/max.
+
+    Memory is bounded by the number of distinct buckets, which for link data
+    (RSSI integers, temperatures, inter-arrival times on a log scale) stays small.
+    """
+
+    __slots__ = ("buckets", "count", "sum", "min", "max")
+
+    def __init__(self) -> None:
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, key: int, v: float) -> None:
+        b = self.buckets
+        b[key] = b.get(key, 0) + 1
+        self.count += 1
+        self.sum += v
+        if v < self.min:
+            self.min = v
+        if v > self.max:
+            self.max = v
+
+    def merge(self, other: "Sketch") -> None:
+        b = self.buckets
+        for k, n in other.buckets.items():
+            b[k] = b.get(k, 0) + n
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float, mapping) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        acc = 0
+        for k in sorted(self.buckets):
+            acc += self.buckets[k]
+            if acc > rank:
+                # Clamp to the exact extremes so p0/p100 and sparse sketches stay honest.
+                return min(max(mapping.value(k), self.min), self.max)
+        return self.max
+
+    def summary(self, mapping) -> dict:
+        if not self.count:
+            return {"n": 0}
+        return {
+            "n": self.count,
+            "mean": self.sum / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5, mapping),
+            "p95": self.quantile(0.95, mapping),
+        }
+
+    def to_json(self) -> list:
+        return [self.count, self.sum, self.min, self.max, [[k, n] for k, n in self.buckets.items()]]
+
+    @staticmethod
+    def from_json(obj: list) -> "Sketch":
+        s = Sketch()
+        s.count, s.sum, s.min, s.max = int(obj[0]), float(obj[1]), float(obj[2]), float(obj[3])
+        s.buckets = {int(k): int(n) for k, n in obj[4]}
+        return s
+
+
+# Metric name -> bucket mapping; values come from PowerReport.rssi, .temperature and the report spacing.
+METRICS = {
+    "rssi": LinearMapping(1.0),
+    "temperature_c": LinearMapping(0.5),
+    "interarrival_s": LogMapping(0.02),
+}
+
+
+@dataclass(frozen=True)
+class LinkStatsConfig:
+    enabled: bool
+    windows: tuple[str, ...]
+    path: str
+    snapshot_s: float
+    listen: str
+    max_nodes: int
+
+    @staticmethod
+    def from_env() -> "LinkStatsConfig":
+        windows = tuple(w.strip() for w in env_str("TIGO_LINKSTATS_WINDOWS", "1h,24h,7d").split(",") if w.strip())
+        for w in windows:
+            parse_duration(w)
+        return LinkStatsConfig(
+            enabled=env_bool("TIGO_LINKSTATS_ENABLED", False),
+            windows=windows,
+            path=env_str("TIGO_LINKSTATS_FILE", "linkstats.json"),
+            snapshot_s=env_float("TIGO_LINKSTATS_SNAPSHOT_S", 300.0),
+            listen=env_str("TIGO_LINKSTATS_LISTEN", "127.0.0.1:9110"),
+            max_nodes=env_int("TIGO_LINKSTATS_MAX_NODES", 5000),
+        )
+
+
+class _NodeState:
+    __slots__ = ("last_ns", "slots")
+
+    def __init__(self, n_windows: int) -> None:
+        self.last_ns = 0
+        # Per window: slot index -> {metric: Sketch}
+        self.slots: list[dict[int, dict[str, Sketch]]] = [{} for _ in range(n_windows)]
+
+
+class LinkStats:
+    """Per node link quality over sliding windows, maintained from the report stream.
+
+    For every node and window the window is split into `_SLOTS` slots keyed by
+    event time; each slot holds one sketch per metric (RSSI, temperature,
+    inter-arrival time between reports). Queries merge the slots that fall into
+    the window, old slots are pruned as time moves on. State is snapshotted to
+    `path` so a restart keeps its history, and served as JSON via `render()`.
+    """
+
+    def __init__(self, cfg: LinkStatsConfig) -> None:
+        self._cfg = cfg
+        self._windows = [(w, parse_duration(w) * _NS // _SLOTS) for w in cfg.windows]
+        self._nodes: dict[tuple[str, int, int], _NodeState] = {}
+        self._mappings = tuple(METRICS.items())
+
+        self.observed = 0
+        self.snapshots = 0
+
+    def observe(self, pr: "PowerReport") -> None:
+        key = (pr.source or "", pr.gateway_id, pr.node_id)
+        st = self._nodes.get(key)
+        if st is None:
+            if len(self._nodes) >= self._cfg.max_nodes:
+                return
+            st = self._nodes[key] = _NodeState(len(self._windows))
+        ts = pr.timestamp_ns
+        values = [pr.rssi, pr.temperature, None]
+        if st.last_ns and ts > st.last_ns:
+            values[2] = (ts - st.last_ns) / _NS
+        if ts > st.last_ns:
+            st.last_ns = ts
+        for (_, slot_ns), slots in zip(self._windows, st.slots):
+            idx = ts // slot_ns
+            sk = slots.get(idx)
+            if sk is None:
+                sk = slots[idx] = {name: Sketch() for name in METRICS}
+                for old in [i for i in slots if i <= idx - _SLOTS - 1]:
+                    del slots[old]
+            for (name, mapping), v in zip(self._mappings, values):
+                if v is not None:
+                    sk[name].add(mapping.key(v), v)
+        self.observed += 1
+
+    def query(self, window: str, now_ns: int | None = None) -> list[dict]:
+        """Per node summaries for one configured window."""
+        names = [w for w, _ in self._windows]
+        if window not in names:
+            raise KeyError(window)
+        i = names.index(window)
+        slot_ns = self._windows[i][1]
+        now_idx = (now_ns or time.time_ns()) // slot_ns
+        out = []
+        for (source, gw, node), st in sorted(self._nodes.items()):
+            merged = {name: Sketch() for name in METRICS}
+            for idx, sk in st.slots[i].items():
+                if now_idx - _SLOTS < idx <= now_idx:
+                    for name, s in sk.items():
+                        merged[name].merge(s)
+            if not merged["rssi"].count:
+                continue
+            row: dict = {"source": source, "gateway_id": gw, "node_id": node, "last_ns": st.last_ns}
+            for name, mapping in self._mappings:
+                row[name] = merged[name].summary(mapping)
+            out.append(row)
+        return out
+
+    def render(self, query: str = "") -> tuple[str, bytes]:
+        """HTTP handler body for `/linkstats?window=24h[,7d]` (all windows by default)."""
+        params = dict(p.partition("=")[::2] for p in query.split("&") if p)
+        wanted = [w for w in params.get("window", "").split(",") if w] or [w for w, _ in self._windows]
+        try:
+            body = {"windows": {w: self.query(w) for w in wanted}}
+        except KeyError as e:
+            return "400 Bad Request", json.dumps({"error": f"unknown window {e.args[0]}", "windows": [w for w, _ in self._windows]}).encode()
+        return "200 OK", json.dumps(body, separators=(",", ":")).encode()
+
+    def snapshot_obj(self) -> dict:
+        # Built on the event loop (the state is not locked); only the file write goes to a thread.
+        nodes = []
+        for (source, gw, node), st in self._nodes.items():
+            nodes.append(
+                [
+                    source,
+                    gw,
+                    node,
+                    st.last_ns,
+                    [
+                        [[idx, {name: s.to_json() for name, s in sk.items() if s.count}] for idx, sk in slots.items()]
+                        for slots in st.slots
+                    ],
+                ]
+            )
+        return {"version": _SNAPSHOT_VERSION, "windows": [w for w, _ in self._windows], "nodes": nodes}
+
+    def snapshot(self) -> None:
+        atomic_write_json(self._cfg.path, self.snapshot_obj())
+        self.snapshots += 1
+
+    def load(self) -> None:
+        try:
+            obj = load_json(self._cfg.path, default=None)
+        except ValueError:
+            log.warning("LinkStats: ignoring unreadable snapshot %s", self._cfg.path)
+            return
+        if not obj or obj.get("version") != _SNAPSHOT_VERSION:
+            return
+        # Only windows that are still configured (in the same position) are restored.
+        old = obj.get("windows") or []
+        names = [w for w, _ in self._windows]
+        for source, gw, node, last_ns, per_window in obj.get("nodes") or []:
+            st = _NodeState(len(names))
+            st.last_ns = last_ns
+            for w, slots in zip(old, per_window):
+                if w in names:
+                    st.slots[names.index(w)] = {
+                        int(idx): {name: Sketch.from_json(sk[name]) if name in sk else Sketch() for name in METRICS}
+                        for idx, sk in slots
+                    }
+            self._nodes[(source, gw, node)] = st
+        log.info("LinkStats: restored %d node(s) from %s", len(self._nodes), self._cfg.path)
+
+    async def run_snapshots(self) -> None:
+        while True:
+            await asyncio.sleep(self._cfg.snapshot_s)
+            obj = self.snapshot_obj()
+            try:
+                await asyncio.to_thread(atomic_write_json, self._cfg.path, obj)
+                self.snapshots += 1
+            except OSError as e:
+                log.warning("LinkStats: cannot write snapshot %s: %s", self._cfg.path, e)
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from ._env import env_float, env_str
+
+
+log = logging.getLogger(__name__)
+
+# Write latencies (s) and batch sizes (points).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+@dataclass(frozen=True)
+class MetricsConfig:
+    listen: str
+    loop_lag_interval_s: float
+
+    @staticmethod
+    def from_env() -> "MetricsConfig":
+        return MetricsConfig(
+            listen=env_str("TIGO_METRICS_LISTEN", ""),
+            loop_lag_interval_s=env_float("TIGO_METRICS_LOOP_LAG_S", 0.5),
+        )
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, int) or v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    inner = ",".join(f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for n, v in zip(names, values))
+    return "{" + inner + "}"
+
+
+class Value:
+    """A single counter/gauge sample. Bind it once and call `inc()` in the hot path."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, n: int | float = 1) -> None:
+        self.value += n
+
+    def set(self, v: int | float) -> None:
+        self.value = v
+
+
+class Metric:
+    """Counter or gauge, optionally with labels.
+
+    `labels(*values)` returns the bound `Value` for one label set; callers keep
+    that reference, so the per-event cost is one attribute add. For label sets
+    only known at runtime (e.g. per HTTP status) `inc_key()` does a single tuple-keyed
+    dict update; labels are only formatted at scrape time.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, Value] = {}
+        self._keyed: dict[tuple, int] = {}
+
+    def labels(self, *values) -> Value:
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values!r}")
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = Value()
+        return child
+
+    def inc_key(self, key: tuple, n: int = 1) -> None:
+        keyed = self._keyed
+        keyed[key] = keyed.get(key, 0) + n
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        for key, child in self._children.items():
+            yield self.name, _labels(self.labelnames, key), child.value
+        for key, v in self._keyed.items():
+            yield self.name, _labels(self.labelnames, key), v
+
+
+class Histogram:
+    """Fixed-bucket histogram; thread safe (write latencies are observed from worker threads)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float]) -> None:
+        self.name = name
+        self.help = help
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        i = bisect_left(self._bounds, v)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += v
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        acc = 0
+        for bound, c in zip((*self._bounds, math.inf), counts):
+            acc += c
+            yield f"{self.name}_bucket", f'{{le="{_fmt(bound)}"}}', acc
+        yield f"{self.name}_sum", "", total_sum
+        yield f"{self.name}_count", "", acc
+
+
+class CallbackMetric:
+    """Counter/gauge whose value is read from the owning object at scrape time (no hot-path cost).
+
+    With `labelnames`, `fn` returns an iterable of (label values, value) pairs instead.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable[[], object], labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        try:
+            if not self.labelnames:
+                yield self.name, "", self._fn()
+                return
+            for values, v in list(self._fn()):
+                yield self.name, _labels(self.labelnames, values), v
+        except Exception:
+            log.debug("Metrics: callback for %s failed", self.name, exc_info=True)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, object] = {}
+
+    def _add(self, m):
+        if m.name in self._metrics:
+            raise ValueError(f"Metric {m.name} registered twice")
+        self._metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Metric:
+        return self._add(Metric(name, help, "counter", labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Metric:
+        return self._add(Metric(name, help, "gauge", labelnames))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float]) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def counter_fn(self, name: str, help: str, fn: Callable[[], object], labelnames: Iterable[str] = ()) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, "counter", fn, labelnames))
+
+    def gauge_fn(self, name: str, help: str, fn: Callable[[], object], labelnames: Iterable[str] = ()) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, "gauge", fn, labelnames))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        out: list[str] = []
+        for m in self._metrics.values():
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, v in m.samples():
+                out.append(f"{name}{labels} {_fmt(v)}")
+        return "\n".join(out) + "\n"
+
+
+class IngestMetrics:
+    """The daemon's metrics, pre-bound for the hot paths in `_run`, the pipeline and the writer."""
+
+    def __init__(self, registry: Registry | None = None) -> None:
+        r = self.registry = registry or Registry()
+        self.lines_read = r.counter("tigo_lines_read_total", "Raw lines read from taptap").labels()
+        failures = r.counter("tigo_parse_failures_total", "Lines that could not be decoded", ("kind",))
+        self.parse_failures = {kind: failures.labels(kind) for kind in ("json", "envelope", "payload")}
+        self.batch_size = r.histogram("tigo_batch_size_points", "Points per dispatched batch", BATCH_BUCKETS)
+        flushes = r.counter("tigo_batch_flush_total", "Dispatched batches by flush reason", ("reason",))
+        self.flush_reason = {reason: flushes.labels(reason) for reason in ("size", "timer", "close")}
+        self.write_latency = r.histogram("tigo_influx_write_seconds", "Influx /write request latency", LATENCY_BUCKETS)
+        self.write_points = r.counter("tigo_influx_points_written_total", "Points accepted by Influx").labels()
+        self.write_errors = r.counter(
+            "tigo_influx_write_errors_total", "Failed Influx writes by HTTP status (0 = connection error)", ("code",)
+        )
+        self.loop_lag = r.gauge("tigo_event_loop_lag_last_seconds", "Last measured event loop lag").labels()
+        self.loop_lag_hist = r.histogram("tigo_event_loop_lag_seconds", "Event loop lag", LAG_BUCKETS)
+
+    def on_flush(self, points: int, reason: str) -> None:
+        self.batch_size.observe(points)
+        self.flush_reason[reason].inc()
+
+    def on_write(self, status: int, latency_s: float, points: int) -> None:
+        # Called from writer threads; Value.inc is not atomic but a lost increment is acceptable here.
+        if status in (200, 204):
+            self.write_latency.observe(latency_s)
+            self.write_points.inc(points)
+        else:
+            self.write_errors.inc_key((str(status),))
+
+    async def monitor_loop_lag(self, interval_s: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(interval_s)
+            lag = max(0.0, loop.time() - t0 - interval_s)
+            self.loop_lag.set(lag)
+            self.loop_lag_hist.observe(lag)
+
+
+class MetricsServer:
+    """Minimal asyncio HTTP server for `GET /metrics` (no framework dependency).
+
+    Further JSON endpoints can be added with `add_route(path, fn)`; `fn` gets the
+    query string and returns (HTTP status line, body).
+    """
+
+    def __init__(self, registry: Registry | None, listen: str) -> None:
+        host, _, port = listen.rpartition(":")
+        if not port.isdigit():
+            raise ValueError(f"Listen address must be host:port, got {listen!r}")
+        self._registry = registry
+        self._routes: dict[str, Callable[[str], tuple[str, bytes]]] = {}
+        self._host = host.strip("[]") or "0.0.0.0"
+        self._port = int(port)
+        self._server: asyncio.AbstractServer | None = None
+
+    def add_route(self, path: str, fn: Callable[[str], tuple[str, bytes]]) -> None:
+        self._routes[path] = fn
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        paths = (["/metrics"] if self._registry is not None else []) + list(self._routes)
+        log.info("Metrics: serving %s on http://%s:%d", ", ".join(paths), self._host, self._port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while True:
+                h = await asyncio.wait_for(reader.readline(), timeout=5)
+                if h in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.decode("latin-1").split()
+            path, _, query = parts[1].partition("?") if len(parts) >= 2 and parts[0] == "GET" else ("", "", "")
+            if path == "/metrics" and self._registry is not None:
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", self._registry.render().encode()
+            elif path in self._routes:
+                status, body = self._routes[path](query)
+                ctype = "application/json"
+            else:
+                status, ctype, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import struct
+
+
+log = logging.getLogger(__name__)
+
+# MQTT 3.1.1 control packet types (upper nibble of the fixed header).
+_CONNECT = 0x10
+_CONNACK = 0x20
+_PUBLISH = 0x30
+_PINGREQ = 0xC0
+_PINGRESP = 0xD0
+_DISCONNECT = 0xE0
+
+_CONNACK_ERRORS = {
+    1: "unacceptable protocol version",
+    2: "client id rejected",
+    3: "server unavailable",
+    4: "bad user name or password",
+    5: "not authorized",
+}
+
+
+class MqttError(ConnectionError):
+    pass
+
+
+def _varint(n: int) -> bytes:
+    # "Remaining length" encoding: 7 bits per byte, high bit = more bytes follow.
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _str(s: str | bytes) -> bytes:
+    b = s.encode("utf-8") if isinstance(s, str) else s
+    return struct.pack("!H", len(b)) + b
+
+
+def publish_packet(topic: str, payload: bytes, retain: bool = False) -> bytes:
+    """QoS 0 PUBLISH packet (no packet id)."""
+    body = _str(topic) + payload
+    return bytes((_PUBLISH | (1 if retain else 0),)) + _varint(len(body)) + body
+
+
+class MqttClient:
+    """Minimal persistent MQTT 3.1.1 publisher on asyncio streams (QoS 0 only, no dependency).
+
+    `connect()` opens the connection and waits for CONNACK; a reader task consumes
+    PINGRESP packets and notices when the broker closes the connection, a pinger
+    keeps the session alive. `publish()` only buffers, `flush()` waits for the
+    socket to drain, so a batch of messages costs one round of syscalls.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 1883,
+        client_id: str = "tigo-ingest",
+        username: str | None = None,
+        password: str | None = None,
+        keepalive_s: int = 60,
+        timeout_s: float = 10.0,
+    ) -> None:
+        self._host = host
+        self._port = port
+        self._client_id = client_id
+        self._username = username
+        self._password = password
+        self._keepalive_s = keepalive_s
+        self._timeout_s = timeout_s
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        self.connects = 0
+        self.published = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        await self.close()
+        flags = 0x02  # clean session
+        payload = _str(self._client_id)
+        if self._username:
+            flags |= 0x80
+            payload += _str(self._username)
+            if self._password:
+                flags |= 0x40
+                payload += _str(self._password)
+        var = _str("MQTT") + bytes((4, flags)) + struct.pack("!H", self._keepalive_s)
+        body = var + payload
+        async with asyncio.timeout(self._timeout_s):
+            reader, writer = await asyncio.open_connection(self._host, self._port)
+            try:
+                writer.write(bytes((_CONNECT,)) + _varint(len(body)) + body)
+                await writer.drain()
+                hdr = await reader.readexactly(4)
+            except BaseException:
+                writer.close()
+                raise
+        if hdr[0] != _CONNACK or hdr[3] != 0:
+            writer.close()
+            reason = _CONNACK_ERRORS.get(hdr[3], f"code {hdr[3]}") if hdr[0] == _CONNACK else "no CONNACK"
+            raise MqttError(f"MQTT connect to {self._host}:{self._port} refused: {reason}")
+        self._reader, self._writer = reader, writer
+        self.connects += 1
+        self._tasks = [asyncio.create_task(self._read_loop()), asyncio.create_task(self._ping_loop())]
+        log.info("MQTT: connected to %s:%d", self._host, self._port)
+
+    async def _read_loop(self) -> None:
+        # The broker only sends PINGRESP to a QoS 0 publisher; EOF means the connection is gone.
+        assert self._reader is not None and self._writer is not None
+        try:
+            while True:
+                hdr = await self._reader.readexactly(1)
+                n, shift = 0, 0
+                while True:
+                    b = (await self._reader.readexactly(1))[0]
+                    n |= (b & 0x7F) << shift
+                    shift += 7
+                    if not b & 0x80:
+                        break
+                if n:
+                    await self._reader.readexactly(n)
+                if hdr[0] & 0xF0 != _PINGRESP:
+                    log.debug("MQTT: ignoring packet type 0x%02x", hdr[0])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            log.warning("MQTT: connection to %s:%d closed by broker", self._host, self._port)
+            self._writer.close()
+
+    async def _ping_loop(self) -> None:
+        assert self._writer is not None
+        while True:
+            await asyncio.sleep(max(1.0, self._keepalive_s / 2))
+            if self._writer.is_closing():
+                return
+            self._writer.write(bytes((_PINGREQ, 0)))
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        if not self.connected:
+            raise MqttError("MQTT not connected")
+        assert self._writer is not None
+        self._writer.write(publish_packet(topic, payload, retain))
+        self.published += 1
+
+    async def flush(self) -> None:
+        if not self.connected:
+            raise MqttError("MQTT not connected")
+        assert self._writer is not None
+        async with asyncio.timeout(self._timeout_s):
+            await self._writer.drain()
+
+    async def close(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        writer, self._writer, self._reader = self._writer, None, None
+        if writer is None:
+            return
+        if not writer.is_closing():
+            try:
+                writer.write(bytes((_DISCONNECT, 0)))
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                pass
+            writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
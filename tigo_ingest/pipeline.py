@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from ._env import env_bool, env_float, env_int, env_str
+
+
+log = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+_WAKE = object()
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    queue_max: int
+    overflow: str
+    batch_max: int
+    batch_flush_s: float
+    write_concurrency: int
+    batch_min: int
+    latency_target_s: float
+    adaptive: bool
+
+    @staticmethod
+    def from_env() -> "PipelineConfig":
+        overflow = env_str("TIGO_QUEUE_OVERFLOW", "spill").lower().replace("-", "_")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"TIGO_QUEUE_OVERFLOW must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        batch_max = max(1, env_int("INFLUX_BATCH_MAX", 250))
+        return PipelineConfig(
+            queue_max=env_int("TIGO_QUEUE_MAX", 10000),
+            overflow=overflow,
+            batch_max=batch_max,
+            batch_flush_s=env_float("INFLUX_BATCH_FLUSH_S", 2.0),
+            write_concurrency=max(1, env_int("TIGO_WRITE_CONCURRENCY", 2)),
+            batch_min=min(batch_max, max(1, env_int("TIGO_BATCH_MIN", max(1, batch_max // 10)))),
+            latency_target_s=env_float("TIGO_BATCH_LATENCY_TARGET_S", 1.0),
+            adaptive=env_bool("TIGO_BATCH_ADAPTIVE", True),
+        )
+
+
+class FlushController:
+    """Batch size between `batch_min` and `INFLUX_BATCH_MAX`, adapted to write results.
+
+    AIMD on every finished batch write: a failure halves the target; a write
+    slower than `latency_target_s` shrinks it by a quarter while the writer keeps
+    up; a full batch grows it by `batch_max / 8` when the write was fast or the
+    queue holds more than another batch (under load, fewer larger requests win
+    even against a slow server). Independent of the size, no point waits longer
+    than `max_age_s` (`INFLUX_BATCH_FLUSH_S`) before its batch is dispatched.
+    """
+
+    def __init__(self, batch_min: int, batch_max: int, max_age_s: float, latency_target_s: float, adaptive: bool = True) -> None:
+        self.batch_min = max(1, min(batch_min, batch_max))
+        self.batch_max = batch_max
+        self.max_age_s = max_age_s
+        self.latency_target_s = latency_target_s
+        self._adaptive = adaptive
+        self._step = max(1, batch_max // 8)
+
+        self.target = batch_max
+        self.latency_ewma_s = 0.0
+        self.error_rate = 0.0
+        self.grown = 0
+        self.shrunk = 0
+
+    @staticmethod
+    def from_config(cfg: PipelineConfig) -> "FlushController":
+        return FlushController(cfg.batch_min, cfg.batch_max, cfg.batch_flush_s, cfg.latency_target_s, cfg.adaptive)
+
+    @staticmethod
+    def for_spool(cfg: PipelineConfig, bulk_max: int) -> "FlushController":
+        # With the spool, Influx sees the drainer's bulk requests (up to TIGO_SPOOL_BULK_MAX lines), not the batches.
+        return FlushController(max(1, bulk_max // 10), bulk_max, cfg.batch_flush_s, cfg.latency_target_s, cfg.adaptive)
+
+    def observe(self, points: int, latency_s: float, ok: bool, full: bool, backlog: int = 0) -> None:
+        self.latency_ewma_s = latency_s if not self.latency_ewma_s else 0.8 * self.latency_ewma_s + 0.2 * latency_s
+        self.error_rate = 0.8 * self.error_rate + (0.0 if ok else 0.2)
+        if not self._adaptive:
+            return
+        target = self.target
+        loaded = backlog > target
+        if not ok:
+            target //= 2
+        elif full and (loaded or latency_s < self.latency_target_s / 2):
+            target += self._step
+        elif latency_s > self.latency_target_s and not loaded:
+            target = target * 3 // 4
+        target = min(self.batch_max, max(self.batch_min, target))
+        if target != self.target:
+            if target > self.target:
+                self.grown += 1
+            else:
+                self.shrunk += 1
+            log.debug(
+                "Batch target %d -> %d (%d points in %.0f ms, ok=%s)", self.target, target, points, latency_s * 1000, ok
+            )
+            self.target = target
+
+
+class IngestPipeline:
+    """Bounded queue between the taptap reader and the batch writer stage.
+
+    The reader `put()`s parsed items (PowerReport or pre-encoded line protocol str);
+    `run()` groups them into batches of `controller.target` items and dispatches
+    up to `write_concurrency` batch writes at a time; a partial batch goes out
+    once its oldest item has waited `INFLUX_BATCH_FLUSH_S`, whether or not more
+    input arrives. When the queue is full the overflow policy decides:
+    `block` waits (backpressure), `drop_oldest` discards the oldest item and
+    `spill` encodes the item and hands it to `spill` (the on-disk spool).
+    """
+
+    def __init__(
+        self,
+        cfg: PipelineConfig,
+        encode: Callable[[object], str | None],
+        write_batch: Callable[[list[str]], Awaitable[None]],
+        spill: Callable[[list[str]], Awaitable[None]] | None = None,
+        on_flush: Callable[[int, str], None] | None = None,
+    ) -> None:
+        self._cfg = cfg
+        self._encode = encode
+        self._write_batch = write_batch
+        self._spill = spill
+        # Called with (points, reason) per dispatched batch; reason is size, timer or close.
+        self._on_flush = on_flush
+        self._overflow = cfg.overflow
+        if self._overflow == "spill" and spill is None:
+            log.warning("TIGO_QUEUE_OVERFLOW=spill needs the spool (TIGO_SPOOL_DIR); falling back to block")
+            self._overflow = "block"
+        self._q: asyncio.Queue = asyncio.Queue(maxsize=max(1, cfg.queue_max))
+        self._sem = asyncio.Semaphore(cfg.write_concurrency)
+        self._inflight: set[asyncio.Task] = set()
+        self._spill_buf: list[str] = []
+        self._closed = False
+        self.controller = FlushController.from_config(cfg)
+
+        self.dropped = 0
+        self.spilled = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def put(self, item) -> None:
+        q = self._q
+        if not q.full():
+            q.put_nowait(item)
+            return
+        # A reader with buffered input never yields on its own; give the writer
+        # stage one turn before the overflow policy kicks in.
+        await asyncio.sleep(0)
+        if not q.full():
+            q.put_nowait(item)
+            return
+        if self._overflow == "drop_oldest":
+            try:
+                q.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+            q.put_nowait(item)
+        elif self._overflow == "spill":
+            line = item if type(item) is str else self._encode(item)
+            if line is None:
+                return
+            self._spill_buf.append(line)
+            self.spilled += 1
+            if len(self._spill_buf) >= self._cfg.batch_max:
+                await self._flush_spill()
+        else:
+            await q.put(item)
+
+    async def _flush_spill(self) -> None:
+        if not self._spill_buf or self._spill is None:
+            return
+        lines = self._spill_buf
+        self._spill_buf = []
+        await self._spill(lines)
+
+    async def run(self) -> None:
+        q = self._q
+        ctl = self.controller
+        encode = self._encode
+        batch: list[str] = []
+        # Monotonic time by which the oldest item in `batch` has to be dispatched (0 = batch empty).
+        deadline = 0.0
+        while True:
+            # Shutting down: drain the rest in batches as large as allowed.
+            target = ctl.batch_max if self._closed else ctl.target
+            # Drain whatever is already queued without timers; only wait when idle.
+            while len(batch) < target:
+                try:
+                    item = q.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is not _WAKE:
+                    # None = refused by the series guard.
+                    line = item if type(item) is str else encode(item)
+                    if line is not None:
+                        batch.append(line)
+            n = len(batch)
+            now = time.monotonic()
+            if n and not deadline:
+                deadline = now + ctl.max_age_s
+            if n >= target or (n and now >= deadline):
+                await self._dispatch(batch, "size" if n >= target else "timer")
+                batch = []
+                deadline = 0.0
+                await self._flush_spill()
+                continue
+            if self._closed and q.empty():
+                if n:
+                    await self._dispatch(batch, "close")
+                await self._flush_spill()
+                return
+            try:
+                if n:
+                    async with asyncio.timeout(deadline - now):
+                        item = await q.get()
+                else:
+                    # Nothing pending: hand over spilled lines before sleeping until input arrives.
+                    await self._flush_spill()
+                    item = await q.get()
+            except TimeoutError:
+                continue
+            if item is not _WAKE:
+                line = item if type(item) is str else encode(item)
+                if line is not None:
+                    batch.append(line)
+
+    async def _dispatch(self, lines: list[str], reason: str) -> None:
+        await self._sem.acquire()
+        self.batches += 1
+        if self._on_flush is not None:
+            self._on_flush(len(lines), reason)
+        task = asyncio.create_task(self._write(lines, reason == "size"))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _write(self, lines: list[str], full: bool) -> None:
+        t0 = time.monotonic()
+        ok = False
+        try:
+            await self._write_batch(lines)
+            ok = True
+        except Exception:
+            self.write_errors += 1
+            log.exception("Batch write failed, %d points lost", len(lines))
+        finally:
+            self.controller.observe(len(lines), time.monotonic() - t0, ok, full, self._q.qsize())
+            self._sem.release()
+
+    async def close(self, runner: asyncio.Task) -> None:
+        """Flush everything still queued and wait for in-flight writes."""
+        self._closed = True
+        # Wake the runner if it waits on an empty queue.
+        if not self._q.full():
+            self._q.put_nowait(_WAKE)
+        await runner
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ._env import env_float, env_int, env_str
+from .influx import line_protocol
+from .statefile import atomic_write_json, load_json
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Rolled-up fields, in the order the accumulators store them.
+FIELDS = ("voltage_in_v", "voltage_out_v", "current_in_a", "power_w", "duty_cycle", "temperature_c", "rssi")
+_NF = len(FIELDS)
+_POWER = FIELDS.index("power_w")
+_SNAPSHOT_VERSION = 1
+
+
+def parse_duration(s: str) -> int:
+    """'1m' / '15m' / '1h' / '30s' -> seconds."""
+    s = s.strip().lower()
+    if len(s) < 2 or s[-1] not in _UNITS or not s[:-1].isdigit():
+        raise ValueError(f"Invalid duration {s!r} (expected e.g. 30s, 1m, 15m, 1h)")
+    return int(s[:-1]) * _UNITS[s[-1]]
+
+
+@dataclass(frozen=True)
+class RollupConfig:
+    resolutions: tuple[str, ...]
+    lateness_s: float
+    node_measurement: str
+    gateway_measurement: str
+    max_nodes: int
+    max_future_s: float
+    path: str
+
+    @staticmethod
+    def from_env(measurement: str) -> "RollupConfig":
+        # Off unless configured, e.g. TIGO_ROLLUPS=1m,15m,1h: each resolution is a new measurement.
+        res = tuple(r.strip() for r in env_str("TIGO_ROLLUPS", "").split(",") if r.strip())
+        return RollupConfig(
+            resolutions=res,
+            lateness_s=env_float("TIGO_ROLLUP_LATENESS_S", 120.0),
+            node_measurement=env_str("TIGO_ROLLUP_NODE_MEASUREMENT", f"{measurement}_{{res}}"),
+            gateway_measurement=env_str("TIGO_ROLLUP_GATEWAY_MEASUREMENT", f"{measurement}_gw_{{res}}"),
+            max_nodes=env_int("TIGO_ROLLUP_MAX_NODES", 5000),
+            max_future_s=env_float("TIGO_ROLLUP_MAX_FUTURE_S", 300.0),
+            path=env_str("TIGO_ROLLUP_FILE", "rollups.json"),
+        )
+
+
+def _new_acc(vals: tuple[float, ...]) -> list[float]:
+    # [count, sums..., mins..., maxs...]
+    return [1, *vals, *vals, *vals]
+
+
+def _merge(acc: list[float], other: list[float]) -> None:
+    acc[0] += other[0]
+    for i in range(1, _NF + 1):
+        acc[i] += other[i]
+        j = i + _NF
+        if other[j] < acc[j]:
+            acc[j] = other[j]
+        k = j + _NF
+        if other[k] > acc[k]:
+            acc[k] = other[k]
+
+
+class RollupEngine:
+    """Streaming mean/min/max/count rollups per node plus summed power per gateway.
+
+    Only the finest resolution is fed per report; coarser resolutions (which must
+    be multiples of it) are built by merging closed fine windows. A window closes
+    once the watermark (newest event time minus `lateness_s`) passes its end;
+    while the stream is idle, event time is advanced with wall clock time so
+    windows still close at dusk. Reports for already closed windows are counted
+    as late and dropped. Reports more than `max_future_s` ahead of wall clock
+    time are dropped too: one bogus timestamp would otherwise push the watermark
+    past every open window and make all later reports late. State is bounded
+    by the open windows times `max_nodes`.
+
+    On shutdown the open windows are saved (`save()`) instead of written as
+    partial points, which the same window would overwrite after a restart;
+    `load()` picks them up again and removes the file, so a crash later on
+    cannot restore them a second time.
+    """
+
+    def __init__(self, cfg: RollupConfig, precision: str = "ns") -> None:
+        secs = sorted({parse_duration(r): r for r in cfg.resolutions}.items())
+        if not secs:
+            raise ValueError("RollupEngine needs at least one resolution")
+        for (prev_s, prev_r), (s, r) in zip(secs, secs[1:]):
+            if s % prev_s:
+                raise ValueError(f"Rollup resolution {r} is not a multiple of {prev_r}")
+        self._cfg = cfg
+        # Write precision of the emitted points (window starts are whole seconds, so nothing is lost).
+        self._precision = precision
+        self._levels = [(s * _NS, r) for s, r in secs]
+        self._base_ns = secs[0][0] * _NS
+        self._lateness_ns = int(cfg.lateness_s * _NS)
+        self._max_future_ns = int(cfg.max_future_s * _NS)
+        # Per level: window_start_ns -> {(source, gateway_id, node_id): acc}
+        self._open: list[dict[int, dict[tuple[str, int, int], list[float]]]] = [{} for _ in self._levels]
+        self._closed_before = 0  # base windows starting before this are closed
+        self._max_ts = 0
+        self._last_event_wall = time.time()
+
+        self.late_dropped = 0
+        self.future_dropped = 0
+        self.overflow_dropped = 0
+        self.emitted = 0
+
+    def observe(self, pr: "PowerReport") -> None:
+        ts = pr.timestamp_ns
+        start = ts - ts % self._base_ns
+        if start < self._closed_before:
+            self.late_dropped += 1
+            return
+        now = time.time()
+        if ts > self._max_ts:
+            if ts - int(now * _NS) > self._max_future_ns:
+                self.future_dropped += 1
+                return
+            self._max_ts = ts
+        self._last_event_wall = now
+        win = self._open[0].get(start)
+        if win is None:
+            win = self._open[0][start] = {}
+        key = (pr.source or "", pr.gateway_id, pr.node_id)
+        vin = pr.voltage_in
+        cur = pr.current
+        vals = (vin, pr.voltage_out, cur, vin * cur, pr.duty_cycle, pr.temperature, float(pr.rssi))
+        acc = win.get(key)
+        if acc is None:
+            if len(win) >= self._cfg.max_nodes:
+                self.overflow_dropped += 1
+                return
+            win[key] = _new_acc(vals)
+            return
+        acc[0] += 1
+        for i, v in enumerate(vals, 1):
+            acc[i] += v
+            if v < acc[i + _NF]:
+                acc[i + _NF] = v
+            if v > acc[i + 2 * _NF]:
+                acc[i + 2 * _NF] = v
+
+    def _watermark(self, wall_now: float) -> int:
+        if not self._max_ts:
+            return 0
+        idle_ns = max(0.0, wall_now - self._last_event_wall) * _NS
+        return int(self._max_ts + idle_ns) - self._lateness_ns
+
+    def collect(self, wall_now: float | None = None, final: bool = False) -> list[str]:
+        """Close all windows that are due and return their points as line protocol.
+
+        With `final=True` every open window is emitted (shutdown).
+        """
+        wm = self._watermark(time.time() if wall_now is None else wall_now)
+        out: list[str] = []
+        for lvl, (size_ns, res) in enumerate(self._levels):
+            windows = self._open[lvl]
+            for start in sorted(windows):
+                if not final and start + size_ns > wm:
+                    break
+                nodes = windows.pop(start)
+                if lvl == 0:
+                    self._closed_before = max(self._closed_before, start + size_ns)
+                if lvl + 1 < len(self._levels):
+                    # Feed the next coarser level; it feeds the one after it when it closes.
+                    psize = self._levels[lvl + 1][0]
+                    pwin = self._open[lvl + 1].setdefault(start - start % psize, {})
+                    for key, acc in nodes.items():
+                        pacc = pwin.get(key)
+                        if pacc is None:
+                            pwin[key] = list(acc)
+                        else:
+                            _merge(pacc, acc)
+                out.extend(self._encode(res, start, nodes))
+        self.emitted += len(out)
+        return out
+
+    def snapshot_obj(self) -> dict:
+        return {
+            "version": _SNAPSHOT_VERSION,
+            "resolutions": [res for _, res in self._levels],
+            "closed_before": self._closed_before,
+            "max_ts": self._max_ts,
+            "open": [
+                [[start, [[*key, *acc] for key, acc in nodes.items()]] for start, nodes in windows.items()]
+                for windows in self._open
+            ],
+        }
+
+    def save(self) -> None:
+        atomic_write_json(self._cfg.path, self.snapshot_obj())
+
+    def load(self) -> None:
+        try:
+            obj = load_json(self._cfg.path, default=None)
+        except ValueError:
+            log.warning("Rollups: ignoring unreadable %s", self._cfg.path)
+            obj = None
+        if obj is None:
+            return
+        if obj.get("version") != _SNAPSHOT_VERSION or obj.get("resolutions") != [res for _, res in self._levels]:
+            log.warning("Rollups: %s was saved with other resolutions, open windows are not restored", self._cfg.path)
+        else:
+            n = 3 + 1 + 3 * _NF
+            for lvl, windows in enumerate(obj.get("open") or []):
+                for start, nodes in windows:
+                    win = self._open[lvl].setdefault(int(start), {})
+                    for row in nodes:
+                        if len(row) == n:
+                            win[(str(row[0]), int(row[1]), int(row[2]))] = [float(v) for v in row[3:]]
+            self._closed_before = max(self._closed_before, int(obj.get("closed_before") or 0))
+            self._max_ts = max(self._max_ts, int(obj.get("max_ts") or 0))
+            log.info("Rollups: restored %d open window(s) from %s", sum(len(w) for w in self._open), self._cfg.path)
+        try:
+            os.remove(self._cfg.path)
+        except OSError as e:
+            log.warning("Rollups: cannot remove %s: %s", self._cfg.path, e)
+
+    def _encode(self, res: str, start_ns: int, nodes: dict[tuple[str, int, int], list[float]]) -> list[str]:
+        node_m = self._cfg.node_measurement.format(res=res)
+        gw_m = self._cfg.gateway_measurement.format(res=res)
+        lines: list[str] = []
+        gateways: dict[tuple[str, int], list[float]] = {}  # (source, gateway_id) -> [sum of node mean power, nodes, reports]
+        for (source, gateway_id, node_id), acc in sorted(nodes.items()):
+            n = acc[0]
+            fields: dict[str, object] = {"count": int(n)}
+            for i, name in enumerate(FIELDS, 1):
+                fields[f"{name}_mean"] = acc[i] / n
+                fields[f"{name}_min"] = acc[i + _NF]
+                fields[f"{name}_max"] = acc[i + 2 * _NF]
+            tags = {"src": "tigo", "gateway_id": str(gateway_id), "node_id": str(node_id), "source": source}
+            lines.append(line_protocol(node_m, tags, fields, start_ns, self._precision))
+            g = gateways.setdefault((source, gateway_id), [0.0, 0, 0])
+            g[0] += acc[1 + _POWER] / n
+            g[1] += 1
+            g[2] += n
+        for (source, gateway_id), (power, n_nodes, n_reports) in sorted(gateways.items()):
+            tags = {"src": "tigo", "gateway_id": str(gateway_id), "source": source}
+            fields = {"power_w": power, "nodes": int(n_nodes), "reports": int(n_reports)}
+            lines.append(line_protocol(gw_m, tags, fields, start_ns, self._precision))
+        return lines
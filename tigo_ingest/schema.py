@@ -0,0 +1,388 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import logging
+import tomllib
+from collections import defaultdict
+from dataclasses import dataclass, replace
+
+from ._env import env_int, env_str
+
+
+log = logging.getLogger(__name__)
+
+# Encoder row layout: the constant `src` tag, the series key of a PowerReport
+# (gateway_id .. string), then the measured and derived values.
+ROW = (
+    "src",
+    "gateway_id",
+    "node_id",
+    "gateway_addr",
+    "node_addr",
+    "barcode",
+    "source",
+    "string",
+    "voltage_in_v",
+    "voltage_out_v",
+    "current_in_a",
+    "duty_cycle",
+    "temperature_c",
+    "rssi",
+    "power_w",
+    "current_out_a",
+)
+# Only identity attributes can be tags; measured values would make a series per point.
+_KEY_ATTRS = ROW[:8]
+_STR_ATTRS = ("src", "gateway_addr", "node_addr", "barcode", "source", "string")
+_ADDR_ATTRS = ("gateway_addr", "node_addr")
+ROLES = ("tag", "field", "drop")
+FIELD_TYPES = ("float", "int", "str")
+SERIES_ACTIONS = ("warn", "refuse")
+
+
+class SchemaError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Attribute:
+    """How one PowerReport attribute is written: as tag, as field or not at all."""
+
+    attr: str
+    role: str
+    # Tag key / field key in the written point.
+    name: str
+    # Field type (tags are always strings).
+    type: str
+    # "hex": addresses as 16 hex digits, whether taptap sent an int or a byte array
+    # (applied by the decoder, which still knows the JSON type).
+    format: str = ""
+    # Float fields: decimal places to round to (None = full precision).
+    round: int | None = None
+
+
+def _default_attribute(attr: str) -> Attribute:
+    if attr in _KEY_ATTRS:
+        return Attribute(attr, "tag", attr, "str" if attr in _STR_ATTRS else "int")
+    return Attribute(attr, "field", attr, "int" if attr == "rssi" else "float")
+
+
+@dataclass(frozen=True)
+class PointSchema:
+    """Tag/field mapping for the raw power report measurement (`attributes` in `ROW` order)."""
+
+    attributes: tuple[Attribute, ...]
+    path: str = ""
+
+    @property
+    def tags(self) -> tuple[Attribute, ...]:
+        return tuple(a for a in self.attributes if a.role == "tag")
+
+    @property
+    def fields(self) -> tuple[Attribute, ...]:
+        # Sorted by key, like line_protocol() writes them.
+        return tuple(sorted((a for a in self.attributes if a.role == "field"), key=lambda a: a.name))
+
+    @property
+    def hex_addresses(self) -> tuple[bool, bool]:
+        """(gateway, node): integer addresses to decode as hex, for `make_decoder`."""
+        fmt = {a.attr: a.format for a in self.attributes}
+        return fmt["gateway_addr"] == "hex", fmt["node_addr"] == "hex"
+
+    @property
+    def is_default(self) -> bool:
+        return self.attributes == DEFAULT_SCHEMA.attributes
+
+    def describe(self) -> str:
+        tags = ", ".join(a.name + (f" ({a.format})" if a.format else "") for a in self.tags)
+        fields = ", ".join(f"{a.name}:{a.type}" + (f"/{a.round}" if a.round is not None else "") for a in self.fields)
+        dropped = ", ".join(a.attr for a in self.attributes if a.role == "drop") or "-"
+        return f"tags: {tags}\nfields: {fields}\ndropped: {dropped}"
+
+
+DEFAULT_SCHEMA = PointSchema(tuple(_default_attribute(a) for a in ROW))
+
+
+def _parse_attribute(attr: str, spec) -> Attribute:
+    a = _default_attribute(attr)
+    if isinstance(spec, str):
+        spec = {"as": spec}
+    if not isinstance(spec, dict):
+        raise SchemaError(f"attributes.{attr}: expected a role string or a table, got {spec!r}")
+    unknown = set(spec) - {"as", "name", "type", "format", "round"}
+    if unknown:
+        raise SchemaError(f"attributes.{attr}: unknown key(s) {sorted(unknown)}")
+    role = spec.get("as", a.role)
+    if role not in ROLES:
+        raise SchemaError(f"attributes.{attr}: 'as' must be one of {ROLES}, got {role!r}")
+    if role == "tag" and attr not in _KEY_ATTRS:
+        raise SchemaError(f"attributes.{attr}: measured values cannot be tags (only {', '.join(_KEY_ATTRS)})")
+    typ = spec.get("type", "str" if role == "tag" or attr in _STR_ATTRS else a.type)
+    if typ not in FIELD_TYPES:
+        raise SchemaError(f"attributes.{attr}: 'type' must be one of {FIELD_TYPES}, got {typ!r}")
+    if role == "field" and attr in _STR_ATTRS and typ != "str":
+        raise SchemaError(f"attributes.{attr}: text attributes can only be 'str' fields")
+    fmt = spec.get("format", "")
+    if fmt not in ("", "hex") or (fmt and attr not in _ADDR_ATTRS):
+        raise SchemaError(f"attributes.{attr}: 'format' is only supported as \"hex\" on {', '.join(_ADDR_ATTRS)}")
+    name = spec.get("name", attr)
+    if not isinstance(name, str) or not name:
+        raise SchemaError(f"attributes.{attr}: 'name' must be a non-empty string")
+    digits = spec.get("round")
+    if digits is not None and (type(digits) is not int or digits < 0 or typ != "float"):
+        raise SchemaError(f"attributes.{attr}: 'round' must be a number of decimal places (>= 0) on a float field")
+    return replace(a, role=role, name=name, type=typ, format=fmt, round=digits)
+
+
+def parse_schema(obj: dict, path: str = "") -> PointSchema:
+    attrs = obj.get("attributes", {})
+    if not isinstance(attrs, dict):
+        raise SchemaError("'attributes' must be a table")
+    unknown = set(attrs) - set(ROW)
+    if unknown:
+        raise SchemaError(f"unknown attribute(s) {sorted(unknown)}; known: {', '.join(ROW)}")
+    schema = PointSchema(tuple(_parse_attribute(a, attrs[a]) if a in attrs else _default_attribute(a) for a in ROW), path)
+    if not schema.fields:
+        raise SchemaError("at least one attribute must be written as a field")
+    names = [a.name for a in schema.attributes if a.role != "drop"]
+    dup = sorted({n for n in names if names.count(n) > 1})
+    if dup:
+        raise SchemaError(f"duplicate tag/field name(s) {dup}")
+    return schema
+
+
+def apply_wire(schema: PointSchema, fields: tuple[str, ...] = (), digits: tuple[tuple[str, int], ...] = ()) -> PointSchema:
+    """Compact wire mode: keep only the whitelisted fields and round float fields (by written field name)."""
+    if not fields and not digits:
+        return schema
+    names = {a.name for a in schema.fields}
+    unknown = sorted((set(fields) | {n for n, _ in digits}) - names)
+    if unknown:
+        raise SchemaError(f"unknown field(s) {unknown}; the schema writes {', '.join(sorted(names))}")
+    rounding = dict(digits)
+    attrs = []
+    for a in schema.attributes:
+        if a.role == "field":
+            if fields and a.name not in fields:
+                a = replace(a, role="drop")
+            elif a.name in rounding and a.type == "float":
+                a = replace(a, round=rounding[a.name])
+        attrs.append(a)
+    out = replace(schema, attributes=tuple(attrs))
+    if not out.fields:
+        raise SchemaError("the field whitelist leaves no field to write")
+    return out
+
+
+def load_schema(path: str) -> PointSchema:
+    """Read a schema file (TOML); an empty path is the built-in schema."""
+    if not path:
+        return DEFAULT_SCHEMA
+    try:
+        with open(path, "rb") as f:
+            obj = tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise SchemaError(f"{path}: {e}") from e
+    try:
+        return parse_schema(obj, path)
+    except SchemaError as e:
+        raise SchemaError(f"{path}: {e}") from e
+
+
+@dataclass(frozen=True)
+class SchemaConfig:
+    path: str
+    series_max: int
+    series_action: str
+
+    @staticmethod
+    def from_env() -> "SchemaConfig":
+        action = env_str("TIGO_SERIES_ACTION", "warn").lower()
+        if action not in SERIES_ACTIONS:
+            raise ValueError(f"TIGO_SERIES_ACTION must be one of {SERIES_ACTIONS}, got {action!r}")
+        return SchemaConfig(
+            path=env_str("TIGO_SCHEMA_FILE", ""),
+            series_max=env_int("TIGO_SERIES_MAX", 10000),
+            series_action=action,
+        )
+
+
+class SeriesGuard:
+    """Counts distinct series per measurement and warns about / refuses new ones past `max_series`.
+
+    The encoder asks once per series (when it builds the cached line protocol
+    prefix), so this is off the per-point path. Series are remembered by hash
+    for the lifetime of the process; Influx keeps them in its index just as long.
+    """
+
+    def __init__(self, max_series: int, action: str = "warn") -> None:
+        self._max = max_series
+        self._refuse = action == "refuse"
+        self._seen: dict[str, set[int]] = defaultdict(set)
+
+        self.refused_series = 0
+
+    def series(self) -> dict[str, int]:
+        return {m: len(s) for m, s in self._seen.items()}
+
+    def admit(self, measurement: str, series: str) -> bool:
+        seen = self._seen[measurement]
+        h = hash(series)
+        if h in seen:
+            return True
+        if self._max <= 0 or len(seen) < self._max:
+            seen.add(h)
+            return True
+        if self._refuse:
+            self.refused_series += 1
+            if self.refused_series == 1 or self.refused_series % 1000 == 0:
+                log.warning(
+                    "Series limit: %s has %d series (TIGO_SERIES_MAX=%d), refusing new series (%d so far): %s",
+                    measurement,
+                    len(seen),
+                    self._max,
+                    self.refused_series,
+                    series.strip(),
+                )
+            return False
+        seen.add(h)
+        if (len(seen) - 1) % self._max == 0:
+            log.warning(
+                "Series limit: %s now has %d series (TIGO_SERIES_MAX=%d), check the schema / tags: %s",
+                measurement,
+                len(seen),
+                self._max,
+                series.strip(),
+            )
+        return True
+
+
+async def _report_points(args, schemas: list[PointSchema], measurement: str) -> list[dict]:
+    from .decoder import DecodeError, make_decoder
+    from .influx import PowerReportEncoder
+    from .sources import ReplaySource
+    from .topology import TopologyConfig, TopologyRegistry
+
+    # Every schema decodes and enriches on its own: the address format is applied by the decoder.
+    # Enrich like the daemon would (the topology file is only read).
+    topo_cfg = TopologyConfig.from_env()
+    views = []
+    for s in schemas:
+        topology = TopologyRegistry(topo_cfg, s.hex_addresses) if topo_cfg.enabled else None
+        if topology is not None and topo_cfg.path:
+            topology.load()
+        on_event = functools.partial(topology.observe_event, args.source) if topology is not None else None
+        views.append((make_decoder(hex_addresses=s.hex_addresses), on_event, topology, PowerReportEncoder(measurement, schema=s)))
+    results = [{"points": 0, "series": {}, "nodes": defaultdict(set)} for _ in schemas]
+    decode_errors = 0
+
+    source = ReplaySource(args.paths, since_ns=args.since, until_ns=args.until)
+    try:
+        async for batch in source.batches():
+            for raw in batch:
+                for (decoder, on_event, topology, enc), res in zip(views, results):
+                    try:
+                        pr = decoder.decode(raw, on_event)
+                    except DecodeError:
+                        decode_errors += 1
+                        break
+                    if pr is None:
+                        break
+                    if args.source:
+                        pr.source = args.source
+                    if topology is not None:
+                        topology.enrich(pr)
+                    node = (pr.source or "", pr.gateway_id, pr.node_id)
+                    key = (pr.gateway_id, pr.node_id, pr.gateway_address, pr.node_address, pr.node_barcode, pr.source, pr.string)
+                    prefix = enc.series_prefix(*key).rstrip(" ")
+                    res["points"] += 1
+                    res["series"][prefix] = res["series"].get(prefix, 0) + 1
+                    res["nodes"][node].add(prefix)
+    finally:
+        await source.close()
+    if decode_errors:
+        log.warning("Schema report: %d line(s) could not be decoded", decode_errors)
+    return results
+
+
+def _print_report(schema: PointSchema, measurement: str, res: dict, limit: int) -> None:
+    series = res["series"]
+    print(f"== schema: {schema.path or 'built-in'}")
+    print(schema.describe())
+    print(f"{measurement}: {len(series)} series from {res['points']} points, {len(res['nodes'])} node(s)")
+    tag_values: dict[str, set[str]] = defaultdict(set)
+    for prefix in series:
+        for kv in _split_unescaped(prefix, ",")[1:]:
+            k, _, v = kv.partition("=")
+            tag_values[k].add(v)
+    if tag_values:
+        print("distinct values per tag: " + ", ".join(f"{k}={len(v)}" for k, v in sorted(tag_values.items())))
+    churn = sorted(((n, p) for n, p in res["nodes"].items() if len(p) > 1), key=lambda x: -len(x[1]))
+    if churn:
+        print(f"nodes split across several series: {len(churn)}")
+        for (src, gw, node), prefixes in churn[:limit]:
+            print(f"  {src + '/' if src else ''}{gw}/{node}: {len(prefixes)} series")
+            for p in sorted(prefixes):
+                print(f"    {p} ({series[p]} points)")
+        if len(churn) > limit:
+            print(f"  ... ({len(churn) - limit} more)")
+    print()
+
+
+def _split_unescaped(s: str, sep: str) -> list[str]:
+    out, cur, esc = [], [], False
+    for ch in s:
+        if esc:
+            cur.append(ch)
+            esc = False
+        elif ch == "\\":
+            cur.append(ch)
+            esc = True
+        elif ch == sep:
+            out.append("".join(cur))
+            cur = []
+        else:
+            cur.append(ch)
+    out.append("".join(cur))
+    return out
+
+
+def main(argv: list[str]) -> int:
+    """`python -m tigo_ingest schema`: dry run of a schema over captured events, nothing is written."""
+    from .influx import InfluxConfig, WireConfig
+    from .timestamps import parse_rfc3339_ns
+
+    ap = argparse.ArgumentParser(
+        prog="tigo_ingest schema",
+        description="Report the series a point schema (TIGO_SCHEMA_FILE) would create for captured events; writes nothing",
+    )
+    ap.add_argument("paths", nargs="+", metavar="PATH", help="capture dirs/segments, JSONL files or '-' (stdin)")
+    ap.add_argument("--schema", help="schema file (default: TIGO_SCHEMA_FILE)")
+    ap.add_argument("--compare", action="store_true", help="also report the built-in schema")
+    ap.add_argument("--since", type=parse_rfc3339_ns, help="only events at/after this RFC3339 time")
+    ap.add_argument("--until", type=parse_rfc3339_ns, help="only events before this RFC3339 time")
+    ap.add_argument("--source", help="source tag to assume (as with TAPTAP_SOURCES)")
+    ap.add_argument("--limit", type=int, default=10, help="nodes with several series to list (default 10)")
+    args = ap.parse_args(argv)
+
+    cfg = SchemaConfig.from_env()
+    try:
+        wire = WireConfig.from_env()
+        schema = apply_wire(load_schema(cfg.path if args.schema is None else args.schema), wire.fields, wire.round)
+    except (OSError, SchemaError) as e:
+        print(f"Invalid schema: {e}")
+        return 2
+    schemas = [schema]
+    if args.compare and not schema.is_default:
+        schemas.append(DEFAULT_SCHEMA)
+    measurement = InfluxConfig.from_env().measurement
+    results = asyncio.run(_report_points(args, schemas, measurement))
+    for s, res in zip(schemas, results):
+        _print_report(s, measurement, res, args.limit)
+    n = len(results[0]["series"])
+    if cfg.series_max > 0 and n > cfg.series_max:
+        print(f"{measurement}: {n} series exceed TIGO_SERIES_MAX={cfg.series_max}")
+        return 1
+    return 0
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ._env import env_bool, env_float, env_int, env_str
+from .influx import InfluxConfig, InfluxWriter, is_permanent_error
+from .mqtt import MqttClient
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+# `influx` is the primary writer (INFLUX_*, batched by the pipeline, spooled);
+# the others are queued sinks fed next to it.
+SINK_NAMES = ("influx", "influx2", "mqtt", "file")
+
+
+def parse_sinks(spec: str) -> list[str]:
+    """`TIGO_SINKS`: comma separated sink names, e.g. `influx,mqtt`."""
+    out: list[str] = []
+    for item in spec.split(","):
+        name = item.strip().lower()
+        if not name:
+            continue
+        if name not in SINK_NAMES:
+            raise ValueError(f"Unknown sink {name!r} in TIGO_SINKS (known: {', '.join(SINK_NAMES)})")
+        if name not in out:
+            out.append(name)
+    return out
+
+
+@dataclass(frozen=True)
+class SinkQueueConfig:
+    queue_max: int
+    batch_max: int
+    flush_s: float
+    retry_min_s: float
+    retry_max_s: float
+
+    @staticmethod
+    def from_env(name: str) -> "SinkQueueConfig":
+        # `TIGO_SINK_<NAME>_QUEUE_MAX` etc. override the shared `TIGO_SINK_QUEUE_MAX` defaults.
+        p = f"TIGO_SINK_{name.upper()}_"
+
+        def _f(key: str, default: float) -> float:
+            return env_float(p + key, env_float("TIGO_SINK_" + key, default))
+
+        return SinkQueueConfig(
+            queue_max=max(1, int(_f("QUEUE_MAX", 10000))),
+            batch_max=max(1, int(_f("BATCH_MAX", 500))),
+            flush_s=_f("FLUSH_S", 1.0),
+            retry_min_s=_f("RETRY_MIN_S", 1.0),
+            retry_max_s=_f("RETRY_MAX_S", 60.0),
+        )
+
+
+class QueuedSink:
+    """Base for secondary outputs: bounded queue, batching and retry per sink.
+
+    `offer()` never blocks: when the queue is full the oldest item is dropped
+    (counted in `dropped`), so a slow or dead sink cannot stall the reader or
+    the primary Influx path. `run()` sends batches of up to `batch_max` items
+    (or whatever arrived within `flush_s`) and retries a failed batch with
+    exponential backoff until it goes through, unless the error is permanent.
+    Subclasses implement `send(batch)` and optionally `aclose()`.
+    """
+
+    # "lines" sinks get encoded line protocol batches, "reports" sinks PowerReports.
+    kind = "lines"
+
+    def __init__(self, name: str, cfg: SinkQueueConfig) -> None:
+        self.name = name
+        self._cfg = cfg
+        self._q: collections.deque = collections.deque(maxlen=cfg.queue_max)
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._q)
+
+    def offer(self, item) -> None:
+        q = self._q
+        n = len(q)
+        if n == q.maxlen:
+            self.dropped += 1
+        q.append(item)
+        # Only wake the sender on the transitions it waits for (first item, full batch).
+        if n == 0 or n + 1 == self._cfg.batch_max:
+            self._wake.set()
+
+    def offer_many(self, items: list) -> None:
+        q = self._q
+        n = len(q)
+        over = n + len(items) - q.maxlen
+        if over > 0:
+            self.dropped += over
+        q.extend(items)
+        if n == 0 or n < self._cfg.batch_max <= len(q):
+            self._wake.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def send(self, batch: list) -> None:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+    async def _wait_batch(self) -> None:
+        cfg = self._cfg
+        deadline = time.monotonic() + cfg.flush_s
+        while len(self._q) < cfg.batch_max and not self._closing:
+            # Idle: sleep until something arrives; otherwise wait at most flush_s for a full batch.
+            timeout = None if not self._q else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                return
+            self._wake.clear()
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._wake.wait()
+            except TimeoutError:
+                return
+            if timeout is None:
+                deadline = time.monotonic() + cfg.flush_s
+
+    async def run(self) -> None:
+        q = self._q
+        batch_max = self._cfg.batch_max
+        while True:
+            await self._wait_batch()
+            if not q:
+                if self._closing:
+                    return
+                continue
+            batch = [q.popleft() for _ in range(min(batch_max, len(q)))]
+            await self._send_with_retry(batch)
+
+    async def _send_with_retry(self, batch: list) -> None:
+        delay = self._cfg.retry_min_s
+        while True:
+            try:
+                await self.send(batch)
+            except Exception as e:
+                if is_permanent_error(e):
+                    self.failed += len(batch)
+                    log.error("Sink %s: rejected %d items permanently, dropping them: %s", self.name, len(batch), e)
+                    return
+                self.retries += 1
+                log.warning("Sink %s: send failed (%s), retrying in %.0fs (%d queued)", self.name, e, delay, len(self._q))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self._cfg.retry_max_s)
+                continue
+            self.sent += len(batch)
+            return
+
+    async def close(self, timeout: float) -> None:
+        """Send what is queued (best effort within `timeout`), then release the connection."""
+        self._closing = True
+        self._wake.set()
+        if self._task is not None:
+            try:
+                async with asyncio.timeout(timeout):
+                    await self._task
+            except TimeoutError:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                log.warning("Sink %s: close timed out, %d items not sent", self.name, len(self._q))
+        await self.aclose()
+
+
+class InfluxSink(QueuedSink):
+    """A second Influx target (e.g. InfluxDB 3 next to 1.x during a migration), `INFLUX2_*`."""
+
+    def __init__(self, name: str, cfg: SinkQueueConfig, influx_cfg: InfluxConfig) -> None:
+        super().__init__(name, cfg)
+        self._writer = InfluxWriter(influx_cfg)
+
+    async def send(self, batch: list[str]) -> None:
+        await asyncio.to_thread(self._writer.write_lines, batch)
+
+    async def aclose(self) -> None:
+        self._writer.close()
+
+
+@dataclass(frozen=True)
+class FileSinkConfig:
+    dir: str
+    max_bytes: int
+    keep: int
+
+    @staticmethod
+    def from_env() -> "FileSinkConfig":
+        return FileSinkConfig(
+            dir=env_str("TIGO_FILE_SINK_DIR", "lp"),
+            max_bytes=int(env_float("TIGO_FILE_SINK_MAX_MB", 64) * 1024 * 1024),
+            keep=max(1, env_int("TIGO_FILE_SINK_KEEP", 10)),
+        )
+
+
+class FileSink(QueuedSink):
+    """Line protocol into local rotating files `<dir>/points-<ns>.lp` (keeps the newest `keep`)."""
+
+    def __init__(self, name: str, cfg: SinkQueueConfig, file_cfg: FileSinkConfig) -> None:
+        super().__init__(name, cfg)
+        self._fcfg = file_cfg
+        self._f = None
+        self._size = 0
+        os.makedirs(file_cfg.dir, exist_ok=True)
+
+    def _rotate(self) -> None:
+        if self._f is not None:
+            self._f.close()
+        self._f = open(os.path.join(self._fcfg.dir, f"points-{time.time_ns()}.lp"), "ab")
+        self._size = 0
+        files = sorted(n for n in os.listdir(self._fcfg.dir) if n.startswith("points-") and n.endswith(".lp"))
+        for n in files[: max(0, len(files) - self._fcfg.keep)]:
+            try:
+                os.unlink(os.path.join(self._fcfg.dir, n))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, batch: list[str]) -> None:
+        if self._f is None or self._size >= self._fcfg.max_bytes:
+            self._rotate()
+        data = ("\n".join(batch) + "\n").encode("utf-8")
+        self._f.write(data)
+        self._f.flush()
+        self._size += len(data)
+
+    async def send(self, batch: list[str]) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+    async def aclose(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+@dataclass(frozen=True)
+class MqttSinkConfig:
+    host: str
+    port: int
+    username: str | None
+    password: str | None
+    client_id: str
+    topic: str
+    retain: bool
+    keepalive_s: int
+
+    @staticmethod
+    def from_env() -> "MqttSinkConfig":
+        return MqttSinkConfig(
+            host=env_str("TIGO_MQTT_HOST", "127.0.0.1"),
+            port=env_int("TIGO_MQTT_PORT", 1883),
+            username=env_str("TIGO_MQTT_USER") or None,
+            password=env_str("TIGO_MQTT_PASS") or None,
+            client_id=env_str("TIGO_MQTT_CLIENT_ID", "tigo-ingest"),
+            topic=env_str("TIGO_MQTT_TOPIC", "tigo/node").rstrip("/"),
+            retain=env_bool("TIGO_MQTT_RETAIN", True),
+            keepalive_s=env_int("TIGO_MQTT_KEEPALIVE_S", 60),
+        )
+
+
+def _node_payload(pr: "PowerReport") -> bytes:
+    power_w = pr.voltage_in * pr.current
+    d = {
+        "ts_ms": pr.timestamp_ns // 1_000_000,
+        "gateway_id": pr.gateway_id,
+        "node_id": pr.node_id,
+        "voltage_in_v": pr.voltage_in,
+        "voltage_out_v": pr.voltage_out,
+        "current_in_a": pr.current,
+        "power_w": round(power_w, 3),
+        "duty_cycle": pr.duty_cycle,
+        "temperature_c": pr.temperature,
+        "rssi": pr.rssi,
+    }
+    if pr.node_barcode:
+        d["barcode"] = pr.node_barcode
+    if pr.source:
+        d["source"] = pr.source
+    if pr.string:
+        d["string"] = pr.string
+    return json.dumps(d, separators=(",", ":")).encode()
+
+
+class MqttSink(QueuedSink):
+    """Live per-node values as JSON to `<topic>[/<source>]/<gateway_id>/<node_id>`.
+
+    Only the newest report per node within a batch is published (live values,
+    not history), over one persistent connection that is re-established on the
+    next batch after an error.
+    """
+
+    kind = "reports"
+
+    def __init__(self, name: str, cfg: SinkQueueConfig, mqtt_cfg: MqttSinkConfig) -> None:
+        super().__init__(name, cfg)
+        self._mcfg = mqtt_cfg
+        self._client = MqttClient(
+            mqtt_cfg.host,
+            mqtt_cfg.port,
+            client_id=mqtt_cfg.client_id,
+            username=mqtt_cfg.username,
+            password=mqtt_cfg.password,
+            keepalive_s=mqtt_cfg.keepalive_s,
+        )
+
+    def _topic(self, pr: "PowerReport") -> str:
+        if pr.source:
+            return f"{self._mcfg.topic}/{pr.source}/{pr.gateway_id}/{pr.node_id}"
+        return f"{self._mcfg.topic}/{pr.gateway_id}/{pr.node_id}"
+
+    async def send(self, batch: list["PowerReport"]) -> None:
+        latest: dict[tuple, "PowerReport"] = {}
+        for pr in batch:
+            latest[(pr.source, pr.gateway_id, pr.node_id)] = pr
+        client = self._client
+        try:
+            if not client.connected:
+                await client.connect()
+            for pr in latest.values():
+                client.publish(self._topic(pr), _node_payload(pr), retain=self._mcfg.retain)
+            await client.flush()
+        except (OSError, TimeoutError):
+            await client.close()
+            raise
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+
+def make_sinks(names: list[str]) -> list[QueuedSink]:
+    """Queued sinks for `names`; the primary `influx` is set up by `_run` itself."""
+    sinks: list[QueuedSink] = []
+    for name in names:
+        if name == "influx2":
+            sinks.append(InfluxSink(name, SinkQueueConfig.from_env(name), InfluxConfig.from_env("INFLUX2", api_default="v2")))
+        elif name == "mqtt":
+            sinks.append(MqttSink(name, SinkQueueConfig.from_env(name), MqttSinkConfig.from_env()))
+        elif name == "file":
+            sinks.append(FileSink(name, SinkQueueConfig.from_env(name), FileSinkConfig.from_env()))
+    return sinks
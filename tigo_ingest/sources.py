@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+import re
+import shlex
+import shutil
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator
+
+from ._env import env_float, env_str
+from .capture import CaptureWriter, capture_segments, iter_line_batches, open_capture
+from .linesplit import LineSplitter, max_line_from_env
+from .timestamps import parse_rfc3339_ns
+
+
+log = logging.getLogger(__name__)
+
+_NS = 1_000_000_000
+# Upper bound per read from the taptap pipe (a pipe rarely holds more than 64 KiB).
+_PIPE_CHUNK = 256 * 1024
+
+
+class TaptapProcessSource:
+    """Raw event lines from a `taptap observe` subprocess (stderr is logged).
+
+    stdout is read in large chunks and split by a `LineSplitter`; `batches()`
+    yields all complete lines of a read at once.
+    """
+
+    name = "taptap"
+
+    def __init__(self, cmd: list[str], label: str = "taptap", max_line: int | None = None) -> None:
+        self._cmd = cmd
+        self._label = label
+        self._proc: asyncio.subprocess.Process | None = None
+        self._stderr_task: asyncio.Task | None = None
+        self.splitter = LineSplitter(max_line or max_line_from_env(), label=label)
+
+    async def _stderr_logger(self) -> None:
+        assert self._proc is not None and self._proc.stderr is not None
+        while True:
+            b = await self._proc.stderr.readline()
+            if not b:
+                return
+            log.warning("%s stderr: %s", self._label, b.decode(errors="replace").rstrip())
+
+    async def precheck(self, timeout_s: float) -> str | None:
+        """Cheap reachability check before spawning taptap; returns an error message or None.
+
+        Checks that the executable exists, that a `--serial` device is present and
+        that a `--tcp` bridge accepts connections (port from `--port`, default 7160).
+        """
+        exe = self._cmd[0] if self._cmd else ""
+        if not exe or shutil.which(exe) is None:
+            return f"executable not found: {exe!r} (check PATH or use an absolute path)"
+        tcp_host = serial_dev = None
+        port = 7160
+        args = self._cmd
+        for i, a in enumerate(args[:-1]):
+            if a == "--tcp":
+                tcp_host = args[i + 1]
+            elif a == "--port" and args[i + 1].isdigit():
+                port = int(args[i + 1])
+            elif a == "--serial":
+                serial_dev = args[i + 1]
+        if serial_dev and not os.path.exists(serial_dev):
+            return f"serial device not found: {serial_dev} (check wiring/USB)"
+        if tcp_host:
+            try:
+                async with asyncio.timeout(timeout_s):
+                    _, writer = await asyncio.open_connection(tcp_host, port)
+            except (OSError, asyncio.TimeoutError) as e:
+                return f"cannot connect to {tcp_host}:{port} ({e or 'timeout'})"
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        return None
+
+    async def batches(self) -> AsyncIterator[list[bytes]]:
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=_PIPE_CHUNK,
+        )
+        assert self._proc.stdout is not None
+        self._stderr_task = asyncio.create_task(self._stderr_logger())
+        read = self._proc.stdout.read
+        splitter = self.splitter
+        splitter.reset()
+        while True:
+            data = await read(_PIPE_CHUNK)
+            if not data:
+                tail = splitter.finish()
+                if tail:
+                    yield tail
+                return
+            lines = splitter.feed(data)
+            if lines:
+                yield lines
+
+    async def close(self) -> int:
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+            try:
+                await self._stderr_task
+            except BaseException:
+                pass
+        proc = self._proc
+        if proc is None:
+            return 0
+        if proc.returncode is None:
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        return proc.returncode or 0
+
+
+# Cheap event time extraction for pacing/filtering; full decoding happens in the pipeline.
+_TS_RE = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+
+
+def _event_ns(raw: bytes) -> int | None:
+    m = _TS_RE.search(raw)
+    if m is None:
+        return None
+    try:
+        return parse_rfc3339_ns(m.group(1).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class ReplaySource:
+    """Raw event lines from captures, JSONL files or stdin instead of taptap.
+
+    `paths` may be capture directories (segments are picked via their index),
+    single capture segments (`.gz`/`.zst`), plain JSONL files or `-` for stdin.
+    `speed` paces lines by their event timestamps: `1` is real time, `10` is ten
+    times faster and `0` is as fast as the pipeline takes them. Lines without a
+    timestamp (other event types) are passed through unpaced. With `since_ns` /
+    `until_ns` only events inside that range are replayed (for backfills).
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        paths: list[str],
+        speed: float = 0.0,
+        since_ns: int | None = None,
+        until_ns: int | None = None,
+        chunk_size: int = 1 << 20,
+        max_line: int | None = None,
+    ) -> None:
+        self._paths = paths
+        self._speed = speed
+        self._since_ns = since_ns
+        self._until_ns = until_ns
+        self._chunk_size = chunk_size
+        self.splitter = LineSplitter(max_line or max_line_from_env(), label="replay")
+
+        self.lines_read = 0
+        self.lines_skipped = 0
+
+    def _files(self) -> list[str]:
+        out: list[str] = []
+        for p in self._paths:
+            if p != "-" and Path(p).is_dir():
+                out.extend(str(s) for s in capture_segments(p, self._since_ns, self._until_ns))
+            else:
+                out.append(p)
+        return out
+
+    async def _chunks(self, path: str) -> AsyncIterator[list[bytes]]:
+        # File reading, decompression and line splitting run in a worker thread, a read chunk at a time.
+        f = sys.stdin.buffer if path == "-" else await asyncio.to_thread(open_capture, path)
+        self.splitter.reset()
+        it = iter_line_batches(f, self.splitter, self._chunk_size)  # type: ignore[arg-type]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, it, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            if path != "-":
+                f.close()
+
+    async def batches(self) -> AsyncIterator[list[bytes]]:
+        since, until = self._since_ns, self._until_ns
+        filtered = since is not None or until is not None
+        paced = self._speed > 0
+        # (first event ns, monotonic start) anchor for pacing.
+        anchor: tuple[int, float] | None = None
+        for path in self._files():
+            log.info("Replay: reading %s", path)
+            async for chunk in self._chunks(path):
+                self.lines_read += len(chunk)
+                if not (filtered or paced):
+                    yield chunk
+                    continue
+                out: list[bytes] = []
+                for raw in chunk:
+                    ts = _event_ns(raw)
+                    if ts is not None:
+                        if (since is not None and ts < since) or (until is not None and ts >= until):
+                            self.lines_skipped += 1
+                            continue
+                        if paced:
+                            if anchor is None:
+                                anchor = (ts, time.monotonic())
+                            delay = anchor[1] + (ts - anchor[0]) / _NS / self._speed - time.monotonic()
+                            if delay > 0:
+                                # Hand over what is due before sleeping until the next event.
+                                if out:
+                                    yield out
+                                    out = []
+                                await asyncio.sleep(delay)
+                    out.append(raw)
+                if out:
+                    yield out
+
+    async def close(self) -> int:
+        sp = self.splitter
+        log.info(
+            "Replay: %d line(s) read, %d outside the time range, %d overlong, %d not UTF-8",
+            self.lines_read,
+            self.lines_skipped,
+            sp.overlong,
+            sp.invalid_utf8,
+        )
+        return 0
+
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+@dataclass(frozen=True)
+class SourceSpec:
+    """One configured input: `name` becomes the `source` tag, `target` is a command or `replay:<path>`."""
+
+    name: str
+    target: str
+
+    @property
+    def is_replay(self) -> bool:
+        return self.target.startswith("replay:")
+
+
+def parse_sources(spec: str) -> list[SourceSpec]:
+    """`TAPTAP_SOURCES`: `name=target` entries separated by `;` or newlines.
+
+    A target is a taptap command line, or `replay:<path>` for a capture
+    directory/segment or JSONL file (replayed once, as fast as possible).
+    """
+    out: list[SourceSpec] = []
+    for item in re.split(r"[;\n]", spec):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, target = item.partition("=")
+        name, target = name.strip(), target.strip()
+        if not sep or not _NAME_RE.match(name) or not target:
+            raise ValueError(f"Invalid TAPTAP_SOURCES entry {item!r} (expected name=<command> or name=replay:<path>)")
+        if any(s.name == name for s in out):
+            raise ValueError(f"Duplicate source name {name!r} in TAPTAP_SOURCES")
+        out.append(SourceSpec(name, target))
+    return out
+
+
+def open_source(spec: SourceSpec):
+    """Source object for a spec: `TaptapProcessSource` or `ReplaySource`."""
+    if spec.is_replay:
+        return ReplaySource([spec.target[len("replay:") :]])
+    return TaptapProcessSource(shlex.split(spec.target), label=f"taptap[{spec.name}]")
+
+
+RESTART_MODES = ("always", "on-failure", "never")
+
+
+@dataclass(frozen=True)
+class RestartPolicy:
+    # always = also after a clean exit (rc 0), on-failure = only after rc != 0 or an error, never = run once.
+    mode: str
+    min_s: float
+    max_s: float
+    factor: float
+    jitter: float
+    reset_after_s: float
+    precheck_timeout_s: float
+
+    @staticmethod
+    def from_env() -> "RestartPolicy":
+        mode = env_str("TIGO_SOURCE_RESTART", "always").lower()
+        if mode in ("0", "false", "no", "off"):
+            mode = "never"
+        if mode not in RESTART_MODES:
+            raise ValueError(f"Invalid TIGO_SOURCE_RESTART {mode!r} (expected one of {', '.join(RESTART_MODES)})")
+        return RestartPolicy(
+            mode=mode,
+            min_s=env_float("TIGO_RESTART_MIN_S", 0.2),
+            max_s=env_float("TIGO_RESTART_MAX_S", 60.0),
+            factor=max(1.0, env_float("TIGO_RESTART_FACTOR", 2.0)),
+            jitter=min(1.0, max(0.0, env_float("TIGO_RESTART_JITTER", 0.2))),
+            reset_after_s=env_float("TIGO_RESTART_RESET_S", 60.0),
+            precheck_timeout_s=env_float("TIGO_PRECHECK_TIMEOUT_S", 2.0),
+        )
+
+
+class Backoff:
+    """Jittered exponential backoff: min_s, min_s*factor, ... capped at max_s, each +-jitter."""
+
+    def __init__(self, policy: RestartPolicy, rnd: random.Random | None = None) -> None:
+        self._p = policy
+        self._rnd = rnd or random.Random()
+        self._base = 0.0
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        p = self._p
+        # Grown step by step: `factor**attempt` overflows after ~1000 attempts of a dead source.
+        self._base = p.min_s if not self.attempt else min(p.max_s, self._base * p.factor)
+        self.attempt += 1
+        return max(0.0, self._base * self._rnd.uniform(1.0 - p.jitter, 1.0 + p.jitter))
+
+    def reset(self) -> None:
+        self._base = 0.0
+        self.attempt = 0
+
+
+@dataclass
+class SourceInput:
+    """A source as run by `_run`: its `source` tag, optional capture and restart policy."""
+
+    source: TaptapProcessSource | ReplaySource
+    tag: str | None = None
+    capture: CaptureWriter | None = None
+    # None = run the source once and finish with it (replays).
+    restart: RestartPolicy | None = None
+
+    @property
+    def label(self) -> str:
+        return self.tag or self.source.name
@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+
+from ._env import env_float, env_int, env_str
+from .influx import is_permanent_error
+from .statefile import atomic_write_json, load_json
+
+
+log = logging.getLogger(__name__)
+
+# Record layout: <payload_len:u32><crc32:u32><n_lines:u32><payload>
+# The payload is a newline-terminated line protocol body (one flushed batch).
+_HDR = struct.Struct("<III")
+_SEG_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor.json"
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+@dataclass(frozen=True)
+class SpoolConfig:
+    dir: str | None
+    fsync: str
+    fsync_interval_s: float
+    segment_bytes: int
+    max_bytes: int
+    max_age_s: float
+    bulk_max_lines: int
+
+    @staticmethod
+    def from_env() -> "SpoolConfig":
+        # Empty TIGO_SPOOL_DIR disables the spool (batches go straight to Influx).
+        d = env_str("TIGO_SPOOL_DIR", "spool") or None
+        fsync = env_str("TIGO_SPOOL_FSYNC", "interval").lower()
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"TIGO_SPOOL_FSYNC must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        return SpoolConfig(
+            dir=d,
+            fsync=fsync,
+            fsync_interval_s=env_float("TIGO_SPOOL_FSYNC_INTERVAL_S", 1.0),
+            segment_bytes=int(env_float("TIGO_SPOOL_SEGMENT_MB", 8) * 1024 * 1024),
+            max_bytes=int(env_float("TIGO_SPOOL_MAX_MB", 512) * 1024 * 1024),
+            max_age_s=env_float("TIGO_SPOOL_MAX_AGE_H", 168) * 3600,
+            bulk_max_lines=env_int("TIGO_SPOOL_BULK_MAX", 5000),
+        )
+
+
+def _seg_name(seq: int) -> str:
+    return f"{seq:020d}{_SEG_SUFFIX}"
+
+
+class Spool:
+    """Segment-based append-only write-ahead spool for line protocol batches.
+
+    Batches are appended to the active segment; a reader position (segment, offset)
+    is committed once the data is acknowledged downstream. Fully consumed segments
+    are removed on commit, and size/age caps drop the oldest segments. The
+    timestamp `precision` of the spooled lines is kept with the cursor; a backlog
+    written with another precision is refused rather than replayed wrongly.
+    """
+
+    def __init__(self, cfg: SpoolConfig, precision: str = "ns") -> None:
+        assert cfg.dir is not None
+        self._cfg = cfg
+        self._dir = cfg.dir
+        self._precision = precision
+        self._lock = threading.Lock()
+        os.makedirs(self._dir, exist_ok=True)
+
+        self._segments: dict[int, int] = {}  # seq -> size in bytes
+        for name in os.listdir(self._dir):
+            if name.endswith(_SEG_SUFFIX):
+                try:
+                    seq = int(name[: -len(_SEG_SUFFIX)])
+                except ValueError:
+                    continue
+                self._segments[seq] = os.path.getsize(os.path.join(self._dir, name))
+
+        cur = load_json(os.path.join(self._dir, _CURSOR_FILE), default=None) or {}
+        self._read_seq = int(cur.get("segment", 0))
+        self._read_off = int(cur.get("offset", 0))
+        old_precision = cur.get("precision", "ns")
+        if old_precision != precision:
+            pending = sum(sz for s, sz in self._segments.items() if s >= self._read_seq) - self._read_off
+            if pending > 0:
+                raise ValueError(
+                    f"Spool {self._dir} holds {pending} bytes written with precision {old_precision}; "
+                    f"drain it with TIGO_WIRE_PRECISION={old_precision} first (or remove it)"
+                )
+
+        # Always start a fresh segment; segments from a previous run are sealed and
+        # a torn record at their tail is skipped by the reader.
+        self._active_seq = max(self._segments, default=0) + 1
+        self._active = open(os.path.join(self._dir, _seg_name(self._active_seq)), "ab")
+        self._segments[self._active_seq] = 0
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+
+        if self._read_seq not in self._segments:
+            self._read_seq = min(self._segments)
+            self._read_off = 0
+
+        self.dropped_lines = 0
+        self.corrupt_records = 0
+        self._compact_locked()
+        if old_precision != precision:
+            self._write_cursor_locked()
+
+    @property
+    def dir(self) -> str:
+        return self._dir
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self._dir, _seg_name(seq))
+
+    def append(self, lines: list[str]) -> None:
+        if not lines:
+            return
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        rec = _HDR.pack(len(payload), zlib.crc32(payload), len(lines)) + payload
+        with self._lock:
+            if self._segments[self._active_seq] >= self._cfg.segment_bytes:
+                self._roll_locked()
+            self._active.write(rec)
+            self._segments[self._active_seq] += len(rec)
+            self._dirty = True
+            self._maybe_fsync_locked()
+            self._enforce_caps_locked()
+
+    def _maybe_fsync_locked(self, force: bool = False) -> None:
+        if not self._dirty:
+            return
+        policy = self._cfg.fsync
+        now = time.monotonic()
+        if policy == "never" and not force:
+            self._active.flush()
+            self._dirty = False
+            return
+        if force or policy == "always" or (now - self._last_fsync) >= self._cfg.fsync_interval_s:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._last_fsync = now
+            self._dirty = False
+
+    def sync(self) -> None:
+        with self._lock:
+            self._maybe_fsync_locked(force=True)
+
+    def _roll_locked(self) -> None:
+        self._maybe_fsync_locked(force=True)
+        self._active.close()
+        self._active_seq += 1
+        self._active = open(self._path(self._active_seq), "ab")
+        self._segments[self._active_seq] = 0
+
+    def _drop_segment_locked(self, seq: int, reason: str) -> None:
+        # Only called for sealed segments.
+        lost = 0
+        if seq >= self._read_seq:
+            start = self._read_off if seq == self._read_seq else 0
+            lost = sum(n for _, n in self._iter_records(seq, start, sealed=True))
+        try:
+            os.unlink(self._path(seq))
+        except FileNotFoundError:
+            pass
+        del self._segments[seq]
+        if lost:
+            self.dropped_lines += lost
+            log.warning("Spool: dropped segment %s (%s), %d undelivered lines lost", _seg_name(seq), reason, lost)
+        if seq >= self._read_seq:
+            self._read_seq = min(self._segments)
+            self._read_off = 0
+
+    def _enforce_caps_locked(self) -> None:
+        total = sum(self._segments.values())
+        now = time.time()
+        for seq in sorted(self._segments):
+            if seq == self._active_seq:
+                break
+            if total > self._cfg.max_bytes:
+                total -= self._segments[seq]
+                self._drop_segment_locked(seq, "size cap")
+                continue
+            try:
+                age = now - os.path.getmtime(self._path(seq))
+            except FileNotFoundError:
+                age = 0.0
+            if age > self._cfg.max_age_s:
+                total -= self._segments[seq]
+                self._drop_segment_locked(seq, "age cap")
+                continue
+            break
+
+    def _compact_locked(self) -> None:
+        # Remove segments that are fully consumed (everything before the read position).
+        for seq in sorted(self._segments):
+            if seq >= self._read_seq:
+                break
+            try:
+                os.unlink(self._path(seq))
+            except FileNotFoundError:
+                pass
+            del self._segments[seq]
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact_locked()
+
+    def _iter_records(self, seq: int, offset: int, sealed: bool):
+        # Yields (payload, n_lines) pairs; stops at a torn/corrupt tail.
+        try:
+            f = open(self._path(seq), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            while True:
+                hdr = f.read(_HDR.size)
+                if len(hdr) < _HDR.size:
+                    if hdr and sealed:
+                        self.corrupt_records += 1
+                    return
+                length, crc, n = _HDR.unpack(hdr)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    if sealed:
+                        self.corrupt_records += 1
+                        log.warning("Spool: corrupt record in %s at offset %d, skipping rest of segment", _seg_name(seq), f.tell())
+                    return
+                yield payload, n
+
+    def read(self, max_lines: int) -> tuple[list[tuple[bytes, int]], int, tuple[int, int]]:
+        """Read whole records from the current read position.
+
+        Returns ([(payload, n_lines), ...], total_lines, next_position). Nothing is
+        consumed until `commit(next_position)` is called.
+        """
+        out: list[tuple[bytes, int]] = []
+        n_total = 0
+        with self._lock:
+            if self._dirty:
+                self._active.flush()
+            seq, off = self._read_seq, self._read_off
+            active = self._active_seq
+            seqs = sorted(s for s in self._segments if s >= seq)
+        pos = (seq, off)
+        for i, s in enumerate(seqs):
+            sealed = s != active
+            cur = off if s == seq else 0
+            for payload, n in self._iter_records(s, cur, sealed=sealed):
+                if out and n_total + n > max_lines:
+                    return out, n_total, (s, cur)
+                out.append((payload, n))
+                n_total += n
+                cur += _HDR.size + len(payload)
+            if not sealed or i + 1 == len(seqs):
+                pos = (s, cur)
+                break
+            # Sealed segment fully read (or its corrupt tail skipped): continue with the next one.
+            pos = (seqs[i + 1], 0)
+        return out, n_total, pos
+
+    def commit(self, position: tuple[int, int]) -> None:
+        seq, off = position
+        with self._lock:
+            if (seq, off) <= (self._read_seq, self._read_off):
+                return
+            if seq not in self._segments:
+                seq, off = min(self._segments), 0
+            self._read_seq, self._read_off = seq, off
+            self._write_cursor_locked()
+            self._compact_locked()
+
+    def _write_cursor_locked(self) -> None:
+        atomic_write_json(
+            os.path.join(self._dir, _CURSOR_FILE),
+            {"segment": self._read_seq, "offset": self._read_off, "precision": self._precision},
+        )
+
+    def backlog(self) -> tuple[int, int]:
+        """Approximate undelivered bytes and segment count."""
+        with self._lock:
+            total = sum(sz for s, sz in self._segments.items() if s >= self._read_seq)
+            return max(0, total - self._read_off), sum(1 for s in self._segments if s >= self._read_seq)
+
+    def close(self) -> None:
+        with self._lock:
+            self._maybe_fsync_locked(force=True)
+            self._active.close()
+
+
+class SpoolDrainer:
+    """Replays the spool to Influx in bulk requests, retrying with backoff.
+
+    Up to `concurrency` bulk requests are in flight per round; the read position
+    only advances once all of them succeeded. A failed round is retried as a
+    whole, which is safe because Influx overwrites identical points. With a
+    `controller` (pipeline.FlushController) the bulk size follows its target
+    and every request's latency and outcome is fed back to it; these are the
+    only writes that reach Influx while the spool is in use.
+    """
+
+    def __init__(self, spool: Spool, writer, bulk_max_lines: int, concurrency: int = 1, controller=None) -> None:
+        self._spool = spool
+        self._writer = writer
+        self._bulk_max = max(1, bulk_max_lines)
+        self._concurrency = max(1, concurrency)
+        self.controller = controller
+        self._wake = asyncio.Event()
+        self.written_lines = 0
+        self.failed_attempts = 0
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def drain_once(self) -> int:
+        bulk = self.controller.target if self.controller is not None else self._bulk_max
+        records, n, pos = await asyncio.to_thread(self._spool.read, bulk * self._concurrency)
+        if not records:
+            # Nothing to write, but the position may still have moved past a corrupt or empty segment.
+            await asyncio.to_thread(self._spool.commit, pos)
+            return 0
+
+        chunks: list[tuple[list[bytes], int]] = [([], 0)]
+        for payload, k in records:
+            if chunks[-1][1] and chunks[-1][1] + k > bulk:
+                chunks.append(([], 0))
+            parts, m = chunks[-1]
+            parts.append(payload)
+            chunks[-1] = (parts, m + k)
+
+        results = await asyncio.gather(
+            *(self._write(b"".join(parts), k, k >= bulk, n) for parts, k in chunks),
+            return_exceptions=True,
+        )
+        for (_, k), res in zip(chunks, results):
+            if not isinstance(res, Exception):
+                continue
+            if not is_permanent_error(res):
+                raise res
+            log.error("Spool: Influx rejected %d lines permanently, dropping them: %s", k, res)
+            self._spool.dropped_lines += k
+        await asyncio.to_thread(self._spool.commit, pos)
+        self.written_lines += n
+        return n
+
+    async def _write(self, body: bytes, k: int, full: bool, backlog: int) -> None:
+        t0 = time.monotonic()
+        ctl = self.controller
+        try:
+            await asyncio.to_thread(self._writer.write_body, body, k)
+        except Exception:
+            # Not on cancellation (shutdown): that says nothing about Influx.
+            if ctl is not None:
+                ctl.observe(k, time.monotonic() - t0, False, full, backlog)
+            raise
+        if ctl is not None:
+            ctl.observe(k, time.monotonic() - t0, True, full, backlog)
+
+    async def run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                n = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed_attempts += 1
+                backlog_bytes, _ = self._spool.backlog()
+                log.warning("Spool: Influx write failed (%s), retrying in %.0fs (backlog %d bytes)", e, backoff, backlog_bytes)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            backoff = 1.0
+            if n:
+                continue
+            self._wake.clear()
+            # asyncio.timeout() rather than wait_for(): on 3.11 wait_for() can swallow a
+            # cancel that races with notify(), leaving the drainer running forever.
+            try:
+                async with asyncio.timeout(1.0):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    async def drain(self, timeout: float) -> bool:
+        """Best-effort drain until the spool is empty or timeout expires.
+
+        Transient errors (Influx restarting, 5xx, timeouts) are retried with
+        backoff until the deadline; only a permanent error ends the drain early.
+        """
+        deadline = time.monotonic() + timeout
+        backoff = 0.5
+        while time.monotonic() < deadline:
+            try:
+                n = await self.drain_once()
+            except Exception as e:
+                self.failed_attempts += 1
+                if is_permanent_error(e):
+                    log.warning("Spool: final drain failed (%s), %d bytes stay spooled", e, self._spool.backlog()[0])
+                    return False
+                delay = min(backoff, deadline - time.monotonic())
+                if delay <= 0:
+                    break
+                log.warning("Spool: final drain write failed (%s), retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, 10.0)
+                continue
+            backoff = 0.5
+            if not n:
+                return True
+        log.warning("Spool: final drain timed out, %d bytes stay spooled", self._spool.backlog()[0])
+        return False
+
@@ -7,15 +7,10 @@ import logging
 from dataclasses import dataclass
 from datetime import datetime
 
-
-log = logging.getLogger(__name__)
+from .timestamps import ns_to_dt, parse_rfc3339_ns
 
 
-def _parse_dt(s: str) -> datetime:
-    # taptap uses RFC3339; Python's fromisoformat handles offsets and also "Z" with minor fix.
-    if s.endswith("Z"):
-        s = s[:-1] + "+00:00"
-    return datetime.fromisoformat(s)
+log = logging.getLogger(__name__)
 
 
 def _normalize_address(v) -> str | None:
@@ -33,9 +28,9 @@ def _normalize_address(v) -> str | None:
     return str(v)
 
 
-@dataclass(frozen=True)
+@dataclass(slots=True)
 class PowerReport:
-    timestamp: datetime
+    timestamp_ns: int
     gateway_id: int
     gateway_address: str | None
     node_id: int
@@ -47,6 +42,14 @@ class PowerReport:
     duty_cycle: float
     temperature: float
     rssi: int
+    # Name of the taptap source the report came from (only set with several sources).
+    source: str | None = None
+    # PV string name from the topology file (see topology.py), if maintained.
+    string: str | None = None
+
+    @property
+    def timestamp(self) -> datetime:
+        return ns_to_dt(self.timestamp_ns)
 
 
 def parse_taptap_event(line: str) -> tuple[str, dict]:
@@ -71,7 +74,7 @@ def parse_taptap_event(line: str) -> tuple[str, dict]:
 def parse_power_report(payload: dict) -> PowerReport:
     # Matches taptap's Event::PowerReport schema:
     # { timestamp, gateway: {id,address}, node: {id,address,barcode?}, ... }
-    ts = _parse_dt(payload["timestamp"])
+    ts = parse_rfc3339_ns(payload["timestamp"])
     gw = payload["gateway"]
     node = payload["node"]
 
@@ -82,7 +85,7 @@ def parse_power_report(payload: dict) -> PowerReport:
         raise KeyError("missing duty_cycle/dc_dc_duty_cycle")
 
     return PowerReport(
-        timestamp=ts,
+        timestamp_ns=ts,
         gateway_id=int(gw["id"]),
         gateway_address=_normalize_address(gw.get("address")),
         node_id=int(node["id"]),
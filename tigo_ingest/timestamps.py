@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import calendar
+from datetime import datetime, timezone
+
+
+_NS = 1_000_000_000
+# Multiplier that scales a k-digit fraction to nanoseconds.
+_FRAC_SCALE = tuple(10 ** (9 - k) for k in range(10))
+
+# "YYYY-MM-DDTHH" -> epoch seconds of that hour (before applying the UTC offset).
+_hour_cache: dict[str, int] = {}
+_HOUR_CACHE_MAX = 64
+
+# "YYYY-MM-DDTHH:MM:SS" + offset -> epoch ns of that second. Reports arrive in
+# bursts within the same second, so the hot path is one dict lookup plus the fraction.
+_second_cache: dict[str, int] = {}
+_SECOND_CACHE_MAX = 4096
+
+# "+02:00" / "Z" -> offset in seconds; "" = no offset, taken as UTC.
+_offset_cache: dict[str, int] = {"Z": 0, "z": 0, "": 0}
+
+
+def _hour_base(prefix: str) -> int:
+    base = _hour_cache.get(prefix)
+    if base is not None:
+        return base
+    if len(prefix) != 13 or prefix[4] != "-" or prefix[7] != "-" or prefix[10] not in "Tt ":
+        raise ValueError(f"Invalid RFC3339 timestamp prefix: {prefix!r}")
+    # datetime() validates the calendar date; only done on a cache miss.
+    dt = datetime(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]), int(prefix[11:13]))
+    base = calendar.timegm(dt.timetuple())
+    if len(_hour_cache) >= _HOUR_CACHE_MAX:
+        _hour_cache.clear()
+    _hour_cache[prefix] = base
+    return base
+
+
+def _offset(s: str) -> int:
+    off = _offset_cache.get(s)
+    if off is not None:
+        return off
+    if len(s) == 6 and s[0] in "+-" and s[3] == ":":
+        hh, mm = s[1:3], s[4:6]
+    elif len(s) == 5 and s[0] in "+-":
+        hh, mm = s[1:3], s[3:5]
+    else:
+        raise ValueError(f"Invalid RFC3339 UTC offset: {s!r}")
+    if not (hh.isdigit() and mm.isdigit()) or int(hh) > 23 or int(mm) > 59:
+        raise ValueError(f"Invalid RFC3339 UTC offset: {s!r}")
+    off = (int(hh) * 3600 + int(mm) * 60) * (1 if s[0] == "+" else -1)
+    _offset_cache[s] = off
+    return off
+
+
+def _second_base(head: str, tz: str) -> int:
+    ms = head[13:19]
+    if len(head) != 19 or ms[0] != ":" or ms[3] != ":" or not (ms[1:3].isdigit() and ms[4:6].isdigit()):
+        raise ValueError(f"Invalid RFC3339 timestamp: {head + tz!r}")
+    minute = int(ms[1:3])
+    second = int(ms[4:6])
+    if minute > 59 or second > 59:
+        raise ValueError(f"Invalid RFC3339 timestamp: {head + tz!r}")
+    base = (_hour_base(head[:13]) + minute * 60 + second - _offset(tz)) * _NS
+    if len(_second_cache) >= _SECOND_CACHE_MAX:
+        _second_cache.clear()
+    _second_cache[head + tz] = base
+    return base
+
+
+def parse_rfc3339_ns(s: str) -> int:
+    """Parse an RFC3339 timestamp (as emitted by taptap) into integer epoch nanoseconds.
+
+    Accepts `Z` or `+HH:MM`/`-HH:MM` (also `+HHMM`) offsets and any number of fractional digits
+    (digits beyond nanoseconds are truncated). A timestamp without an offset
+    is taken as UTC, as the former `datetime.fromisoformat` path did (older
+    taptap builds). No datetime objects and no float math on the hot path, so
+    the result is exact.
+    """
+    # The offset is a trailing "Z", a 6 char "+HH:MM" or missing; whatever sits
+    # between the seconds and the offset is the optional fraction.
+    n = len(s)
+    if s[-1:] in ("Z", "z"):
+        end = n - 1
+    elif n >= 25 and s[n - 6] in "+-":
+        end = n - 6
+    elif n >= 24 and s[n - 5] in "+-":
+        end = n - 5  # "+HHMM"
+    else:
+        end = n
+    base = _second_cache.get(s[:19] + s[end:])
+    if base is None:
+        base = _second_base(s[:19], s[max(end, 19):])
+    if end == 19:
+        return base
+    frac = s[20:end]
+    if s[19:20] != "." or not frac.isdigit():
+        raise ValueError(f"Invalid RFC3339 fraction: {s!r}")
+    if len(frac) > 9:
+        frac = frac[:9]
+    return base + int(frac) * _FRAC_SCALE[len(frac)]
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def dt_to_ns(dt: datetime) -> int:
+    """Exact datetime -> epoch nanoseconds (naive datetimes are taken as UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    d = dt - _EPOCH
+    return (d.days * 86400 + d.seconds) * _NS + d.microseconds * 1000
+
+
+def ns_to_dt(ns: int) -> datetime:
+    """Epoch nanoseconds -> aware UTC datetime (truncated to microseconds)."""
+    return datetime.fromtimestamp(ns // _NS, tz=timezone.utc).replace(microsecond=(ns % _NS) // 1000)
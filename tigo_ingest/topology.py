@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ._env import env_bool, env_float, env_str
+from .decoder import normalize_address
+from .statefile import atomic_write_json, load_json
+
+if TYPE_CHECKING:
+    from .taptap_reader import PowerReport
+
+
+log = logging.getLogger(__name__)
+
+# taptap's topology event (gateway and node addresses/barcodes); older builds name it `infrastructure`.
+TOPOLOGY_EVENTS = ("infrastructure_report", "infrastructure")
+_SNAPSHOT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class TopologyConfig:
+    enabled: bool
+    path: str
+    save_s: float
+
+    @staticmethod
+    def from_env() -> "TopologyConfig":
+        # Empty TIGO_TOPOLOGY_FILE keeps the registry in memory only.
+        return TopologyConfig(
+            enabled=env_bool("TIGO_TOPOLOGY_ENABLED", False),
+            path=env_str("TIGO_TOPOLOGY_FILE", "topology.json"),
+            save_s=env_float("TIGO_TOPOLOGY_SAVE_S", 60.0),
+        )
+
+
+# NodeInfo attributes saved in the topology file.
+_PERSISTED = ("address", "barcode", "string")
+
+
+class NodeInfo:
+    __slots__ = _PERSISTED
+
+    def __init__(self, address: str | None = None, barcode: str | None = None, string: str | None = None) -> None:
+        self.address = address
+        self.barcode = barcode
+        # PV string name; taptap does not know it, it is maintained by hand in the topology file.
+        self.string = string
+
+
+def _id(v) -> int | None:
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class TopologyRegistry:
+    """Gateway/node addresses, barcodes and string names per (source, gateway_id, node_id).
+
+    Fed from taptap's infrastructure events (`observe_event`) and from reports
+    that carry the values themselves; `enrich()` fills what a power report
+    lacks with one dict lookup, so every report of a node gets the same tags.
+    The map is saved to `path` when it changed and loaded at startup, so a
+    restart does not have to wait for the next infrastructure event.
+    """
+
+    def __init__(self, cfg: TopologyConfig, hex_addresses: tuple[bool, bool] = (False, False)) -> None:
+        self._cfg = cfg
+        # (gateway, node) integer addresses as hex, like the decoder (PointSchema.hex_addresses).
+        self._hex = hex_addresses
+        self._gateways: dict[tuple[str, int], str] = {}
+        self._nodes: dict[tuple[str, int, int], NodeInfo] = {}
+        self._dirty = False
+
+        self.events = 0
+        self.enriched = 0
+        self.saves = 0
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def observe_event(self, source: str | None, event_type: str, payload: dict) -> None:
+        """Decoder `on_event` hook: `{"gateways": {gw: {address}}, "nodes": {gw: {node: {address, barcode}}}}`."""
+        if event_type not in TOPOLOGY_EVENTS:
+            return
+        self.events += 1
+        src = source or ""
+        gateways = payload.get("gateways")
+        if isinstance(gateways, dict):
+            for gw, info in gateways.items():
+                gw_id = _id(gw)
+                if gw_id is None or not isinstance(info, dict) or info.get("address") is None:
+                    continue
+                self._set_gateway((src, gw_id), normalize_address(info["address"], self._hex[0]))
+        nodes = payload.get("nodes")
+        if isinstance(nodes, dict):
+            for gw, per_gw in nodes.items():
+                gw_id = _id(gw)
+                if gw_id is None or not isinstance(per_gw, dict):
+                    continue
+                for node, info in per_gw.items():
+                    node_id = _id(node)
+                    if node_id is None or not isinstance(info, dict):
+                        continue
+                    addr = info.get("address")
+                    self._set_node(
+                        (src, gw_id, node_id),
+                        None if addr is None else normalize_address(addr, self._hex[1]),
+                        info.get("barcode") or None,
+                    )
+
+    def _set_gateway(self, key: tuple[str, int], address: str) -> None:
+        if self._gateways.get(key) != address:
+            self._gateways[key] = address
+            self._dirty = True
+
+    def _set_node(self, key: tuple[str, int, int], address: str | None, barcode: str | None) -> NodeInfo:
+        info = self._nodes.get(key)
+        if info is None:
+            info = self._nodes[key] = NodeInfo()
+            self._dirty = True
+        if address is not None and info.address != address:
+            info.address = address
+            self._dirty = True
+        if barcode is not None and info.barcode != barcode:
+            info.barcode = barcode
+            self._dirty = True
+        return info
+
+    def enrich(self, pr: "PowerReport") -> None:
+        src = pr.source or ""
+        info = self._nodes.get((src, pr.gateway_id, pr.node_id))
+        if info is None or (pr.node_address is not None and pr.node_address != info.address) or (
+            pr.node_barcode and pr.node_barcode != info.barcode
+        ):
+            # New node or the report knows better: learn from it.
+            info = self._set_node((src, pr.gateway_id, pr.node_id), pr.node_address, pr.node_barcode or None)
+        gkey = (src, pr.gateway_id)
+        gw_addr = self._gateways.get(gkey)
+        if pr.gateway_address is None:
+            pr.gateway_address = gw_addr
+        elif pr.gateway_address != gw_addr:
+            self._set_gateway(gkey, pr.gateway_address)
+        if pr.node_address is None and info.address is not None:
+            pr.node_address = info.address
+            self.enriched += 1
+        if pr.node_barcode is None and info.barcode is not None:
+            pr.node_barcode = info.barcode
+            self.enriched += 1
+        pr.string = info.string
+
+    def snapshot_obj(self) -> dict:
+        gateways: dict[str, dict] = {}
+        for (src, gw), addr in sorted(self._gateways.items()):
+            gateways.setdefault(src, {})[str(gw)] = {"address": addr}
+        nodes: dict[str, dict] = {}
+        for (src, gw, node), info in sorted(self._nodes.items()):
+            d = {k: getattr(info, k) for k in _PERSISTED if getattr(info, k) is not None}
+            nodes.setdefault(src, {}).setdefault(str(gw), {})[str(node)] = d
+        return {"version": _SNAPSHOT_VERSION, "gateways": gateways, "nodes": nodes}
+
+    def save(self) -> None:
+        atomic_write_json(self._cfg.path, self.snapshot_obj())
+        self._dirty = False
+        self.saves += 1
+
+    def load(self) -> None:
+        try:
+            obj = load_json(self._cfg.path, default=None)
+        except ValueError:
+            log.warning("Topology: ignoring unreadable %s", self._cfg.path)
+            return
+        if not obj or obj.get("version") != _SNAPSHOT_VERSION:
+            return
+        for src, per_src in (obj.get("gateways") or {}).items():
+            for gw, info in per_src.items():
+                if _id(gw) is not None and info.get("address"):
+                    self._gateways[(src, int(gw))] = str(info["address"])
+        for src, per_src in (obj.get("nodes") or {}).items():
+            for gw, per_gw in per_src.items():
+                for node, info in per_gw.items():
+                    if _id(gw) is None or _id(node) is None:
+                        continue
+                    self._nodes[(src, int(gw), int(node))] = NodeInfo(
+                        info.get("address") or None, info.get("barcode") or None, info.get("string") or None
+                    )
+        log.info("Topology: loaded %d gateway(s), %d node(s) from %s", len(self._gateways), len(self._nodes), self._cfg.path)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._cfg.save_s)
+            if not self._dirty:
+                continue
+            obj = self.snapshot_obj()
+            self._dirty = False
+            try:
+                await asyncio.to_thread(atomic_write_json, self._cfg.path, obj)
+                self.saves += 1
+            except OSError as e:
+                self._dirty = True
+                log.warning("Topology: cannot write %s: %s", self._cfg.path, e)